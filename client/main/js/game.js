@@ -347,6 +347,17 @@ function setGameBoardCell(x, y, game_board_type_id) {
 	$cell.text(text);
 }
 
+function setGameBoardCells(game_board_type_id, runs) {
+	var num_runs = runs.length, i, index, end_index;
+
+	for (i = 0; i < num_runs; i += 2) {
+		end_index = runs[i] + runs[i + 1];
+		for (index = runs[i]; index < end_index; index++) {
+			setGameBoardCell(Math.floor(index / 9), index % 9, game_board_type_id);
+		}
+	}
+}
+
 function setGameBoard(x_to_y_to_board_type) {
 	var num_x, x, y_to_board_type, num_y, y, board_type;
 
@@ -460,6 +471,14 @@ function setScoreSheetCell(row, index, data) {
 	$row.children('.' + index_class).text(data);
 }
 
+function setScoreSheetCells(cells) {
+	var num_cells = cells.length, i;
+
+	for (i = 0; i < num_cells; i += 3) {
+		setScoreSheetCell(cells[i], cells[i + 1], cells[i + 2]);
+	}
+}
+
 function setScoreSheet(score_sheet_data) {
 	var num_rows, row, row_data, num_indexes, index;
 
@@ -1391,11 +1410,13 @@ pubsub.subscribe(enums.PubSub.Client_Resize, resize);
 pubsub.subscribe(enums.PubSub.Client_SetGamePlayerData, setGamePlayerData);
 pubsub.subscribe(enums.PubSub.Client_JoinGame, joinGame);
 pubsub.subscribe(enums.PubSub.Server_SetGameBoardCell, setGameBoardCell);
+pubsub.subscribe(enums.PubSub.Server_SetGameBoardCells, setGameBoardCells);
 pubsub.subscribe(enums.PubSub.Server_SetGameBoard, setGameBoard);
 pubsub.subscribe(enums.PubSub.Server_SetTile, setTile);
 pubsub.subscribe(enums.PubSub.Server_SetTileGameBoardType, setTileGameBoardType);
 pubsub.subscribe(enums.PubSub.Server_RemoveTile, removeTile);
 pubsub.subscribe(enums.PubSub.Server_SetScoreSheetCell, setScoreSheetCell);
+pubsub.subscribe(enums.PubSub.Server_SetScoreSheetCells, setScoreSheetCells);
 pubsub.subscribe(enums.PubSub.Server_SetScoreSheet, setScoreSheet);
 pubsub.subscribe(enums.PubSub.Server_SetTurn, setTurn);
 pubsub.subscribe(enums.PubSub.Network_MessageProcessingComplete, updateNetWorths);
@@ -18,7 +18,7 @@ cp -a client/main/static/* dist/web/static
 cp server/server.py dist/server.py
 
 # other .py files
-cp -a server/cron.py server/enums.py server/orm.py server/settings.py server/util.py dist
+cp -a server/compress_logs.py server/cron.py server/enum_values.py server/enums.py server/loop_monitor.py server/memory_usage.py server/orm.py server/sampling_profiler.py server/settings.py server/tracing.py server/util.py dist
 
 # main.css
 ./node_modules/clean-css/bin/cleancss --s0 client/main/css/main.css | sed "s/\.\.\/static\///" > dist/build/main.css
@@ -34,6 +34,9 @@ cp dist/build/stats.css dist/web/static/${STATS_CSS}
 cp client/main/js/* server/server.js dist/build/js
 rm dist/build/js/main.js*
 
+# enums consistency between server and client
+./server/enumsgen.py check || exit 1
+
 # enums replacements in server.py and .js files
 ./server/enumsgen.py replace dist/server.py dist/build/js/*.js
 
@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+
+import argparse
+import collections
+import enum_values
+import json
+import logs_to_games
+import numpy as np
+import server
+import time
+
+
+_nothing = enum_values.GameBoardTypes.Nothing
+_nothing_yet = enum_values.GameBoardTypes.NothingYet
+_cant_play_ever = enum_values.GameBoardTypes.CantPlayEver
+_cant_play_now = enum_values.GameBoardTypes.CantPlayNow
+_will_put_lonely_tile_down = enum_values.GameBoardTypes.WillPutLonelyTileDown
+_will_form_new_chain = enum_values.GameBoardTypes.WillFormNewChain
+_will_merge_chains = enum_values.GameBoardTypes.WillMergeChains
+_cash = enum_values.ScoreSheetIndexes.Cash
+
+# cell 108 is an extra cell that is always Nothing. it is the neighbor used past the edges of the board, and the
+# cell of an empty rack slot (-1).
+_neighbors = np.full((109, 4), 108, dtype=np.intp)
+for _index, (_x, _y) in enumerate(server.GameBoard.index_to_coordinates):
+    for _neighbor_number, (_x2, _y2) in enumerate([(_x - 1, _y), (_x + 1, _y), (_x, _y - 1), (_x, _y + 1)]):
+        if 0 <= _x2 < 12 and 0 <= _y2 < 9:
+            _neighbors[_index, _neighbor_number] = _x2 * 9 + _y2
+
+# board type to chain bit, chain bits to chain count, and single chain bit to chain type
+_board_type_to_chain_bit = np.array([1 << t if t <= enum_values.GameBoardTypes.Imperial else 0 for t in range(enum_values.GameBoardTypes.Max)], dtype=np.int16)
+_chain_bits_to_count = np.array([bin(bits).count('1') for bits in range(128)], dtype=np.int8)
+_chain_bit_to_type = np.zeros(128, dtype=np.int8)
+for _type_id in range(7):
+    _chain_bit_to_type[1 << _type_id] = _type_id
+
+
+def _get_price(type_id, chain_size):
+    if not chain_size:
+        return 0
+    if chain_size < 11:
+        price = min(chain_size, 6)
+    else:
+        price = min((chain_size - 1) // 10 + 6, 10)
+    if type_id >= enum_values.GameBoardTypes.American:
+        price += 1
+    if type_id >= enum_values.GameBoardTypes.Continental:
+        price += 1
+    return price
+
+
+_type_id_and_chain_size_to_price = np.array([[_get_price(type_id, chain_size) for chain_size in range(109)] for type_id in range(7)], dtype=np.int16)
+
+
+def _ceil_divide(a, b):
+    return -(-a // b)
+
+
+class BatchSimulator:
+    # plays num_games singles games of num_players in lockstep, one turn per step, under the policy described at
+    # choose_policy_game_action_data
+    def __init__(self, num_games, num_players, seed=0, tile_bags=None):
+        self.num_games = num_games
+        self.num_players = num_players
+
+        if tile_bags is None:
+            rng = np.random.default_rng(seed)
+            tile_bags = rng.permuted(np.tile(np.arange(108, dtype=np.int16), (num_games, 1)), axis=1)
+        self.tile_bags = tile_bags
+        self.tile_bag_counts = np.full(num_games, 108, dtype=np.int16)
+
+        self.board = np.full((num_games, 109), _nothing, dtype=np.uint8)
+        self.boards = self.board[:, :108].reshape(num_games, 12, 9)
+        self.racks = np.full((num_games, num_players, 6), -1, dtype=np.int16)
+        self.shares = np.zeros((num_games, num_players, 7), dtype=np.int16)
+        self.cash = np.full((num_games, num_players), 60, dtype=np.int32)
+        self.available = np.full((num_games, 7), 25, dtype=np.int16)
+        self.chain_size = np.zeros((num_games, 7), dtype=np.int16)
+        self.price = np.zeros((num_games, 7), dtype=np.int16)
+
+        self.turn_player_id = np.zeros(num_games, dtype=np.int8)
+        self.turns_without_played_tiles_count = np.zeros(num_games, dtype=np.int8)
+        self.turns = np.zeros(num_games, dtype=np.int16)
+        self.game_over = np.zeros(num_games, dtype=bool)
+        self.scores = np.zeros((num_games, num_players), dtype=np.int32)
+
+        # players are ordered by their position tiles, then draw their racks in that order
+        games = np.arange(num_games)
+        position_tiles = np.sort(self._pop_tiles(games, num_players), axis=1)
+        self.board[games[:, None], position_tiles] = _nothing_yet
+        for player_id in range(num_players):
+            self._draw_tiles(games, np.full(num_games, player_id))
+
+    def _pop_tiles(self, games, count):
+        tiles = np.empty((len(games), count), dtype=np.int16)
+        for tile_number in range(count):
+            self.tile_bag_counts[games] -= 1
+            tiles[:, tile_number] = self.tile_bags[games, self.tile_bag_counts[games]]
+        return tiles
+
+    def _draw_tiles(self, games, player_ids):
+        for tile_index in range(6):
+            draw = (self.racks[games, player_ids, tile_index] < 0) & (self.tile_bag_counts[games] > 0)
+            drawing_games = games[draw]
+            self.tile_bag_counts[drawing_games] -= 1
+            self.racks[drawing_games, player_ids[draw], tile_index] = self.tile_bags[drawing_games, self.tile_bag_counts[drawing_games]]
+
+    def _get_tile_game_board_types(self, games, tiles):
+        # same classification as TileRacks.determine_tile_game_board_types, without HaveNeighboringTileToo which
+        # plays like WillPutLonelyTileDown. empty slots are Nothing.
+        neighbor_types = self.board[games[:, None, None], _neighbors[tiles]]
+        chain_bits = np.bitwise_or.reduce(_board_type_to_chain_bit[neighbor_types], axis=2)
+        chain_count = _chain_bits_to_count[chain_bits]
+        has_nothing_yet = (neighbor_types == _nothing_yet).any(axis=2)
+
+        chain_size = self.chain_size[games]
+        can_start_new_chain = (chain_size == 0).any(axis=1)[:, None]
+        safe_bits = ((chain_size >= 11) * (1 << np.arange(7))).sum(axis=1)[:, None]
+        safe_count = _chain_bits_to_count[chain_bits & safe_bits]
+
+        types = np.full(tiles.shape, _will_put_lonely_tile_down, dtype=np.int8)
+        types[(chain_count == 0) & has_nothing_yet] = _cant_play_now
+        types[(chain_count == 0) & has_nothing_yet & can_start_new_chain] = _will_form_new_chain
+        single_chain = chain_count == 1
+        types[single_chain] = _chain_bit_to_type[chain_bits[single_chain]]
+        types[chain_count >= 2] = _will_merge_chains
+        types[safe_count >= 2] = _cant_play_ever
+        types[tiles < 0] = _nothing
+        return types, chain_bits
+
+    def _fill_cells(self, games, tiles, type_ids):
+        # like GameBoard.fill_cells. chains never border NothingYet cells, so the component of each tile is the
+        # chains bordering it plus the NothingYet cells connected to it. only those are flood filled, and games
+        # whose fill stopped growing are dropped from the next round.
+        board = self.board[games, :108]
+        nothing_yet = (board == _nothing_yet).reshape(-1, 12, 9)
+        component = np.zeros(nothing_yet.shape, dtype=bool)
+        rows = np.arange(len(games))
+        component.reshape(-1, 108)[rows, tiles] = True
+
+        growing_rows = rows
+        growing_component = component
+        while len(growing_rows):
+            next_component = growing_component.copy()
+            next_component[:, 1:, :] |= growing_component[:, :-1, :]
+            next_component[:, :-1, :] |= growing_component[:, 1:, :]
+            next_component[:, :, 1:] |= growing_component[:, :, :-1]
+            next_component[:, :, :-1] |= growing_component[:, :, 1:]
+            next_component &= nothing_yet[growing_rows]
+            next_component.reshape(-1, 108)[np.arange(len(growing_rows)), tiles[growing_rows]] = True
+            grew = (next_component != growing_component).any(axis=(1, 2))
+            component[growing_rows] = next_component
+            growing_rows = growing_rows[grew]
+            growing_component = next_component[grew]
+
+        chain_bits = np.bitwise_or.reduce(_board_type_to_chain_bit[self.board[games[:, None], _neighbors[tiles]]], axis=1)
+        component = component.reshape(-1, 108) | ((_board_type_to_chain_bit[board] & chain_bits[:, None]) != 0)
+        chain_sizes = component.sum(axis=1)
+        board[component] = np.repeat(type_ids, chain_sizes)
+        self.board[games, :108] = board
+        self.chain_size[games, type_ids] = chain_sizes
+        self.price[games, type_ids] = _type_id_and_chain_size_to_price[type_ids, chain_sizes]
+
+    def _get_bonuses(self, games, type_ids):
+        # per player bonuses for each game's type_id, like ScoreSheet.get_bonuses
+        share_counts = self.shares[games, :, type_ids]
+        price = self.price[games, type_ids].astype(np.int32)[:, None]
+        bonus_first = price * 10
+        bonus_second = price * 5
+
+        first = (share_counts == share_counts.max(axis=1)[:, None]) & (share_counts > 0)
+        first_count = first.sum(axis=1)[:, None]
+        second_share_counts = np.where(first, 0, share_counts)
+        second = (second_share_counts == second_share_counts.max(axis=1)[:, None]) & (second_share_counts > 0)
+        second_count = second.sum(axis=1)[:, None]
+
+        safe_first_count = np.maximum(first_count, 1)
+        safe_second_count = np.maximum(second_count, 1)
+        only_holder = (first_count == 1) & (second_count == 0)
+        tied_first = first_count > 1
+        return np.where(only_holder, first * (bonus_first + bonus_second), 0) + \
+            np.where(tied_first, first * _ceil_divide(bonus_first + bonus_second, safe_first_count), 0) + \
+            np.where(~only_holder & ~tied_first, first * bonus_first + second * _ceil_divide(bonus_second, safe_second_count), 0)
+
+    def _merge_chains(self, games, player_ids, tiles, chain_bits):
+        chain_size = self.chain_size[games]
+        border_chain_size = np.where((chain_bits[:, None] >> np.arange(7)) & 1, chain_size, -1)
+
+        # lowest type id among the largest chains survives, the rest are disposed of largest first
+        controlling_type_ids = border_chain_size.argmax(axis=1)
+        defunct_order = np.argsort(-border_chain_size * 8 + np.arange(7), axis=1, kind='stable')[:, 1:4]
+        defunct = np.take_along_axis(border_chain_size, defunct_order, axis=1) >= 0
+
+        bonuses = np.zeros((len(games), self.num_players), dtype=np.int32)
+        for defunct_number in range(3):
+            merging = defunct[:, defunct_number]
+            bonuses[merging] += self._get_bonuses(games[merging], defunct_order[merging, defunct_number])
+        self.cash[games] += bonuses
+
+        self._fill_cells(games, tiles, controlling_type_ids)
+
+        for defunct_number in range(3):
+            merging = defunct[:, defunct_number]
+            merging_games = games[merging]
+            defunct_type_ids = defunct_order[merging, defunct_number]
+            controlling = controlling_type_ids[merging]
+            for player_offset in range(self.num_players):
+                disposing_player_ids = (player_ids[merging] + player_offset) % self.num_players
+                count = self.shares[merging_games, disposing_player_ids, defunct_type_ids]
+                trade_amount = np.minimum(count, self.available[merging_games, controlling] * 2) // 2 * 2
+                sell_amount = count - trade_amount
+                self.shares[merging_games, disposing_player_ids, defunct_type_ids] -= count
+                self.available[merging_games, defunct_type_ids] += count
+                self.shares[merging_games, disposing_player_ids, controlling] += trade_amount // 2
+                self.available[merging_games, controlling] -= trade_amount // 2
+                self.cash[merging_games, disposing_player_ids] += self.price[merging_games, defunct_type_ids] * sell_amount
+
+            self.chain_size[merging_games, defunct_type_ids] = 0
+            self.price[merging_games, defunct_type_ids] = 0
+
+    def _play_tiles(self, games, player_ids):
+        racks = self.racks[games, player_ids]
+        types, chain_bits = self._get_tile_game_board_types(games, racks)
+        playable = (racks >= 0) & (types != _cant_play_now) & (types != _cant_play_ever)
+        has_a_playable_tile = playable.any(axis=1)
+        self.turns_without_played_tiles_count[games] = np.where(has_a_playable_tile, 0, self.turns_without_played_tiles_count[games] + 1)
+
+        # the playable tile closest to 1A
+        tile_indexes = np.where(playable, racks, 1000).argmin(axis=1)[has_a_playable_tile]
+        games = games[has_a_playable_tile]
+        player_ids = player_ids[has_a_playable_tile]
+        tiles = racks[has_a_playable_tile, tile_indexes]
+        types = types[has_a_playable_tile, tile_indexes]
+        chain_bits = chain_bits[has_a_playable_tile, tile_indexes]
+        self.racks[games, player_ids, tile_indexes] = -1
+
+        lonely = types == _will_put_lonely_tile_down
+        self.board[games[lonely], tiles[lonely]] = _nothing_yet
+
+        growing = types <= enum_values.GameBoardTypes.Imperial
+        self._fill_cells(games[growing], tiles[growing], types[growing].astype(np.intp))
+
+        # new chains take the lowest available type id, and their founder gets a share if there are any left
+        forming = types == _will_form_new_chain
+        forming_games = games[forming]
+        forming_player_ids = player_ids[forming]
+        new_type_ids = (self.chain_size[forming_games] == 0).argmax(axis=1)
+        self._fill_cells(forming_games, tiles[forming], new_type_ids)
+        founder_share = self.available[forming_games, new_type_ids] > 0
+        self.shares[forming_games[founder_share], forming_player_ids[founder_share], new_type_ids[founder_share]] += 1
+        self.available[forming_games[founder_share], new_type_ids[founder_share]] -= 1
+
+        merging = types == _will_merge_chains
+        self._merge_chains(games[merging], player_ids[merging], tiles[merging], chain_bits[merging])
+
+    def _purchase_shares(self, games, player_ids):
+        # up to three shares, cheapest first
+        for share_number in range(3):
+            cash = self.cash[games, player_ids]
+            purchasable = (self.chain_size[games] > 0) & (self.available[games] > 0) & (self.price[games] <= cash[:, None])
+            purchasing = purchasable.any(axis=1)
+            type_ids = np.where(purchasable, self.price[games] * 8 + np.arange(7), 1000).argmin(axis=1)[purchasing]
+            purchasing_games = games[purchasing]
+            purchasing_player_ids = player_ids[purchasing]
+            self.shares[purchasing_games, purchasing_player_ids, type_ids] += 1
+            self.available[purchasing_games, type_ids] -= 1
+            self.cash[purchasing_games, purchasing_player_ids] -= self.price[purchasing_games, type_ids]
+
+    def _replace_dead_tiles(self, games, player_ids):
+        while len(games):
+            racks = self.racks[games, player_ids]
+            types = self._get_tile_game_board_types(games, racks)[0]
+            dead = types == _cant_play_ever
+            rows, tile_indexes = np.nonzero(dead)
+            self.board[games[rows], racks[rows, tile_indexes]] = _cant_play_ever
+            self.racks[games[rows], player_ids[rows], tile_indexes] = -1
+
+            replacing = dead.any(axis=1)
+            games = games[replacing]
+            player_ids = player_ids[replacing]
+            self._draw_tiles(games, player_ids)
+
+    def _end_games(self, games):
+        self.game_over[games] = True
+        scores = self.cash[games].copy()
+        for type_id in range(7):
+            priced = self.price[games, type_id] > 0
+            priced_games = games[priced]
+            type_ids = np.full(len(priced_games), type_id)
+            scores[priced] += self.shares[priced_games, :, type_id] * self.price[priced_games, type_id][:, None] + self._get_bonuses(priced_games, type_ids)
+        self.scores[games] = scores
+
+    def step(self):
+        games = np.flatnonzero(~self.game_over)
+        if not len(games):
+            return False
+        player_ids = self.turn_player_id[games].astype(np.intp)
+        self.turns[games] += 1
+
+        self._play_tiles(games, player_ids)
+
+        existing_chain_size = np.where(self.chain_size[games] > 0, self.chain_size[games], 1000)
+        has_chains = (existing_chain_size < 1000).any(axis=1)
+        can_end_game = has_chains & ((existing_chain_size.min(axis=1) >= 11) | (np.where(existing_chain_size < 1000, existing_chain_size, 0).max(axis=1) >= 41))
+        self._purchase_shares(games, player_ids)
+
+        all_tiles_played = (self.racks[games] < 0).all(axis=(1, 2))
+        no_tiles_played_for_entire_round = self.turns_without_played_tiles_count[games] == self.num_players
+        ending = can_end_game | all_tiles_played | no_tiles_played_for_entire_round
+        self._end_games(games[ending])
+
+        games = games[~ending]
+        player_ids = player_ids[~ending]
+        self._draw_tiles(games, player_ids)
+        self._replace_dead_tiles(games, player_ids)
+
+        all_tiles_played = (self.racks[games] < 0).all(axis=(1, 2))
+        self._end_games(games[all_tiles_played])
+        self.turn_player_id[games] = (player_ids + 1) % self.num_players
+
+        return True
+
+    def run(self):
+        while self.step():
+            pass
+        return self.scores
+
+
+def choose_policy_game_action_data(game):
+    # the policy BatchSimulator plays: play the playable tile closest to 1A, pick the lowest type id whenever choosing
+    # a chain, trade as much as possible and sell the rest, buy up to three of the cheapest shares, and end the game
+    # as soon as possible
+    action = game.actions[-1]
+    game_action_id = action.game_action_id
+
+    if game_action_id == enum_values.GameActions.StartGame:
+        return []
+    elif game_action_id == enum_values.GameActions.PlayTile:
+        return min(action.get_legal_data(), key=lambda data: game.tile_racks.racks[action.player_id][data[0]][0])
+    elif game_action_id == enum_values.GameActions.SelectNewChain:
+        return [min(action.game_board_type_ids)]
+    elif game_action_id == enum_values.GameActions.SelectMergerSurvivor:
+        return [min(action.type_id_sets[0])]
+    elif game_action_id == enum_values.GameActions.SelectChainToDisposeOfNext:
+        return [min(action.defunct_type_ids)]
+    elif game_action_id == enum_values.GameActions.DisposeOfShares:
+        trade_amount = action._get_max_trade_amount()
+        return [trade_amount, action.defunct_type_count - trade_amount]
+    elif game_action_id == enum_values.GameActions.PurchaseShares:
+        score_sheet = game.score_sheet
+        cash = score_sheet.player_data[action.player_id][_cash]
+        available = list(score_sheet.available)
+        game_board_type_ids = []
+        for share_number in range(3):
+            type_ids = [type_id for type_id in range(7) if score_sheet.chain_size[type_id] and available[type_id] and score_sheet.price[type_id] <= cash]
+            if not type_ids:
+                break
+            type_id = min(type_ids, key=lambda t: (score_sheet.price[t], t))
+            game_board_type_ids.append(type_id)
+            available[type_id] -= 1
+            cash -= score_sheet.price[type_id]
+        return [sorted(game_board_type_ids), 1 if action.can_end_game else 0]
+
+
+def play_game(tile_bag, num_players):
+    game = server.Game(1, 1, enum_values.GameModes.Singles, num_players, None, False, [server.GameBoard.index_to_coordinates[tile] for tile in tile_bag])
+    clients = [logs_to_games.Client(player_number, 'player%d' % player_number) for player_number in range(num_players)]
+    for client in clients:
+        game.join_game(client)
+    player_id_to_client = {client.player_id: client for client in clients}
+
+    while game.actions[-1].game_action_id != enum_values.GameActions.GameOver:
+        action = game.actions[-1]
+        game.do_game_action(player_id_to_client[action.player_id], action.game_action_id, choose_policy_game_action_data(game))
+
+    return game
+
+
+def verify(simulator, game_indexes):
+    # replays the given games in server.Game under the same policy, returning the indexes of games that ended
+    # differently
+    mismatched_game_indexes = []
+    for game_index in game_indexes:
+        game = play_game(simulator.tile_bags[game_index].tolist(), simulator.num_players)
+        scores = [player_datum[enum_values.ScoreSheetIndexes.Net] for player_datum in game.score_sheet.player_data]
+        if scores != simulator.scores[game_index].tolist() or game.game_board.x_to_y_to_board_type != simulator.boards[game_index].tolist():
+            mismatched_game_indexes.append(game_index)
+    return mismatched_game_indexes
+
+
+def get_summary(simulator):
+    scores = simulator.scores
+    is_winner = scores == scores.max(axis=1)[:, None]
+
+    summary = collections.OrderedDict()
+    summary['games'] = simulator.num_games
+    summary['players'] = simulator.num_players
+    summary['mean-turns'] = round(float(simulator.turns.mean()), 3)
+    summary['mean-score-by-player-id'] = [round(float(x), 3) for x in scores.mean(axis=0)]
+    summary['win-rate-by-player-id'] = [round(float(x), 4) for x in (is_winner / is_winner.sum(axis=1)[:, None]).mean(axis=0)]
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate many games at once under a fixed policy.')
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--players', type=int, default=4, choices=range(2, 7))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verify', type=int, default=0, help='replay this many of the games in server.Game and compare outcomes')
+    args = parser.parse_args()
+
+    begin = time.time()
+    simulator = BatchSimulator(args.games, args.players, args.seed)
+    simulator.run()
+    duration = time.time() - begin
+
+    summary = get_summary(simulator)
+    summary['seconds'] = round(duration, 3)
+    summary['games-per-second'] = round(args.games / duration, 1)
+    if args.verify:
+        game_indexes = np.random.default_rng(args.seed).choice(args.games, min(args.verify, args.games), replace=False)
+        summary['verified'] = len(game_indexes)
+        summary['mismatched-game-indexes'] = [int(x) for x in verify(simulator, game_indexes)]
+
+    print(json.dumps(summary, separators=(',', ':')))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+
+import argparse
+import collections
+import enum_values
+import enums
+import gc
+import json
+import logs_to_games
+import os
+import platform
+import random
+import server
+import sys
+import time
+import util
+
+
+class NullWriter:
+    def write(self, s):
+        return len(s)
+
+    def flush(self):
+        pass
+
+
+def _add_pending_messages(messages, client_ids=None):
+    pass
+
+
+def choose_random_game_action_data(game, rng):
+    return rng.choice(game.get_legal_game_action_data())
+
+
+def get_synthetic_games(count, seed=0):
+    rng = random.Random(seed)
+    games = []
+
+    for game_number in range(count):
+        if game_number % 4 == 3:
+            mode, max_players, num_players = enum_values.GameModes.Teams, 4, 4
+        else:
+            mode = enum_values.GameModes.Singles
+            max_players = num_players = rng.randint(2, 6)
+
+        tile_bag = [(x, y) for x in range(12) for y in range(9)]
+        rng.shuffle(tile_bag)
+        recorded_game = {
+            'mode': mode,
+            'max_players': max_players,
+            'tile_bag': list(tile_bag),
+            'join_order': ['player%d' % player_number for player_number in range(num_players)],
+            'actions': [],
+        }
+
+        game = server.Game(1, 1, mode, max_players, None, False, tile_bag)
+        clients = [logs_to_games.Client(player_number, username) for player_number, username in enumerate(recorded_game['join_order'])]
+        for client in clients:
+            game.join_game(client)
+        player_id_to_client = {client.player_id: client for client in clients}
+
+        while game.actions[-1].game_action_id != enum_values.GameActions.GameOver:
+            action = game.actions[-1]
+            data = choose_random_game_action_data(game, rng)
+            recorded_game['actions'].append([action.player_id, action.game_action_id] + data)
+            game.do_game_action(player_id_to_client[action.player_id], action.game_action_id, data)
+
+        recorded_game['player_id_to_username'] = [player_id_to_client[player_id].username for player_id in range(num_players)]
+        games.append(recorded_game)
+
+    return games
+
+
+def get_recorded_games_from_log(log_timestamp, filename):
+    games = []
+
+    with util.open_possibly_gzipped_file(filename) as file:
+        log_processor = logs_to_games.LogProcessor(log_timestamp, file)
+
+        for game in log_processor.go():
+            if len(game.player_id_to_username) < 2 or not game.actions:
+                continue
+
+            games.append({
+                'mode': enums.GameModes[game.mode].value,
+                'max_players': game.max_players,
+                'tile_bag': game._get_initial_tile_bag(),
+                'join_order': list(game.player_join_order),
+                'actions': [[player_id] + list(action) for player_id, action in game.actions],
+                'player_id_to_username': [username for player_id, username in sorted(game.player_id_to_username.items())],
+            })
+
+    return games
+
+
+def load_games(filename):
+    with open(filename, 'r') as f:
+        games = json.load(f)
+
+    for game in games:
+        game['tile_bag'] = [tuple(tile) for tile in game['tile_bag']]
+
+    return games
+
+
+def save_games(filename, games):
+    with open(filename, 'w') as f:
+        json.dump(games, f, separators=(',', ':'))
+
+
+def replay_game(recorded_game, add_pending_messages, logging_enabled, flush_pending_messages=None):
+    game = server.Game(1, 1, recorded_game['mode'], recorded_game['max_players'], add_pending_messages, logging_enabled, list(recorded_game['tile_bag']))
+
+    username_to_client = {username: logs_to_games.Client(player_id, username) for player_id, username in enumerate(recorded_game['player_id_to_username'])}
+    for username in recorded_game['join_order']:
+        game.join_game(username_to_client[username])
+    player_id_to_client = [username_to_client[username] for username in recorded_game['player_id_to_username']]
+
+    for action in recorded_game['actions']:
+        game.do_game_action(player_id_to_client[action[0]], action[1], action[2:])
+        if flush_pending_messages:
+            flush_pending_messages()
+
+    return game
+
+
+def get_player_id_to_client(game):
+    client_index = enum_values.ScoreSheetIndexes.Client
+    return {player_datum[client_index].player_id: player_datum[client_index] for player_datum in game.score_sheet.player_data}
+
+
+def replay_game_start(recorded_game, num_actions, add_pending_messages):
+    # the game after its first num_actions actions, for tests that play the rest themselves
+    game = replay_game(dict(recorded_game, actions=recorded_game['actions'][:num_actions]), add_pending_messages, False)
+    return game, get_player_id_to_client(game)
+
+
+def replay_game_until(recorded_game, fraction):
+    shortened_game = dict(recorded_game)
+    shortened_game['actions'] = recorded_game['actions'][:int(len(recorded_game['actions']) * fraction)]
+    return replay_game(shortened_game, None, False)
+
+
+def time_function(function, number, repeat):
+    best = None
+    for index in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            function(number)
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def benchmark_fill_cells(games):
+    # alternately flooding the largest chain with two different types makes every call relabel the whole chain
+    cases = []
+    for recorded_game in games:
+        game = replay_game_until(recorded_game, 0.75)
+        chain_sizes = game.score_sheet.chain_size
+        type_id = max(range(7), key=lambda t: chain_sizes[t])
+        if chain_sizes[type_id]:
+            other_type_id = (type_id + 1) % 7
+            cases.append([game.game_board, next(iter(game.game_board.board_type_to_coordinates[type_id])), type_id, other_type_id])
+
+    def run(number):
+        for index in range(number):
+            for game_board, coordinates, type_id, other_type_id in cases:
+                game_board.fill_cells(coordinates, other_type_id)
+                game_board.fill_cells(coordinates, type_id)
+
+    return run, len(cases) * 2
+
+
+def benchmark_determine_tile_game_board_types(games):
+    tile_racks = [replay_game_until(recorded_game, fraction).tile_racks for recorded_game in games for fraction in (0.25, 0.5, 0.75)]
+
+    def run(number):
+        for index in range(number):
+            for tile_rack in tile_racks:
+                tile_rack.determine_tile_game_board_types()
+
+    return run, len(tile_racks)
+
+
+def benchmark_get_bonuses(games):
+    cases = []
+    for recorded_game in games:
+        score_sheet = replay_game_until(recorded_game, 0.75).score_sheet
+        for type_id in range(7):
+            if score_sheet.price[type_id] and any(player_datum[type_id] for player_datum in score_sheet.player_data):
+                cases.append([score_sheet, type_id])
+
+    def run(number):
+        for index in range(number):
+            for score_sheet, type_id in cases:
+                score_sheet.get_bonuses(type_id)
+
+    return run, len(cases)
+
+
+def benchmark_update_net_worths(games):
+    score_sheets = [replay_game_until(recorded_game, 0.75).score_sheet for recorded_game in games]
+
+    def run(number):
+        for index in range(number):
+            for score_sheet in score_sheets:
+                score_sheet.update_net_worths()
+
+    return run, len(score_sheets)
+
+
+def _get_busy_server(num_clients, num_games):
+    # one lobby of num_clients clients, num_games of which are split into games of 4
+    s = server.Server()
+    s.transport_write = lambda data: None
+    s.client_ids = set(range(1, num_clients + 1))
+    game_client_id_sets = [set(range(game_number * 4 + 1, game_number * 4 + 5)) for game_number in range(num_games)]
+    return s, game_client_id_sets
+
+
+def _add_turn_messages(s, game_client_id_sets):
+    # roughly what one turn in each game produces
+    for game_client_ids in game_client_id_sets:
+        first_client_id = min(game_client_ids)
+        s.add_pending_messages([[enum_values.CommandsToClient.SetTurn, 0]], game_client_ids)
+        s.add_pending_messages([[enum_values.CommandsToClient.AddGameHistoryMessage, enum_values.GameHistoryMessages.TurnBegan, 0]], game_client_ids)
+        s.add_pending_messages([[enum_values.CommandsToClient.SetGameBoardCell, 5, 4, enum_values.GameBoardTypes.Luxor]], game_client_ids)
+        s.add_pending_messages([[enum_values.CommandsToClient.SetScoreSheetCell, 0, 7, 4200]], game_client_ids)
+        s.add_pending_messages([[enum_values.CommandsToClient.SetTile, 2, 7, 3, enum_values.GameBoardTypes.WillPutLonelyTileDown]], {first_client_id})
+        s.add_pending_messages([[enum_values.CommandsToClient.SetGameAction, enum_values.GameActions.PurchaseShares, 0]], game_client_ids)
+    s.add_pending_messages([[enum_values.CommandsToClient.SetGameState, 1, enum_values.GameStates.InProgress]])
+
+
+def benchmark_add_pending_messages(games):
+    s, game_client_id_sets = _get_busy_server(1000, 5)
+
+    def run(number):
+        for index in range(number):
+            _add_turn_messages(s, game_client_id_sets)
+            del s.client_ids_and_messages[:]
+
+    return run, len(game_client_id_sets) * 6 + 1
+
+
+def benchmark_flush_pending_messages(games):
+    s, game_client_id_sets = _get_busy_server(1000, 5)
+
+    def run(number):
+        old_stdout = sys.stdout
+        sys.stdout = NullWriter()
+        try:
+            for index in range(number):
+                _add_turn_messages(s, game_client_id_sets)
+                s.flush_pending_messages()
+        finally:
+            sys.stdout = old_stdout
+
+    # the adds are included, so subtract the add_pending_messages result when reading this
+    return run, 1
+
+
+def benchmark_replay_engine(games):
+    num_actions = sum(len(recorded_game['actions']) for recorded_game in games)
+
+    def run(number):
+        for index in range(number):
+            for recorded_game in games:
+                replay_game(recorded_game, _add_pending_messages, False)
+
+    return run, num_actions
+
+
+def benchmark_replay_headless(games):
+    num_actions = sum(len(recorded_game['actions']) for recorded_game in games)
+
+    def run(number):
+        for index in range(number):
+            for recorded_game in games:
+                replay_game(recorded_game, None, False)
+
+    return run, num_actions
+
+
+def benchmark_replay_server(games):
+    num_actions = sum(len(recorded_game['actions']) for recorded_game in games)
+
+    def run(number):
+        old_stdout = sys.stdout
+        sys.stdout = NullWriter()
+        try:
+            for index in range(number):
+                for recorded_game in games:
+                    s = server.Server()
+                    s.transport_write = lambda data: None
+                    s.client_ids = set(range(1, len(recorded_game['player_id_to_username']) + 1))
+                    replay_game(recorded_game, s.add_pending_messages, True, s.flush_pending_messages)
+        finally:
+            sys.stdout = old_stdout
+
+    return run, num_actions
+
+
+micro_benchmarks = collections.OrderedDict([
+    ('fill_cells', benchmark_fill_cells),
+    ('determine_tile_game_board_types', benchmark_determine_tile_game_board_types),
+    ('get_bonuses', benchmark_get_bonuses),
+    ('update_net_worths', benchmark_update_net_worths),
+    ('add_pending_messages', benchmark_add_pending_messages),
+    ('flush_pending_messages', benchmark_flush_pending_messages),
+])
+
+macro_benchmarks = collections.OrderedDict([
+    ('replay_engine', benchmark_replay_engine),
+    ('replay_headless', benchmark_replay_headless),
+    ('replay_server', benchmark_replay_server),
+])
+
+
+def run_benchmarks(games, names=None, number=None, repeat=5):
+    results = collections.OrderedDict()
+
+    for kind, benchmarks in [('micro', micro_benchmarks), ('macro', macro_benchmarks)]:
+        for name, benchmark in benchmarks.items():
+            if names and name not in names:
+                continue
+
+            run, ops_per_run = benchmark(games)
+
+            benchmark_number = number
+            if benchmark_number is None:
+                # aim for roughly 0.2 seconds per repeat
+                benchmark_number = 1
+                while True:
+                    elapsed = time_function(run, benchmark_number, 1)
+                    if elapsed >= 0.2 or kind == 'macro':
+                        break
+                    benchmark_number *= 2 if elapsed >= 0.02 else 10
+
+            elapsed = time_function(run, benchmark_number, repeat)
+            ops = ops_per_run * benchmark_number
+
+            result = collections.OrderedDict()
+            result['kind'] = kind
+            result['ops'] = ops
+            result['seconds'] = elapsed
+            result['usec-per-op'] = elapsed / ops * 1000000
+            result['ops-per-sec'] = ops / elapsed
+            results[name] = result
+
+    return results
+
+
+def get_results_document(results, games, source):
+    document = collections.OrderedDict()
+    document['time'] = time.time()
+    document['python'] = platform.python_implementation() + ' ' + platform.python_version()
+    document['machine'] = platform.machine()
+    document['games-source'] = source
+    document['games-count'] = len(games)
+    document['actions-count'] = sum(len(recorded_game['actions']) for recorded_game in games)
+    document['results'] = results
+    return document
+
+
+def compare_results(baseline, current, threshold):
+    comparisons = []
+
+    for name, current_result in current['results'].items():
+        baseline_result = baseline['results'].get(name)
+        if not baseline_result:
+            comparisons.append([name, None, current_result['usec-per-op'], None, False])
+            continue
+
+        ratio = current_result['usec-per-op'] / baseline_result['usec-per-op']
+        comparisons.append([name, baseline_result['usec-per-op'], current_result['usec-per-op'], ratio, ratio > 1 + threshold])
+
+    return comparisons
+
+
+def print_results(results):
+    for name, result in results.items():
+        print('%-32s %-5s %12.3f usec/op %14.1f ops/sec' % (name, result['kind'], result['usec-per-op'], result['ops-per-sec']))
+
+
+def print_comparisons(comparisons):
+    for name, baseline_usec, current_usec, ratio, is_regression in comparisons:
+        if ratio is None:
+            print('%-32s %12s -> %12.3f usec/op  (new)' % (name, '', current_usec))
+        else:
+            print('%-32s %12.3f -> %12.3f usec/op  %+6.1f%%%s' % (name, baseline_usec, current_usec, (ratio - 1) * 100, '  REGRESSION' if is_regression else ''))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the game engine and message batching.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    parser_run = subparsers.add_parser('run', help='run benchmarks, optionally saving the results as a baseline')
+    parser_run.add_argument('--games', type=int, default=50, help='number of synthetic games')
+    parser_run.add_argument('--seed', type=int, default=0)
+    parser_run.add_argument('--games-file', help='replay games saved by the record command instead of synthetic ones')
+    parser_run.add_argument('--log-file', help='replay the games in a server log file instead of synthetic ones')
+    parser_run.add_argument('--benchmark', action='append', help='only run the named benchmark, can be repeated')
+    parser_run.add_argument('--number', type=int, help='iterations per repeat, determined automatically by default')
+    parser_run.add_argument('--repeat', type=int, default=5)
+    parser_run.add_argument('--output', help='write results to this json file')
+    parser_run.add_argument('--baseline', help='compare against this json file')
+    parser_run.add_argument('--threshold', type=float, default=0.1, help='slowdown ratio above which a benchmark counts as a regression')
+
+    parser_record = subparsers.add_parser('record', help='save synthetic games for later replay')
+    parser_record.add_argument('output')
+    parser_record.add_argument('--games', type=int, default=50)
+    parser_record.add_argument('--seed', type=int, default=0)
+    parser_record.add_argument('--log-file', help='save the games in a server log file instead of synthetic ones')
+
+    parser_compare = subparsers.add_parser('compare', help='compare two saved results')
+    parser_compare.add_argument('baseline')
+    parser_compare.add_argument('current')
+    parser_compare.add_argument('--threshold', type=float, default=0.1)
+
+    args = parser.parse_args()
+
+    def get_games():
+        if getattr(args, 'games_file', None):
+            return load_games(args.games_file), args.games_file
+        elif args.log_file:
+            log_timestamp = int(os.path.basename(args.log_file).split('.')[0])
+            return get_recorded_games_from_log(log_timestamp, args.log_file), args.log_file
+        else:
+            return get_synthetic_games(args.games, args.seed), 'synthetic:%d:%d' % (args.games, args.seed)
+
+    if args.command == 'record':
+        games, source = get_games()
+        save_games(args.output, games)
+        print('saved', len(games), 'games from', source, 'to', args.output)
+
+    elif args.command == 'compare':
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        with open(args.current, 'r') as f:
+            current = json.load(f)
+        comparisons = compare_results(baseline, current, args.threshold)
+        print_comparisons(comparisons)
+        if any(x[4] for x in comparisons):
+            sys.exit(1)
+
+    elif args.command == 'run':
+        games, source = get_games()
+        results = run_benchmarks(games, args.benchmark, args.number, args.repeat)
+        document = get_results_document(results, games, source)
+        print_results(results)
+
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(document, f, indent=2)
+
+        if args.baseline:
+            with open(args.baseline, 'r') as f:
+                baseline = json.load(f)
+            print()
+            comparisons = compare_results(baseline, document, args.threshold)
+            print_comparisons(comparisons)
+            if any(x[4] for x in comparisons):
+                sys.exit(1)
+
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+import time
+import util
+
+
+def compress_log_file(filename):
+    # replaces a plain or gzipped log file with a block compressed one named like the gzipped one
+    output_filename = filename if util.re_gzip_filename.match(filename) else filename + '.gz'
+    # dot-prefixed so readers listing the directory don't see it half-written
+    directory, basename = os.path.split(output_filename)
+    temp_filename = os.path.join(directory, '.' + basename + '.tmp')
+
+    with util.open_possibly_gzipped_file(filename) as f, util.BlockCompressedFileWriter(temp_filename) as writer:
+        for line in f:
+            writer.write(line)
+
+    os.replace(temp_filename + util.block_compressed_file_index_suffix, output_filename + util.block_compressed_file_index_suffix)
+    os.replace(temp_filename, output_filename)
+    if output_filename != filename:
+        os.remove(filename)
+
+
+def compress_stream(input_file, output_filename, flush_interval):
+    # for piping the server's output into a log file. cron can read up to the last flush.
+    with util.BlockCompressedFileWriter(output_filename) as writer:
+        last_flush_time = time.time()
+        for line in input_file:
+            writer.write(line)
+            now = time.time()
+            if now - last_flush_time >= flush_interval:
+                writer.flush()
+                last_flush_time = now
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert log files to the seekable block compressed format.')
+    parser.add_argument('filenames', nargs='*')
+    parser.add_argument('--stdin', metavar='OUTPUT', help='write standard input to OUTPUT instead')
+    parser.add_argument('--flush-interval', type=float, default=10)
+    args = parser.parse_args()
+
+    if args.stdin:
+        compress_stream(sys.stdin, args.stdin, args.flush_interval)
+    for filename in args.filenames:
+        compress_log_file(filename)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,7 @@ import glob
 import orm
 import os
 import os.path
+import sampling_profiler
 import sqlalchemy.orm
 import sqlalchemy.sql
 import sqlalchemy.types
@@ -269,6 +270,8 @@ class StatsGen:
 
 
 def main():
+    sampling_profiler.install()
+
     user_id_to_name = None
 
     while True:
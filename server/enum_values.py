@@ -0,0 +1,14 @@
+import enum
+import enums
+
+
+# for every enum in enums, a plain class of int constants with the same names. enum_values.GameBoardTypes.Luxor is
+# enums.GameBoardTypes.Luxor.value without the cost of an Enum member lookup. enumsgen.py replace turns both forms into
+# literals for the distribution.
+def _add_classes():
+    for name, obj in vars(enums).items():
+        if isinstance(obj, type) and issubclass(obj, enum.Enum) and obj is not enums.AutoNumber:
+            globals()[name] = type(name, (), {member_name: member.value for member_name, member in obj.__members__.items()})
+
+
+_add_classes()
@@ -35,6 +35,8 @@ class CommandsToClient(AutoNumber):
     AddGlobalChatMessage = ()
     AddGameChatMessage = ()
     DestroyGame = ()
+    SetGameBoardCells = ()
+    SetScoreSheetCells = ()
 
 
 class CommandsToServer(AutoNumber):
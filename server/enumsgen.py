@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import collections
+import enum_values
 import enums
 import glob
 import inspect
@@ -91,13 +92,44 @@ def replace_enums(pathnames):
     for pathname in pathnames:
         with open(pathname, 'r') as f:
             contents = f.read()
-        contents = re.sub(r'(?<![A-Za-z0-9])enums\.([A-Za-z0-9]+)\.([A-Za-z0-9_]+)(?:\.value)?(?![A-Za-z0-9])', lambda match: str(all_enums[match.group(1)][match.group(2)]), contents)
+        contents = re.sub(r'(?<![A-Za-z0-9])(?:enums|enum_values)\.([A-Za-z0-9]+)\.([A-Za-z0-9_]+)(?:\.value)?(?![A-Za-z0-9])', lambda match: str(all_enums[match.group(1)][match.group(2)]), contents)
         with open(pathname, 'w') as f:
             f.write(contents)
 
 
+def check_enums(js_pathnames):
+    # enum_values must match enums, and every enums.X.Y in the client must exist. PubSub names other than the Server_
+    # ones are defined by their use in the client, so only those are checked.
+    problems = []
+
+    server_enums = get_server_enums()
+    for class_name, lookup in server_enums.items():
+        values = getattr(enum_values, class_name, None)
+        for name, value in lookup.items():
+            if getattr(values, name, None) != value:
+                problems.append('enum_values.{}.{} != {}'.format(class_name, name, value))
+
+    server_enums['PubSub'] = {'Server_' + name: value for name, value in server_enums['CommandsToClient'].items()}
+    for pathname in js_pathnames:
+        with open(pathname, 'r') as f:
+            contents = f.read()
+        for match in re.finditer(r'(?<![A-Za-z0-9])enums\.([A-Za-z0-9]+)\.([A-Za-z0-9_]+)(?![A-Za-z0-9])', contents):
+            class_name, name = match.group(1), match.group(2)
+            if class_name == 'PubSub' and not name.startswith('Server_'):
+                continue
+            if name not in server_enums.get(class_name, {}):
+                problems.append('{}: enums.{}.{} does not exist'.format(pathname, class_name, name))
+
+    return problems
+
+
 if __name__ == '__main__':
     if sys.argv[1] == 'js':
         generate_enums_js(sys.argv[2])
     elif sys.argv[1] == 'replace':
         replace_enums(sys.argv[2:])
+    elif sys.argv[1] == 'check':
+        problems = check_enums(sorted(glob.glob('client/main/js/*.js')) + ['server/server.js'])
+        for problem in problems:
+            print(problem)
+        sys.exit(1 if problems else 0)
@@ -0,0 +1,540 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import collections
+import enum_values
+import enums
+import os
+import os.path
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import ujson
+
+
+class LobbyGame:
+    def __init__(self, game_id):
+        self.game_id = game_id
+        self.state = None
+        self.mode = None
+        self.max_players = None
+        self.num_players = 0
+
+        self.action = None
+        self.score_sheet_players = [[0, 0, 0, 0, 0, 0, 0, 60] for player_id in range(6)]
+        self.chain_size = [0, 0, 0, 0, 0, 0, 0]
+
+    def get_price(self, type_id):
+        chain_size = self.chain_size[type_id]
+        if not chain_size:
+            return 0
+        if chain_size < 11:
+            price = min(chain_size, 6)
+        else:
+            price = min((chain_size - 1) // 10 + 6, 10)
+        if type_id >= enum_values.GameBoardTypes.American:
+            price += 1
+        if type_id >= enum_values.GameBoardTypes.Continental:
+            price += 1
+        return price
+
+    def get_available(self, type_id):
+        return 25 - sum(player[type_id] for player in self.score_sheet_players)
+
+
+class VirtualClient:
+    def __init__(self, load_generator, number, role):
+        self.load_generator = load_generator
+        self.number = number
+        self.role = role
+        self.username = 'load%05d' % number
+        self.socket_id = 'load-socket-%d' % number
+        self.client_id = None
+        self.game_id = None
+        self.player_id = None
+        self.tiles = [None, None, None, None, None, None]
+        self.next_activity_handle = None
+        self.scheduled_action = None
+
+    def send(self, command_name, *arguments):
+        self.load_generator.send_command(self, command_name, list(arguments))
+
+    def schedule_activity(self, delay=None):
+        if self.next_activity_handle:
+            self.next_activity_handle.cancel()
+        if delay is None:
+            delay = self.load_generator.random.expovariate(1 / self.load_generator.activity_interval)
+        self.next_activity_handle = self.load_generator.loop.call_later(delay, self.do_activity)
+
+    def do_activity(self):
+        self.next_activity_handle = None
+        load_generator = self.load_generator
+        if not load_generator.running or self.client_id is None:
+            return
+        rng = load_generator.random
+
+        if self.game_id is None:
+            if self.role == 'chatter':
+                self.send('SendGlobalChatMessage', 'hello from %s %d' % (self.username, rng.randrange(1000)))
+            elif self.role == 'watcher':
+                games = [game for game in load_generator.game_id_to_game.values() if game.state == enum_values.GameStates.InProgress]
+                if games:
+                    self.send('WatchGame', rng.choice(games).game_id)
+            else:
+                games = [game for game in load_generator.game_id_to_game.values() if game.state == enum_values.GameStates.Starting and game.num_players < game.max_players]
+                if games and rng.random() < 0.75:
+                    self.send('JoinGame', rng.choice(games).game_id)
+                elif rng.random() < 0.7:
+                    self.send('CreateGame', enum_values.GameModes.Singles, rng.randint(2, 4))
+                else:
+                    self.send('CreateGame', enum_values.GameModes.Teams, 4)
+        else:
+            game = load_generator.game_id_to_game.get(self.game_id)
+            if self.player_id is None or (game and game.state == enum_values.GameStates.Completed):
+                self.send('LeaveGame')
+            elif game and game.state in (enum_values.GameStates.Starting, enum_values.GameStates.StartingFull) and rng.random() < load_generator.abandon_probability:
+                self.send('LeaveGame')
+            elif rng.random() < 0.2:
+                self.send('SendGameChatMessage', 'gl hf %d' % rng.randrange(1000))
+
+        self.schedule_activity()
+
+    def on_game_action(self, game):
+        game_action_id = game.action[0]
+        if game_action_id == enum_values.GameActions.GameOver:
+            return
+        if self.scheduled_action is game.action:
+            return
+        self.scheduled_action = game.action
+
+        delay = self.load_generator.random.expovariate(1 / self.load_generator.think_time) if self.load_generator.think_time else 0
+        self.load_generator.loop.call_later(delay, self.do_game_action, game, game.action)
+
+    def do_game_action(self, game, action):
+        if not self.load_generator.running or game.action is not action or self.game_id != game.game_id or self.player_id != action[1]:
+            return
+
+        rng = self.load_generator.random
+        game_action_id = action[0]
+        params = action[2:]
+
+        if game_action_id == enum_values.GameActions.StartGame:
+            if game.num_players == game.max_players or game.num_players >= 2 and rng.random() < 0.1:
+                self.send('DoGameAction', game_action_id)
+            else:
+                # wait for more players
+                self.scheduled_action = None
+                self.load_generator.loop.call_later(1, self.on_game_action, game)
+        elif game_action_id == enum_values.GameActions.PlayTile:
+            playable = {enum_values.GameBoardTypes.CantPlayNow, enum_values.GameBoardTypes.CantPlayEver}
+            tile_indexes = [tile_index for tile_index, tile in enumerate(self.tiles) if tile and tile[2] not in playable]
+            if tile_indexes:
+                self.send('DoGameAction', game_action_id, rng.choice(tile_indexes))
+        elif game_action_id in (enum_values.GameActions.SelectNewChain, enum_values.GameActions.SelectMergerSurvivor, enum_values.GameActions.SelectChainToDisposeOfNext):
+            self.send('DoGameAction', game_action_id, rng.choice(params[0]))
+        elif game_action_id == enum_values.GameActions.DisposeOfShares:
+            defunct_type_id, controlling_type_id = params
+            count = game.score_sheet_players[action[1]][defunct_type_id]
+            trade_amount = min(count, game.get_available(controlling_type_id) * 2) // 2 * 2
+            if rng.random() < 0.5:
+                trade_amount = 0
+            self.send('DoGameAction', game_action_id, trade_amount, count - trade_amount)
+        elif game_action_id == enum_values.GameActions.PurchaseShares:
+            cash = game.score_sheet_players[action[1]][enum_values.ScoreSheetIndexes.Cash]
+            available = [game.get_available(type_id) for type_id in range(7)]
+            type_ids = []
+            for index in range(rng.randint(0, 3)):
+                choices = [type_id for type_id in range(7) if game.chain_size[type_id] and available[type_id] and game.get_price(type_id) <= cash]
+                if not choices:
+                    break
+                type_id = rng.choice(choices)
+                type_ids.append(type_id)
+                available[type_id] -= 1
+                cash -= game.get_price(type_id)
+            chain_sizes = [x for x in game.chain_size if x]
+            can_end_game = chain_sizes and (min(chain_sizes) >= 11 or max(chain_sizes) >= 41)
+            self.send('DoGameAction', game_action_id, type_ids, 1 if can_end_game else 0)
+
+
+class LoadGenerator:
+    _roles = ['chatter', 'watcher'] + ['player'] * 8
+    _lobby_message_ids = {
+        enum_values.CommandsToClient.SetGameState,
+        enum_values.CommandsToClient.SetGamePlayerJoin,
+        enum_values.CommandsToClient.SetGamePlayerRejoin,
+        enum_values.CommandsToClient.SetGamePlayerLeave,
+        enum_values.CommandsToClient.SetGameWatcherClientId,
+        enum_values.CommandsToClient.ReturnWatcherToLobby,
+        enum_values.CommandsToClient.DestroyGame,
+    }
+
+    def __init__(self, socket_path, num_clients, duration, connect_rate, activity_interval, think_time, abandon_probability, server_pid, seed):
+        self.socket_path = socket_path
+        self.num_clients = num_clients
+        self.duration = duration
+        self.connect_rate = connect_rate
+        self.activity_interval = activity_interval
+        self.think_time = think_time
+        self.abandon_probability = abandon_probability
+        self.server_pid = server_pid
+        self.random = random.Random(seed)
+
+        self.loop = asyncio.get_event_loop()
+        self.writer = None
+        self.running = False
+
+        self.clients = []
+        self.socket_id_to_client = {}
+        self.client_id_to_client = {}
+        self.observer = None
+        self.game_id_to_game = {}
+        self.game_id_to_members = {}
+
+        self.client_id_to_pending_command = {}
+        self.command_name_to_latencies = collections.defaultdict(list)
+        self.command_name_to_count = collections.defaultdict(int)
+        self.completed_games_count = 0
+        self.received_lines_count = 0
+        self.received_bytes_count = 0
+        self.server_samples = []
+
+        self._command_to_server_name_to_id = {name: member.value for name, member in enums.CommandsToServer.__members__.items()}
+
+    def send_command(self, client, command_name, arguments):
+        if client.client_id is None:
+            return
+        message = [self._command_to_server_name_to_id[command_name]] + arguments
+        self.client_id_to_pending_command.setdefault(client.client_id, (command_name, time.perf_counter()))
+        self.command_name_to_count[command_name] += 1
+        self.writer.write(str(client.client_id).encode() + b' ' + ujson.dumps(message).encode() + b'\n')
+
+    async def run(self):
+        reader, self.writer = await asyncio.open_unix_connection(self.socket_path)
+        self.running = True
+
+        read_task = self.loop.create_task(self._read_loop(reader))
+        sample_task = self.loop.create_task(self._sample_server_loop())
+
+        start_time = time.time()
+        for number in range(self.num_clients):
+            self.add_client(number)
+            if self.connect_rate:
+                await asyncio.sleep(1 / self.connect_rate)
+
+        await asyncio.sleep(max(0, start_time + self.duration - time.time()))
+
+        self.running = False
+        for client in self.clients:
+            if client.client_id is not None:
+                self.writer.write(b'disconnect ' + str(client.client_id).encode() + b'\n')
+        await self.writer.drain()
+        await asyncio.sleep(0.5)
+
+        read_task.cancel()
+        sample_task.cancel()
+        self.writer.close()
+
+    def add_client(self, number):
+        client = VirtualClient(self, number, 'observer' if number == 0 else self.random.choice(LoadGenerator._roles))
+        if number == 0:
+            self.observer = client
+        self.clients.append(client)
+        self.socket_id_to_client[client.socket_id] = client
+        self.writer.write(b'connect ' + ujson.dumps([client.username, '127.0.0.1', client.socket_id, False]).encode() + b'\n')
+
+    async def _read_loop(self, reader):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            self.received_lines_count += 1
+            self.received_bytes_count += len(line)
+            try:
+                self._handle_line(line)
+            except Exception:
+                traceback.print_exc()
+
+    def _handle_line(self, line):
+        key, value = line[:-1].split(b' ', 1)
+
+        if key == b'connect':
+            socket_id, client_id = ujson.decode(value.decode())
+            client = self.socket_id_to_client[socket_id]
+            client.client_id = client_id
+            self.client_id_to_client[client_id] = client
+            if client is not self.observer:
+                client.schedule_activity()
+            return
+
+        if key == b'disconnect':
+            client = self.client_id_to_client.pop(int(value.decode()), None)
+            if client:
+                client.client_id = None
+            return
+
+        receive_time = time.perf_counter()
+        client_ids = [int(x) for x in key.split(b',')]
+        client_ids_set = set(client_ids)
+        messages = ujson.decode(value.decode())
+
+        pending = self.client_id_to_pending_command
+        for client_id in (pending.keys() & client_ids_set if len(pending) < len(client_ids) else client_ids):
+            if client_id in pending:
+                command_name, send_time = pending.pop(client_id)
+                self.command_name_to_latencies[command_name].append(receive_time - send_time)
+
+        # the server splits a broadcast into several lines when some recipients also get private messages, so lines
+        # aren't ordered across clients. the lobby model only follows the observer's lines, and each client only
+        # follows its own lines for anything that decides what it does next.
+        if self.observer.client_id in client_ids_set:
+            for message in messages:
+                if message[0] in LoadGenerator._lobby_message_ids:
+                    self._handle_lobby_message(message)
+
+        for message in messages:
+            if message[0] in LoadGenerator._lobby_message_ids:
+                self._handle_membership_message(message, client_ids_set)
+
+        for client_id in client_ids:
+            client = self.client_id_to_client.get(client_id)
+            if client and client.game_id is not None:
+                for message in messages:
+                    self._handle_game_message(client, message)
+
+    def get_game(self, game_id):
+        game = self.game_id_to_game.get(game_id)
+        if not game:
+            game = LobbyGame(game_id)
+            self.game_id_to_game[game_id] = game
+        return game
+
+    def _handle_lobby_message(self, message):
+        message_id = message[0]
+        if message_id == enum_values.CommandsToClient.SetGameState:
+            game = self.get_game(message[1])
+            game.state = message[2]
+            if len(message) > 3:
+                game.mode = message[3]
+            if len(message) > 4:
+                game.max_players = message[4]
+            if game.state == enum_values.GameStates.Completed:
+                self.completed_games_count += 1
+        elif message_id == enum_values.CommandsToClient.SetGamePlayerJoin:
+            self.get_game(message[1]).num_players += 1
+        elif message_id == enum_values.CommandsToClient.SetGamePlayerLeave:
+            game = self.get_game(message[1])
+            if game.state == enum_values.GameStates.Starting:
+                # the seat stays taken, so treat the game as full
+                game.max_players = game.num_players
+        elif message_id == enum_values.CommandsToClient.DestroyGame:
+            self.game_id_to_game.pop(message[1], None)
+
+    def _handle_membership_message(self, message, client_ids_set):
+        message_id = message[0]
+        if message_id == enum_values.CommandsToClient.SetGamePlayerJoin:
+            game_id, player_id, client_id = message[1:]
+            members = self.game_id_to_members.setdefault(game_id, set())
+            # player ids shift while a game is starting since players are sorted by position tile
+            for member in members:
+                if member.client_id in client_ids_set and member.player_id is not None and member.player_id >= player_id:
+                    member.player_id += 1
+            if client_id in client_ids_set:
+                client = self.client_id_to_client.get(client_id)
+                if client:
+                    client.game_id = game_id
+                    client.player_id = player_id
+                    client.tiles = [None, None, None, None, None, None]
+                    client.scheduled_action = None
+                    members.add(client)
+        elif message_id == enum_values.CommandsToClient.SetGamePlayerRejoin:
+            game_id, player_id, client_id = message[1:]
+            if client_id in client_ids_set:
+                client = self.client_id_to_client.get(client_id)
+                if client:
+                    client.game_id = game_id
+                    client.player_id = player_id
+                    self.game_id_to_members.setdefault(game_id, set()).add(client)
+        elif message_id == enum_values.CommandsToClient.SetGamePlayerLeave:
+            game_id, player_id, client_id = message[1:]
+            if client_id in client_ids_set:
+                client = self.client_id_to_client.get(client_id)
+                if client:
+                    client.game_id = None
+                    client.player_id = None
+                    self.game_id_to_members.get(game_id, set()).discard(client)
+        elif message_id == enum_values.CommandsToClient.SetGameWatcherClientId:
+            game_id, client_id = message[1:]
+            if client_id in client_ids_set:
+                client = self.client_id_to_client.get(client_id)
+                if client:
+                    client.game_id = game_id
+        elif message_id == enum_values.CommandsToClient.ReturnWatcherToLobby:
+            game_id, client_id = message[1:]
+            if client_id in client_ids_set:
+                client = self.client_id_to_client.get(client_id)
+                if client:
+                    client.game_id = None
+        elif message_id == enum_values.CommandsToClient.DestroyGame:
+            self.game_id_to_members.pop(message[1], None)
+
+    def _handle_game_message(self, client, message):
+        message_id = message[0]
+        if message_id == enum_values.CommandsToClient.SetGameAction:
+            game = self.get_game(client.game_id)
+            action = message[1:]
+            # every recipient decodes its own copy. the player to act keeps its copy, so its next turn isn't mistaken
+            # for this one when the two are equal.
+            if game.action != action or client.player_id == action[1]:
+                game.action = action
+            if client.player_id is not None and action[1] == client.player_id:
+                client.on_game_action(game)
+        elif message_id == enum_values.CommandsToClient.SetTile:
+            tile_index, x, y, game_board_type_id = message[1:]
+            client.tiles[tile_index] = [x, y, game_board_type_id]
+        elif message_id == enum_values.CommandsToClient.SetTileGameBoardType:
+            tile = client.tiles[message[1]]
+            if tile:
+                tile[2] = message[2]
+        elif message_id == enum_values.CommandsToClient.RemoveTile:
+            client.tiles[message[1]] = None
+        elif message_id == enum_values.CommandsToClient.SetScoreSheetCell:
+            game = self.get_game(client.game_id)
+            row, index, value = message[1:]
+            self._set_score_sheet_cell(game, row, index, value)
+        elif message_id == enum_values.CommandsToClient.SetScoreSheetCells:
+            game = self.get_game(client.game_id)
+            cells = message[1]
+            for i in range(0, len(cells), 3):
+                self._set_score_sheet_cell(game, cells[i], cells[i + 1], cells[i + 2])
+        elif message_id == enum_values.CommandsToClient.SetScoreSheet:
+            game = self.get_game(client.game_id)
+            player_data, chain_size = message[1]
+            for player_id, player_datum in enumerate(player_data):
+                game.score_sheet_players[player_id][:len(player_datum)] = player_datum
+            game.chain_size[:] = chain_size
+
+    def _set_score_sheet_cell(self, game, row, index, value):
+        if row <= enum_values.ScoreSheetRows.Player5:
+            game.score_sheet_players[row][index] = value
+        elif row == enum_values.ScoreSheetRows.ChainSize:
+            game.chain_size[index] = value
+
+    async def _sample_server_loop(self):
+        if not self.server_pid:
+            return
+        clock_ticks = os.sysconf('SC_CLK_TCK')
+        while True:
+            try:
+                with open('/proc/%d/stat' % self.server_pid, 'r') as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+                cpu_time = (int(fields[11]) + int(fields[12])) / clock_ticks
+                rss = 0
+                with open('/proc/%d/status' % self.server_pid, 'r') as f:
+                    for line in f:
+                        if line.startswith('VmRSS:'):
+                            rss = int(line.split()[1]) * 1024
+                self.server_samples.append((time.time(), cpu_time, rss))
+            except (IOError, IndexError, ValueError):
+                pass
+            await asyncio.sleep(1)
+
+    def get_report(self):
+        report = collections.OrderedDict()
+        report['clients'] = len(self.clients)
+        report['connected-clients'] = len(self.client_id_to_client)
+        report['games-seen'] = len(self.game_id_to_game)
+        report['completed-games'] = self.completed_games_count
+        report['received-lines'] = self.received_lines_count
+        report['received-bytes'] = self.received_bytes_count
+
+        latencies = collections.OrderedDict()
+        for command_name, values in sorted(self.command_name_to_latencies.items()):
+            values = sorted(values)
+            latencies[command_name] = collections.OrderedDict([
+                ('sent', self.command_name_to_count[command_name]),
+                ('answered', len(values)),
+                ('p50-ms', get_percentile(values, 50) * 1000),
+                ('p90-ms', get_percentile(values, 90) * 1000),
+                ('p99-ms', get_percentile(values, 99) * 1000),
+                ('max-ms', values[-1] * 1000),
+            ])
+        report['latencies'] = latencies
+
+        if len(self.server_samples) >= 2:
+            first, last = self.server_samples[0], self.server_samples[-1]
+            report['server-cpu-percent'] = (last[1] - first[1]) / (last[0] - first[0]) * 100
+            report['server-rss-max'] = max(x[2] for x in self.server_samples)
+            report['server-rss-last'] = last[2]
+
+        return report
+
+
+def get_percentile(sorted_values, percentile):
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * percentile / 100))
+    return sorted_values[index]
+
+
+def print_report(report):
+    for key, value in report.items():
+        if key == 'latencies':
+            print('latencies:')
+            for command_name, stats in value.items():
+                print('  %-22s sent=%-7d answered=%-7d p50=%.2fms p90=%.2fms p99=%.2fms max=%.2fms' % (command_name, stats['sent'], stats['answered'], stats['p50-ms'], stats['p90-ms'], stats['p99-ms'], stats['max-ms']))
+        elif isinstance(value, float):
+            print('%s: %.1f' % (key, value))
+        else:
+            print('%s: %s' % (key, value))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive server.py through python.sock with virtual clients, acting as the node.js bridge.')
+    parser.add_argument('--socket', default='python.sock', help='path of the socket created by server.py')
+    parser.add_argument('--spawn-server', action='store_true', help='start server.py in a temporary directory and use its socket')
+    parser.add_argument('--server-pid', type=int, help='pid of an already running server.py, for cpu and memory sampling')
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=60, help='seconds')
+    parser.add_argument('--connect-rate', type=float, default=200, help='connects per second, 0 for all at once')
+    parser.add_argument('--activity-interval', type=float, default=5, help='mean seconds between lobby/chat activities per client')
+    parser.add_argument('--think-time', type=float, default=0.5, help='mean seconds before a player makes a move')
+    parser.add_argument('--abandon-probability', type=float, default=0.01)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='print the report as json')
+    args = parser.parse_args()
+
+    server_process = None
+    temporary_directory = None
+    socket_path = args.socket
+    server_pid = args.server_pid
+
+    if args.spawn_server:
+        temporary_directory = tempfile.TemporaryDirectory()
+        socket_path = os.path.join(temporary_directory.name, 'python.sock')
+        server_process = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')], cwd=temporary_directory.name, stdout=subprocess.DEVNULL)
+        server_pid = server_process.pid
+        while not os.path.exists(socket_path):
+            if server_process.poll() is not None:
+                raise Exception('server.py exited early')
+            time.sleep(0.05)
+
+    try:
+        load_generator = LoadGenerator(socket_path, args.clients, args.duration, args.connect_rate, args.activity_interval, args.think_time, args.abandon_probability, server_pid, args.seed)
+        load_generator.loop.run_until_complete(load_generator.run())
+        report = load_generator.get_report()
+    finally:
+        if server_process:
+            server_process.terminate()
+            server_process.wait()
+            temporary_directory.cleanup()
+
+    if args.json:
+        print(ujson.dumps(report))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
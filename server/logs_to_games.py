@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import collections
+import enum_values
 import enums
 import itertools
 import os
@@ -87,7 +88,7 @@ class CommandsToClientTranslator:
         self._commands_to_client = translations.get('CommandsToClient')
         self._errors = translations.get('Errors')
 
-        self._fatal_error = enums.CommandsToClient.FatalError.value
+        self._fatal_error = enum_values.CommandsToClient.FatalError
 
     def translate(self, commands):
         if self._commands_to_client:
@@ -150,16 +151,22 @@ class LogParser:
 
         self._connection_made_count = 0
 
-        self._enum_set_game_board_cell = enums.CommandsToClient.SetGameBoardCell.value
+        self._enum_set_game_board_cell = {enum_values.CommandsToClient.SetGameBoardCell, enum_values.CommandsToClient.SetGameBoardCells}
         self._enum_set_game_player = {index for index, entry in enumerate(Enums.lookups['CommandsToClient']) if 'SetGamePlayer' in entry}
 
+        # byte offset of the line last yielded by go()
+        self.line_offset = 0
+
     def go(self):
         handled_line_type = None
         line_number = 0
         stop_processing_file = False
+        next_line_offset = 0
 
         for line in self._file:
             line_number += 1
+            self.line_offset = next_line_offset
+            next_line_offset += len(line) if line.isascii() else len(line.encode())
 
             if len(line) and line[-1] == '\n':
                 line = line[:-1]
@@ -193,6 +200,7 @@ class LogParser:
 
         # make sure last line type is always LineTypes.blank_line
         if handled_line_type != LineTypes.blank_line:
+            self.line_offset = next_line_offset
             yield LineTypes.blank_line, line_number + 1, '', ()
 
     def _handle_time(self, match):
@@ -212,7 +220,7 @@ class LogParser:
         enum_set_game_board_cell_indexes = set()
         enum_set_game_player_indexes = set()
         for index, command in enumerate(commands):
-            if command[0] == self._enum_set_game_board_cell:
+            if command[0] in self._enum_set_game_board_cell:
                 enum_set_game_board_cell_indexes.add(index)
             elif command[0] in self._enum_set_game_player:
                 enum_set_game_player_indexes.add(index)
@@ -260,7 +268,7 @@ class LogParser:
 
 
 class LogProcessor:
-    _game_board_type__nothing = enums.GameBoardTypes.Nothing.value
+    _game_board_type__nothing = enum_values.GameBoardTypes.Nothing
 
     def __init__(self, log_timestamp, file, verbose=False, verbose_output_path=''):
         self._log_timestamp = log_timestamp
@@ -292,26 +300,28 @@ class LogProcessor:
             # SetClientId
             # SetClientIdToData
             # SetGameState
-            enums.CommandsToClient.SetGameBoardCell.value: self._handle_command_to_client__set_game_board_cell,
+            enum_values.CommandsToClient.SetGameBoardCell: self._handle_command_to_client__set_game_board_cell,
             # SetGameBoard
-            enums.CommandsToClient.SetScoreSheetCell.value: self._handle_command_to_client__set_score_sheet_cell,
-            enums.CommandsToClient.SetScoreSheet.value: self._handle_command_to_client__set_score_sheet,
-            enums.CommandsToClient.SetGamePlayerJoin.value: self._handle_command_to_client__set_game_player_join,
-            enums.CommandsToClient.SetGamePlayerRejoin.value: self._handle_command_to_client__set_game_player_rejoin,
-            enums.CommandsToClient.SetGamePlayerLeave.value: self._handle_command_to_client__set_game_player_leave,
+            enum_values.CommandsToClient.SetScoreSheetCell: self._handle_command_to_client__set_score_sheet_cell,
+            enum_values.CommandsToClient.SetScoreSheet: self._handle_command_to_client__set_score_sheet,
+            enum_values.CommandsToClient.SetGamePlayerJoin: self._handle_command_to_client__set_game_player_join,
+            enum_values.CommandsToClient.SetGamePlayerRejoin: self._handle_command_to_client__set_game_player_rejoin,
+            enum_values.CommandsToClient.SetGamePlayerLeave: self._handle_command_to_client__set_game_player_leave,
             # SetGamePlayerJoinMissing
-            enums.CommandsToClient.SetGameWatcherClientId.value: self._handle_command_to_client__set_game_watcher_client_id,
-            enums.CommandsToClient.ReturnWatcherToLobby.value: self._handle_command_to_client__return_watcher_to_lobby,
-            enums.CommandsToClient.AddGameHistoryMessage.value: self._handle_command_to_client__add_game_history_message,
-            enums.CommandsToClient.AddGameHistoryMessages.value: self._handle_command_to_client__add_game_history_messages,
+            enum_values.CommandsToClient.SetGameWatcherClientId: self._handle_command_to_client__set_game_watcher_client_id,
+            enum_values.CommandsToClient.ReturnWatcherToLobby: self._handle_command_to_client__return_watcher_to_lobby,
+            enum_values.CommandsToClient.AddGameHistoryMessage: self._handle_command_to_client__add_game_history_message,
+            enum_values.CommandsToClient.AddGameHistoryMessages: self._handle_command_to_client__add_game_history_messages,
             # SetTurn
             # SetGameAction
-            enums.CommandsToClient.SetTile.value: self._handle_command_to_client__set_tile,
+            enum_values.CommandsToClient.SetTile: self._handle_command_to_client__set_tile,
             # SetTileGameBoardType
-            enums.CommandsToClient.RemoveTile.value: self._handle_command_to_client__remove_tile,
+            enum_values.CommandsToClient.RemoveTile: self._handle_command_to_client__remove_tile,
             # AddGlobalChatMessage
             # AddGameChatMessage
             # DestroyGame
+            enum_values.CommandsToClient.SetGameBoardCells: self._handle_command_to_client__set_game_board_cells,
+            enum_values.CommandsToClient.SetScoreSheetCells: self._handle_command_to_client__set_score_sheet_cells,
             # # defunct
             # SetGamePlayerUsername
             Enums.lookups['CommandsToClient'].index('SetGamePlayerClientId'): self._handle_command_to_client__set_game_player_client_id,
@@ -323,7 +333,7 @@ class LogProcessor:
             # RejoinGame
             # WatchGame
             # LeaveGame
-            enums.CommandsToServer.DoGameAction.value: self._handle_command_to_server__do_game_action,
+            enum_values.CommandsToServer.DoGameAction: self._handle_command_to_server__do_game_action,
             # SendGlobalChatMessage
             # SendGameChatMessage
         }
@@ -391,6 +401,18 @@ class LogProcessor:
 
         game = self._game_id_to_game[self._client_id_to_game_id[client_id]]
 
+        self._set_game_board_cell(game, x, y, game_board_type_id)
+
+    def _handle_command_to_client__set_game_board_cells(self, client_ids, command):
+        client_id, game_board_type_id, runs = client_ids[0], command[1], command[2]
+
+        game = self._game_id_to_game[self._client_id_to_game_id[client_id]]
+
+        for run_index in range(0, len(runs), 2):
+            for index in range(runs[run_index], runs[run_index] + runs[run_index + 1]):
+                self._set_game_board_cell(game, index // 9, index % 9, game_board_type_id)
+
+    def _set_game_board_cell(self, game, x, y, game_board_type_id):
         if game.board[x][y] == LogProcessor._game_board_type__nothing:
             tile = (x, y)
 
@@ -415,6 +437,18 @@ class LogProcessor:
         else:
             game.score_sheet_chain_size[index] = value
 
+    def _handle_command_to_client__set_score_sheet_cells(self, client_ids, command):
+        client_id, cells = client_ids[0], command[1]
+
+        game = self._game_id_to_game[self._client_id_to_game_id[client_id]]
+
+        for cell_index in range(0, len(cells), 3):
+            row, index, value = cells[cell_index], cells[cell_index + 1], cells[cell_index + 2]
+            if row < 6:
+                game.score_sheet_players[row][index] = value
+            else:
+                game.score_sheet_chain_size[index] = value
+
     def _handle_command_to_client__set_score_sheet(self, client_ids, command):
         client_id, score_sheet_data = client_ids[0], command[1]
 
@@ -564,6 +598,8 @@ class LogProcessor:
 
             if username not in game.username_to_game_history:
                 game.username_to_game_history[username] = []
+        elif entry['_'] == 'game-state-hash':
+            game.history_messages_count_to_state_hash[entry['history-messages-count']] = entry['state-hash']
         else:
             if 'state' in entry:
                 game.state = entry['state']
@@ -608,11 +644,11 @@ class LogProcessor:
 
 
 class Game:
-    _game_board_type__nothing = enums.GameBoardTypes.Nothing.value
-    _game_history_messages__drew_position_tile = enums.GameHistoryMessages.DrewPositionTile.value
-    _score_sheet_indexes__client = enums.ScoreSheetIndexes.Client.value
-    _turn_began_message_id = enums.GameHistoryMessages.TurnBegan.value
-    _drew_or_replaced_tile_message_ids = {enums.GameHistoryMessages.DrewPositionTile.value, enums.GameHistoryMessages.DrewTile.value, enums.GameHistoryMessages.ReplacedDeadTile.value}
+    _game_board_type__nothing = enum_values.GameBoardTypes.Nothing
+    _game_history_messages__drew_position_tile = enum_values.GameHistoryMessages.DrewPositionTile
+    _score_sheet_indexes__client = enum_values.ScoreSheetIndexes.Client
+    _turn_began_message_id = enum_values.GameHistoryMessages.TurnBegan
+    _drew_or_replaced_tile_message_ids = {enum_values.GameHistoryMessages.DrewPositionTile, enum_values.GameHistoryMessages.DrewTile, enum_values.GameHistoryMessages.ReplacedDeadTile}
 
     tile_bag_tweaks = {
         (1414827614, 43): [[34, (1, 5)]],
@@ -652,12 +688,14 @@ class Game:
         self.additional_tile_rack_tiles_order = []
         self.actions = []
         self.username_to_game_history = {}
+        self.history_messages_count_to_state_hash = {}
         self.expired = False
 
         self.server_game = None
         self._server_game_player_id_to_client = None
         self.is_server_game_synchronized = None
         self.sync_log = None
+        self.state_hash_mismatch_history_messages_counts = None
 
     def translate_add_game_history_message(self, message):
         if message[0] == Game._game_history_messages__drew_position_tile:
@@ -669,7 +707,7 @@ class Game:
     def make_server_game(self):
         tile_bag = self._get_initial_tile_bag()
 
-        self.server_game = server.Game(self.game_id, self.internal_game_id, enums.GameModes[self.mode].value, self.max_players, Game._add_pending_messages, False, tile_bag)
+        self.server_game = server.Game(self.game_id, self.internal_game_id, enums.GameModes[self.mode].value, self.max_players, None, False, tile_bag)
 
         self._server_game_player_id_to_client = [Client(player_id, username) for player_id, username in sorted(self.player_id_to_username.items())]
 
@@ -677,6 +715,7 @@ class Game:
             client = self._server_game_player_id_to_client[self.username_to_player_id[username]]
             self.server_game.join_game(client)
 
+        self.state_hash_mismatch_history_messages_counts = []
         for index, player_id_and_action in enumerate(self.actions):
             player_id, action = player_id_and_action
 
@@ -684,12 +723,23 @@ class Game:
             data = action[1:]
             self.server_game.do_game_action(self._server_game_player_id_to_client[player_id], game_action_id, data)
 
+            # compare with the state hash the server logged at the same point, if any
+            history_messages_count = len(self.server_game.history_messages)
+            state_hash = self.history_messages_count_to_state_hash.get(history_messages_count)
+            if state_hash is not None and state_hash != self.server_game.get_state_hash():
+                self.state_hash_mismatch_history_messages_counts.append(history_messages_count)
+
     def compare_with_server_game(self):
         num_players = len(self.player_id_to_username)
 
         self.is_server_game_synchronized = True
         self.sync_log = []
 
+        # state hashes
+        if self.state_hash_mismatch_history_messages_counts:
+            self.is_server_game_synchronized = False
+            self.sync_log.append('state_hash diff at history messages counts ' + str(self.state_hash_mismatch_history_messages_counts) + '!')
+
         # board
         self._sync_compare('board', self.board, self.server_game.game_board.x_to_y_to_board_type)
 
@@ -883,10 +933,6 @@ class Game:
         with open(filename, 'wb') as f:
             pickle.dump(game_data, f)
 
-    @staticmethod
-    def _add_pending_messages(messages, client_ids=None):
-        pass
-
 
 class Client:
     def __init__(self, player_id, username):
@@ -923,26 +969,28 @@ class IndividualGameLogMaker:
             # SetClientId
             # SetClientIdToData
             # SetGameState
-            enums.CommandsToClient.SetGameBoardCell.value: self._handle_command_to_client__set_game_board_cell,
+            enum_values.CommandsToClient.SetGameBoardCell: self._handle_command_to_client__set_game_board_cell,
             # SetGameBoard
-            enums.CommandsToClient.SetScoreSheetCell.value: self._handle_command_to_client__set_score_sheet_cell,
-            enums.CommandsToClient.SetScoreSheet.value: self._handle_command_to_client__set_score_sheet,
-            enums.CommandsToClient.SetGamePlayerJoin.value: self._handle_command_to_client__set_game_player_join,
-            enums.CommandsToClient.SetGamePlayerRejoin.value: self._handle_command_to_client__set_game_player_rejoin,
-            enums.CommandsToClient.SetGamePlayerLeave.value: self._handle_command_to_client__set_game_player_leave,
+            enum_values.CommandsToClient.SetScoreSheetCell: self._handle_command_to_client__set_score_sheet_cell,
+            enum_values.CommandsToClient.SetScoreSheet: self._handle_command_to_client__set_score_sheet,
+            enum_values.CommandsToClient.SetGamePlayerJoin: self._handle_command_to_client__set_game_player_join,
+            enum_values.CommandsToClient.SetGamePlayerRejoin: self._handle_command_to_client__set_game_player_rejoin,
+            enum_values.CommandsToClient.SetGamePlayerLeave: self._handle_command_to_client__set_game_player_leave,
             # SetGamePlayerJoinMissing
-            enums.CommandsToClient.SetGameWatcherClientId.value: self._handle_command_to_client__set_game_watcher_client_id,
-            enums.CommandsToClient.ReturnWatcherToLobby.value: self._handle_command_to_client__return_watcher_to_lobby,
+            enum_values.CommandsToClient.SetGameWatcherClientId: self._handle_command_to_client__set_game_watcher_client_id,
+            enum_values.CommandsToClient.ReturnWatcherToLobby: self._handle_command_to_client__return_watcher_to_lobby,
             # AddGameHistoryMessage
             # AddGameHistoryMessages
             # SetTurn
             # SetGameAction
-            enums.CommandsToClient.SetTile.value: self._handle_command_to_client__set_tile,
+            enum_values.CommandsToClient.SetTile: self._handle_command_to_client__set_tile,
             # SetTileGameBoardType
             # RemoveTile
             # AddGlobalChatMessage
             # AddGameChatMessage
             # DestroyGame
+            enum_values.CommandsToClient.SetGameBoardCells: self._handle_command_to_client__set_game_board_cells,
+            enum_values.CommandsToClient.SetScoreSheetCells: self._handle_command_to_client__set_score_sheet_cells,
             # # defunct
             # SetGamePlayerUsername
             Enums.lookups['CommandsToClient'].index('SetGamePlayerClientId'): self._handle_command_to_client__set_game_player_client_id,
@@ -954,7 +1002,7 @@ class IndividualGameLogMaker:
             # RejoinGame
             # WatchGame
             # LeaveGame
-            enums.CommandsToServer.DoGameAction.value: self._handle_command_to_server__do_game_action,
+            enum_values.CommandsToServer.DoGameAction: self._handle_command_to_server__do_game_action,
             # SendGlobalChatMessage
             # SendGameChatMessage
         }
@@ -964,6 +1012,7 @@ class IndividualGameLogMaker:
         self._line_number = 1
         self._batch_line_number = 1
         self._batch = []
+        self._batch_offset = 0
 
         self._game_id_to_game_log = {}
         self._batch_add_client_id = None
@@ -978,6 +1027,8 @@ class IndividualGameLogMaker:
 
     def go(self):
         for line_type, line_number, line, parse_line_data in self._log_parser.go():
+            if not self._batch:
+                self._batch_offset = self._log_parser.line_offset
             self._batch.append(line)
 
             handler = self._line_type_to_handler.get(line_type)
@@ -1031,9 +1082,15 @@ class IndividualGameLogMaker:
     def _handle_command_to_client__set_game_board_cell(self, client_ids, command):
         self._batch_game_id = self._client_id_to_game_id[client_ids[0]]
 
+    def _handle_command_to_client__set_game_board_cells(self, client_ids, command):
+        self._batch_game_id = self._client_id_to_game_id[client_ids[0]]
+
     def _handle_command_to_client__set_score_sheet_cell(self, client_ids, command):
         self._batch_game_id = self._client_id_to_game_id[client_ids[0]]
 
+    def _handle_command_to_client__set_score_sheet_cells(self, client_ids, command):
+        self._batch_game_id = self._client_id_to_game_id[client_ids[0]]
+
     def _handle_command_to_client__set_score_sheet(self, client_ids, command):
         self._batch_game_id = self._client_id_to_game_id[client_ids[0]]
 
@@ -1112,9 +1169,10 @@ class IndividualGameLogMaker:
             self._game_id_to_game_log[game_id] = game_log
 
             for client_id, add_batch in self._client_id_to_add_batch.items():
-                batch_line_number, batch = add_batch
+                batch_line_number, batch, batch_range = add_batch
                 batch = [line for line in batch if not self._re_disconnect.match(line)]
                 game_log.line_number_to_batch[batch_line_number] = batch
+                game_log.line_number_to_batch_range[batch_line_number] = batch_range[:2] + [True]
 
         if entry['_'] == 'game-player':
             player_id = entry['player-id']
@@ -1134,16 +1192,21 @@ class IndividualGameLogMaker:
         self._batch = []
 
     def _batch_completed(self, batch_line_number, batch):
+        # [byte offset, number of lines, whether disconnect lines are left out]
+        batch_range = [self._batch_offset, len(batch), False] if batch is not None else None
+
         if self._batch_add_client_id:
             for game_log in self._game_id_to_game_log.values():
                 game_log.line_number_to_batch[batch_line_number] = batch
+                game_log.line_number_to_batch_range[batch_line_number] = batch_range
 
-            self._client_id_to_add_batch[self._batch_add_client_id] = [batch_line_number, batch]
+            self._client_id_to_add_batch[self._batch_add_client_id] = [batch_line_number, batch, batch_range]
             self._batch_add_client_id = None
 
         if self._batch_remove_client_id:
             for game_log in self._game_id_to_game_log.values():
                 game_log.line_number_to_batch[batch_line_number] = batch
+                game_log.line_number_to_batch_range[batch_line_number] = batch_range
 
             del self._client_id_to_add_batch[self._batch_remove_client_id]
             self._batch_remove_client_id = None
@@ -1151,6 +1214,7 @@ class IndividualGameLogMaker:
         if self._batch_game_id:
             game_log = self._game_id_to_game_log[self._batch_game_id]
             game_log.line_number_to_batch[batch_line_number] = batch
+            game_log.line_number_to_batch_range[batch_line_number] = batch_range
 
             self._batch_game_id = None
 
@@ -1171,6 +1235,7 @@ class IndividualGameLog:
         self.username_to_player_id = {}
 
         self.line_number_to_batch = {}
+        self.line_number_to_batch_range = {}
 
     def make_game_log_file(self, filename):
         with open(filename, 'w') as f:
@@ -1180,6 +1245,84 @@ class IndividualGameLog:
                 f.write('\n')
 
 
+def get_game_log_index(log_timestamp, filename):
+    # maps each internal game id in a log file to the batches its individual game log is made of, as
+    # [batch line number, byte offset, number of lines, whether disconnect lines are left out]. it's kept in a file next
+    # to the log file and remade when the log file has changed size.
+    index_filename = filename + util.game_log_index_suffix
+    size = os.path.getsize(filename)
+
+    if os.path.exists(index_filename):
+        try:
+            with open(index_filename, 'r') as f:
+                index = ujson.load(f)
+        except (OSError, ValueError):
+            index = None
+        if index and index['size'] == size:
+            return {internal_game_id: batch_ranges for internal_game_id, batch_ranges in index['games']}
+
+    internal_game_id_to_batch_ranges = {}
+    with util.open_possibly_gzipped_file(filename) as file:
+        individual_game_log_maker = IndividualGameLogMaker(log_timestamp, file)
+        for individual_game_log in individual_game_log_maker.go():
+            batch_ranges = [[line_number] + batch_range for line_number, batch_range in individual_game_log.line_number_to_batch_range.items() if line_number is not None]
+            internal_game_id_to_batch_ranges[individual_game_log.internal_game_id] = sorted(batch_ranges)
+
+    # the logs can be on a read-only mirror, and then the index is only kept in memory
+    try:
+        with open(index_filename, 'w') as f:
+            ujson.dump({'size': size, 'games': sorted(internal_game_id_to_batch_ranges.items())}, f)
+    except OSError as e:
+        print('get_game_log_index: could not write', index_filename, e)
+
+    return internal_game_id_to_batch_ranges
+
+
+def get_individual_game_logs(log_timestamp, file, internal_game_id_to_batch_ranges):
+    # reads only the batches in the batch ranges from get_game_log_index, each one once and in file order. short gaps
+    # are read through instead of seeked over, since a gzipped log starts decompressing over from the beginning when it
+    # seeks backwards, even into what it has buffered.
+    offset_to_num_lines = {}
+    for batch_ranges in internal_game_id_to_batch_ranges.values():
+        for line_number, offset, num_lines, without_disconnects in batch_ranges:
+            offset_to_num_lines[offset] = num_lines
+
+    offset_to_lines = {}
+    position = None
+    for offset, num_lines in sorted(offset_to_num_lines.items()):
+        if position is None or offset < position or offset - position > 65536:
+            file.seek(offset)
+            position = offset
+        while position < offset:
+            line = file.readline()
+            if not line:
+                break
+            position += len(line) if line.isascii() else len(line.encode())
+
+        lines = []
+        for i in range(num_lines):
+            line = file.readline()
+            position += len(line) if line.isascii() else len(line.encode())
+            if len(line) and line[-1] == '\n':
+                line = line[:-1]
+            lines.append(line)
+        offset_to_lines[offset] = lines
+
+    re_disconnect = re.compile(r'^\d+ disconnect$')
+    individual_game_logs = []
+    for internal_game_id, batch_ranges in sorted(internal_game_id_to_batch_ranges.items()):
+        individual_game_log = IndividualGameLog(log_timestamp, internal_game_id)
+        for line_number, offset, num_lines, without_disconnects in batch_ranges:
+            batch = offset_to_lines[offset]
+            if without_disconnects:
+                batch = [line for line in batch if not re_disconnect.match(line)]
+            individual_game_log.line_number_to_batch[line_number] = batch
+            individual_game_log.line_number_to_batch_range[line_number] = [offset, num_lines, without_disconnects]
+        individual_game_logs.append(individual_game_log)
+
+    return individual_game_logs
+
+
 def test_individual_game_log(output_dir):
     log_timestamp = 1432798259
 
@@ -1271,13 +1414,13 @@ def make_individual_game_logs_for_each_sync_log(input_dir, output_dir):
     for log_timestamp, internal_game_ids in sorted(log_timestamp_to_internal_game_ids.items()):
         for log_timestamp_, filename in util.get_log_file_filenames('py', begin=log_timestamp, end=log_timestamp):
             print(filename)
+            internal_game_id_to_batch_ranges = get_game_log_index(log_timestamp, filename)
+            internal_game_id_to_batch_ranges = {internal_game_id: batch_ranges for internal_game_id, batch_ranges in internal_game_id_to_batch_ranges.items() if internal_game_id in internal_game_ids}
             with util.open_possibly_gzipped_file(filename) as file:
-                individual_game_log_maker = IndividualGameLogMaker(log_timestamp, file)
-                for individual_game_log in individual_game_log_maker.go():
-                    if individual_game_log.internal_game_id in internal_game_ids:
-                        filename = os.path.join(output_dir, '%d_%05d.txt' % (individual_game_log.log_timestamp, individual_game_log.internal_game_id))
-                        individual_game_log.make_game_log_file(filename)
-                        print(log_timestamp, individual_game_log.internal_game_id, filename)
+                for individual_game_log in get_individual_game_logs(log_timestamp, file, internal_game_id_to_batch_ranges):
+                    output_filename = os.path.join(output_dir, '%d_%05d.txt' % (log_timestamp, individual_game_log.internal_game_id))
+                    individual_game_log.make_game_log_file(output_filename)
+                    print(log_timestamp, individual_game_log.internal_game_id, output_filename)
 
 
 def run_all_game_logs_with_tile_bag_tweaks(input_dir, output_dir):
@@ -1365,9 +1508,21 @@ def output_server_game_files_for_all_in_progress_games(output_dir):
                     print(filename)
 
 
-def output_first_merge_bonuses_and_final_scores_of_all_completed_games(output_dir):
-    received_bonus_id = enums.GameHistoryMessages.ReceivedBonus.value
+def get_first_merge_bonuses(game_history_messages):
+    received_bonus_id = enum_values.GameHistoryMessages.ReceivedBonus
+
+    type_to_player_id_to_amount = collections.defaultdict(dict)
+
+    for game_history_message in game_history_messages:
+        if game_history_message[0] == received_bonus_id:
+            type_to_player_id_to_amount[game_history_message[2]][game_history_message[1]] = game_history_message[3]
+        elif type_to_player_id_to_amount:
+            break
 
+    return dict(type_to_player_id_to_amount)
+
+
+def output_first_merge_bonuses_and_final_scores_of_all_completed_games(output_dir):
     mode_to_game_data = collections.defaultdict(list)
 
     for log_timestamp, filename in util.get_log_file_filenames('py', begin=1408905413):
@@ -1378,17 +1533,11 @@ def output_first_merge_bonuses_and_final_scores_of_all_completed_games(output_di
                 num_players = len(game.player_id_to_username)
 
                 if game.state == 'Completed' and num_players >= 2:
-                    type_to_player_id_to_amount = collections.defaultdict(dict)
-
-                    for game_history_message in game.username_to_game_history[game.player_id_to_username[0]]:
-                        if game_history_message[0] == received_bonus_id:
-                            type_to_player_id_to_amount[game_history_message[2]][game_history_message[1]] = game_history_message[3]
-                        elif type_to_player_id_to_amount:
-                            break
+                    type_to_player_id_to_amount = get_first_merge_bonuses(game.username_to_game_history[game.player_id_to_username[0]])
 
                     mode = game.mode + (str(num_players) if game.mode == 'Singles' else '')
 
-                    mode_to_game_data[mode].append((dict(type_to_player_id_to_amount), game.score))
+                    mode_to_game_data[mode].append((type_to_player_id_to_amount, game.score))
 
     with open(os.path.join(output_dir, 'first_merge_bonuses_and_final_scores_of_all_completed_games.bin'), 'wb') as f:
         pickle.dump(dict(mode_to_game_data), f)
@@ -0,0 +1,115 @@
+import collections
+import json
+import sys
+import threading
+import time
+import traceback
+
+
+class LoopLagMonitor:
+    def __init__(self, loop, server, interval=1, threshold=0.25, report_interval=60, output=None):
+        self.loop = loop
+        self.server = server
+        self.interval = interval
+        self.threshold = threshold
+        self.report_interval = report_interval
+        self.output = output
+
+        self._main_thread_id = threading.get_ident()
+        self._running = False
+        self._handle = None
+        self._expected_time = None
+        self._stall = None
+        self._lock = threading.Lock()
+
+        self._last_report_time = None
+        self._suppressed_count = 0
+        self._suppressed_max_lag = 0
+
+    def start(self):
+        self._running = True
+        self._schedule_probe()
+        threading.Thread(target=self._watch, name='loop-lag-monitor', daemon=True).start()
+
+    def stop(self):
+        self._running = False
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+
+    def _schedule_probe(self):
+        self._expected_time = time.monotonic() + self.interval
+        self._handle = self.loop.call_later(self.interval, self._probe)
+
+    def _probe(self):
+        expected_time = self._expected_time
+        lag = time.monotonic() - expected_time
+
+        with self._lock:
+            stall = self._stall
+            self._stall = None
+        if stall and stall['expected-time'] != expected_time:
+            stall = None
+
+        if lag >= self.threshold:
+            self._report(lag, stall)
+
+        if self._running:
+            self._schedule_probe()
+
+    def _watch(self):
+        # runs in a helper thread so that the main thread's stack can be captured while the loop is still blocked
+        while self._running:
+            time.sleep(self.threshold / 2)
+
+            expected_time = self._expected_time
+            if expected_time is not None and time.monotonic() - expected_time >= self.threshold:
+                with self._lock:
+                    if self._stall is None or self._stall['expected-time'] != expected_time:
+                        self._stall = self._capture(expected_time)
+
+    def _capture(self, expected_time):
+        frame = sys._current_frames().get(self._main_thread_id)
+        if frame:
+            stack = ['%s:%d:%s' % (x.filename, x.lineno, x.name) for x in traceback.StackSummary.extract(traceback.walk_stack(frame), lookup_lines=False)]
+            stack.reverse()
+        else:
+            stack = []
+
+        client_id = self.server.current_client_id
+        client = self.server.client_id_to_client.get(client_id) if client_id is not None else None
+        game = self.server.game_id_to_game.get(client.game_id) if client and client.game_id else None
+
+        return {
+            'expected-time': expected_time,
+            'client-id': client_id,
+            'game-id': game.internal_game_id if game else None,
+            'external-game-id': game.game_id if game else None,
+            'stack': stack,
+        }
+
+    def _report(self, lag, stall):
+        current_time = time.monotonic()
+        if self._last_report_time is not None and current_time - self._last_report_time < self.report_interval:
+            self._suppressed_count += 1
+            self._suppressed_max_lag = max(self._suppressed_max_lag, lag)
+            return
+
+        log = collections.OrderedDict()
+        log['_'] = 'loop-lag'
+        log['time'] = time.time()
+        log['lag'] = round(lag, 4)
+        if stall:
+            log['client-id'] = stall['client-id']
+            log['game-id'] = stall['game-id']
+            log['external-game-id'] = stall['external-game-id']
+            log['stack'] = stall['stack']
+        if self._suppressed_count:
+            log['suppressed-count'] = self._suppressed_count
+            log['suppressed-max-lag'] = round(self._suppressed_max_lag, 4)
+
+        print(json.dumps(log, separators=(',', ':')), file=self.output or sys.stderr, flush=True)
+
+        self._last_report_time = current_time
+        self._suppressed_count = 0
+        self._suppressed_max_lag = 0
@@ -0,0 +1,127 @@
+import array
+import collections
+import enums
+import json
+import sys
+import time
+import tracemalloc
+
+
+class SizeEstimator:
+    # objects of other types (clients, games, actions, bound methods) are references to things accounted for elsewhere
+    _container_types = {list, tuple, set, frozenset}
+    _counted_types = {list, tuple, set, frozenset, dict, collections.OrderedDict, str, bytes, bytearray, array.array, int, float, bool, type(None)}
+
+    def __init__(self):
+        self._seen = set()
+
+    def get_size(self, obj):
+        size = 0
+        pending = [obj]
+        seen = self._seen
+        container_types = SizeEstimator._container_types
+        counted_types = SizeEstimator._counted_types
+
+        while pending:
+            obj = pending.pop()
+            obj_type = type(obj)
+            obj_id = id(obj)
+            if obj_type not in counted_types or obj_id in seen:
+                continue
+            seen.add(obj_id)
+
+            size += sys.getsizeof(obj)
+
+            if obj_type in container_types:
+                pending.extend(obj)
+            elif obj_type is dict or obj_type is collections.OrderedDict:
+                pending.extend(obj.keys())
+                pending.extend(obj.values())
+
+        return size
+
+
+def get_game_sizes(game, estimator):
+    sizes = collections.OrderedDict()
+    sizes['history'] = estimator.get_size(game.history_messages.__dict__) + estimator.get_size(game.player_id_to_history_messages_json)
+    sizes['board'] = estimator.get_size(game.game_board.x_to_y_to_board_type) + estimator.get_size(game.game_board.board_type_masks)
+    sizes['racks'] = estimator.get_size(game.tile_racks.racks) if game.tile_racks else 0
+    sizes['actions'] = sum(estimator.get_size(action.__dict__) for action in game.actions)
+    sizes['score-sheet'] = estimator.get_size(game.score_sheet.player_data) + estimator.get_size(game.score_sheet.username_to_player_id)
+    sizes['other'] = estimator.get_size(game.tile_bag) + estimator.get_size(game.client_ids) + estimator.get_size(game.watcher_client_ids)
+    return sizes
+
+
+def get_client_size(client, estimator):
+    return estimator.get_size(client.__dict__)
+
+
+def get_report(server, top_n=10):
+    estimator = SizeEstimator()
+
+    game_infos = []
+    state_to_count_and_size = collections.OrderedDict((state.name, [0, 0]) for state in enums.GameStates)
+    for game in server.game_id_to_game.values():
+        sizes = get_game_sizes(game, estimator)
+        size = sum(sizes.values())
+        game_infos.append([size, game.internal_game_id, game.game_id, sizes])
+
+        count_and_size = state_to_count_and_size[enums.GameStates(game.state).name]
+        count_and_size[0] += 1
+        count_and_size[1] += size
+    game_infos.sort(key=lambda x: (-x[0], x[1]))
+
+    client_infos = []
+    for client in server.client_id_to_client.values():
+        client_infos.append([get_client_size(client, estimator), client.client_id, client.username])
+    client_infos.sort(key=lambda x: (-x[0], x[1]))
+
+    report = collections.OrderedDict()
+    report['games-count'] = len(game_infos)
+    report['games-size'] = sum(x[0] for x in game_infos)
+    report['games-by-state'] = collections.OrderedDict((state, {'count': count, 'size': size}) for state, (count, size) in state_to_count_and_size.items())
+    report['top-games'] = [collections.OrderedDict([('game-id', internal_game_id), ('external-game-id', game_id), ('size', size), ('sizes', sizes)]) for size, internal_game_id, game_id, sizes in game_infos[:top_n]]
+    report['clients-count'] = len(client_infos)
+    report['clients-size'] = sum(x[0] for x in client_infos)
+    report['top-clients'] = [collections.OrderedDict([('client-id', client_id), ('username', username), ('size', size)]) for size, client_id, username in client_infos[:top_n]]
+    return report
+
+
+class MemoryReporter:
+    def __init__(self, server, top_n=10, trace_allocations=False, trace_limit=20, output=None):
+        self.server = server
+        self.top_n = top_n
+        self.trace_limit = trace_limit
+        self.output = output
+
+        self._snapshot = None
+        if trace_allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            self._snapshot = tracemalloc.take_snapshot()
+
+    def get_tracemalloc_diff(self):
+        if not self._snapshot:
+            return None
+
+        snapshot = tracemalloc.take_snapshot()
+        stats = snapshot.compare_to(self._snapshot, 'lineno')
+        self._snapshot = snapshot
+
+        diff = []
+        for stat in stats[:self.trace_limit]:
+            frame = stat.traceback[0]
+            diff.append(['%s:%d' % (frame.filename, frame.lineno), stat.size_diff, stat.count_diff])
+        return diff
+
+    def report(self):
+        log = collections.OrderedDict()
+        log['_'] = 'memory-usage'
+        log['time'] = time.time()
+        log.update(get_report(self.server, self.top_n))
+
+        diff = self.get_tracemalloc_diff()
+        if diff is not None:
+            log['tracemalloc-diff'] = diff
+
+        print(json.dumps(log, separators=(',', ':')), file=self.output or sys.stderr, flush=True)
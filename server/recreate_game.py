@@ -24,9 +24,11 @@ def recreate_game(server_, filename):
     game.tile_bag = game_data['tile_bag']
     game.turn_player_id = game_data['turn_player_id']
     game.turns_without_played_tiles_count = game_data['turns_without_played_tiles_count']
-    game.history_messages = game_data['history_messages']
+    game.history_messages = server.GameHistory(game_data['history_messages'])
+    game.player_id_to_history_messages_json = {}
 
     game.add_pending_messages = server_.add_pending_messages
+    game.messaging_enabled = True
     game.logging_enabled = True
     game.client_ids = set()
     game.watcher_client_ids = set()
@@ -37,6 +39,12 @@ def recreate_game(server_, filename):
     game.score_sheet = server.ScoreSheet.__new__(server.ScoreSheet)
     game.score_sheet.game = game
     game.score_sheet.__dict__.update(game_data['score_sheet'])
+    game.score_sheet.zobrist_hash = game.score_sheet.get_zobrist_hash()
+    game.score_sheet.version = 0
+    game.score_sheet.set_score_sheet_message_version = None
+    game.score_sheet.set_score_sheet_message = None
+    game.score_sheet.changed_cells = None
+    game.score_sheet.update_net_worths()
 
     if game_data['tile_racks'] is None:
         game.tile_racks = None
@@ -44,6 +52,8 @@ def recreate_game(server_, filename):
         game.tile_racks = server.TileRacks.__new__(server.TileRacks)
         game.tile_racks.game = game
         game.tile_racks.racks = game_data['tile_racks']
+        game.tile_racks.reset_classification()
+        game.tile_racks.zobrist_hash = game.tile_racks.get_zobrist_hash()
 
     game.actions = []
     for action_data in game_data['actions']:
@@ -0,0 +1,96 @@
+import collections
+import os
+import os.path
+import signal
+import sys
+import threading
+import time
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.005, output_dir='.', thread_id=None):
+        self.interval = interval
+        self.output_dir = output_dir
+        self.thread_id = threading.get_ident() if thread_id is None else thread_id
+
+        self._running = False
+        self._thread = None
+        self._start_time = None
+        self._stack_to_count = None
+        self._code_to_label = {}
+
+    def is_running(self):
+        return self._running
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._start_time = time.time()
+        self._stack_to_count = collections.defaultdict(int)
+        self._thread = threading.Thread(target=self._sample_loop, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        self._thread.join()
+        self._thread = None
+
+        filename = os.path.join(self.output_dir, 'profile_%d_%d.collapsed' % (os.getpid(), self._start_time))
+        self.write_collapsed_stacks(filename)
+        self._stack_to_count = None
+        return filename
+
+    def toggle(self):
+        if self._running:
+            filename = self.stop()
+            print('sampling profiler stopped, wrote', filename, file=sys.stderr, flush=True)
+        else:
+            self.start()
+            print('sampling profiler started', file=sys.stderr, flush=True)
+
+    def _sample_loop(self):
+        # only the code objects are recorded per sample; they're turned into strings when writing
+        current_frames = sys._current_frames
+        sleep = time.sleep
+        interval = self.interval
+        thread_id = self.thread_id
+        stack_to_count = self._stack_to_count
+
+        while self._running:
+            sleep(interval)
+
+            frame = current_frames().get(thread_id)
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            frame = None
+
+            stack_to_count[tuple(codes)] += 1
+
+    def write_collapsed_stacks(self, filename):
+        lines = []
+        for codes, count in self._stack_to_count.items():
+            lines.append(';'.join(self._get_label(code) for code in reversed(codes)) + ' ' + str(count))
+        lines.sort()
+
+        with open(filename, 'w') as f:
+            for line in lines:
+                f.write(line)
+                f.write('\n')
+
+    def _get_label(self, code):
+        label = self._code_to_label.get(code)
+        if label is None:
+            label = ('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)).replace(';', ':')
+            self._code_to_label[code] = label
+        return label
+
+
+def install(signum=signal.SIGUSR2, interval=0.005, output_dir='.'):
+    profiler = SamplingProfiler(interval, output_dir)
+    signal.signal(signum, lambda signum_, frame: profiler.toggle())
+    return profiler
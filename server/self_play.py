@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+import argparse
+import benchmark
+import collections
+import enum_values
+import logs_to_games
+import multiprocessing
+import os
+import os.path
+import pickle
+import random
+import server
+import time
+
+
+def choose_greedy_share_buyer_game_action_data(game, rng):
+    # buys as many and as expensive shares as possible, trades instead of selling and keeps the rest
+    action = game.actions[-1]
+    legal_data = game.get_legal_game_action_data()
+
+    if action.game_action_id == enum_values.GameActions.PurchaseShares:
+        price = game.score_sheet.price
+        return max(legal_data, key=lambda data: (len(data[0]), sum(price[type_id] for type_id in data[0]), data[1]))
+    elif action.game_action_id == enum_values.GameActions.DisposeOfShares:
+        return max(legal_data, key=lambda data: (data[0], -data[1]))
+    else:
+        return rng.choice(legal_data)
+
+
+def choose_merge_seeker_game_action_data(game, rng):
+    # plays merging tiles first, keeps the chains it holds the most shares in, sells defunct shares and buys into
+    # small chains that are likely to be merged
+    action = game.actions[-1]
+    game_action_id = action.game_action_id
+    legal_data = game.get_legal_game_action_data()
+    player_datum = game.score_sheet.player_data[action.player_id] if action.player_id is not None else None
+
+    if game_action_id == enum_values.GameActions.PlayTile:
+        rack = game.tile_racks.racks[action.player_id]
+        game_board_type_to_priority = {enum_values.GameBoardTypes.WillMergeChains: 2, enum_values.GameBoardTypes.WillFormNewChain: 1}
+        priority = max(game_board_type_to_priority.get(rack[data[0]][1], 0) for data in legal_data)
+        return rng.choice([data for data in legal_data if game_board_type_to_priority.get(rack[data[0]][1], 0) == priority])
+    elif game_action_id == enum_values.GameActions.SelectNewChain or game_action_id == enum_values.GameActions.SelectMergerSurvivor:
+        return max(legal_data, key=lambda data: (player_datum[data[0]], rng.random()))
+    elif game_action_id == enum_values.GameActions.DisposeOfShares:
+        return max(legal_data, key=lambda data: (data[1], data[0]))
+    elif game_action_id == enum_values.GameActions.PurchaseShares:
+        chain_size = game.score_sheet.chain_size
+        return max(legal_data, key=lambda data: (len(data[0]), -sum(chain_size[type_id] for type_id in data[0]), data[1]))
+    else:
+        return rng.choice(legal_data)
+
+
+policy_name_to_policy = collections.OrderedDict([
+    ('random', benchmark.choose_random_game_action_data),
+    ('greedy-share-buyer', choose_greedy_share_buyer_game_action_data),
+    ('merge-seeker', choose_merge_seeker_game_action_data),
+])
+
+mode_name_to_mode_and_num_players = collections.OrderedDict([
+    ('Singles2', (enum_values.GameModes.Singles, 2)),
+    ('Singles3', (enum_values.GameModes.Singles, 3)),
+    ('Singles4', (enum_values.GameModes.Singles, 4)),
+    ('Teams', (enum_values.GameModes.Teams, 4)),
+])
+
+
+def play_game(mode_name, policy_names, seed):
+    # policy_names are in join order. returns the data output_first_merge_bonuses_and_final_scores_of_all_completed_games
+    # keeps for each game, plus the policy name of each player id.
+    rng = random.Random(seed)
+    mode, num_players = mode_name_to_mode_and_num_players[mode_name]
+
+    tile_bag = [(x, y) for x in range(12) for y in range(9)]
+    rng.shuffle(tile_bag)
+    game = server.Game(1, 1, mode, num_players, None, False, tile_bag)
+    clients = [logs_to_games.Client(player_number, 'bot%d' % player_number) for player_number in range(num_players)]
+    for client in clients:
+        game.join_game(client)
+    player_id_to_client = {client.player_id: client for client in clients}
+    player_id_to_policy_name = [None] * num_players
+    for client, policy_name in zip(clients, policy_names):
+        player_id_to_policy_name[client.player_id] = policy_name
+
+    while game.actions[-1].game_action_id != enum_values.GameActions.GameOver:
+        action = game.actions[-1]
+        policy = policy_name_to_policy[player_id_to_policy_name[action.player_id]]
+        game.do_game_action(player_id_to_client[action.player_id], action.game_action_id, policy(game, rng))
+
+    game_history_messages = [data for player_id, data in game.history_messages if player_id is None or player_id == 0]
+    score = [player_datum[enum_values.ScoreSheetIndexes.Net] for player_datum in game.score_sheet.player_data]
+    return (logs_to_games.get_first_merge_bonuses(game_history_messages), score), player_id_to_policy_name
+
+
+def _play_game(task):
+    mode_name, policy_names, seed = task
+    return (mode_name,) + play_game(mode_name, policy_names, seed)
+
+
+def get_tasks(num_games, mode_names, policy_names, seed):
+    # modes take turns, and so do the seats of the policies
+    for game_number in range(num_games):
+        mode_name = mode_names[game_number % len(mode_names)]
+        num_players = mode_name_to_mode_and_num_players[mode_name][1]
+        yield mode_name, [policy_names[(game_number + player_number) % len(policy_names)] for player_number in range(num_players)], seed * 1000000 + game_number
+
+
+def run(num_games, mode_names, policy_names, seed=0, processes=None, callback=None):
+    # results stream in from the pool as games complete, in no particular order
+    mode_to_game_data = collections.defaultdict(list)
+    mode_to_policy_names = collections.defaultdict(list)
+
+    with multiprocessing.Pool(processes) as pool:
+        for mode_name, game_data, player_id_to_policy_name in pool.imap_unordered(_play_game, get_tasks(num_games, mode_names, policy_names, seed), chunksize=16):
+            mode_to_game_data[mode_name].append(game_data)
+            mode_to_policy_names[mode_name].append(player_id_to_policy_name)
+            if callback:
+                callback(mode_name, game_data, player_id_to_policy_name)
+
+    return dict(mode_to_game_data), dict(mode_to_policy_names)
+
+
+def get_policy_name_to_win_rate(mode_name, game_data, policy_names):
+    # ties split the win
+    policy_name_to_wins = collections.defaultdict(float)
+    policy_name_to_games = collections.defaultdict(int)
+
+    for (type_to_player_id_to_amount, score), player_id_to_policy_name in zip(game_data, policy_names):
+        if mode_name == 'Teams':
+            score = [score[0] + score[2], score[1] + score[3]]
+            player_id_to_policy_name = ['+'.join(sorted([player_id_to_policy_name[0], player_id_to_policy_name[2]])), '+'.join(sorted([player_id_to_policy_name[1], player_id_to_policy_name[3]]))]
+
+        winner_player_ids = [player_id for player_id, ranking in logs_to_games.get_player_id_to_ranking(score).items() if ranking == 1]
+        for player_id, policy_name in enumerate(player_id_to_policy_name):
+            policy_name_to_games[policy_name] += 1
+            if player_id in winner_player_ids:
+                policy_name_to_wins[policy_name] += 1 / len(winner_player_ids)
+
+    return collections.OrderedDict((policy_name, policy_name_to_wins[policy_name] / games) for policy_name, games in sorted(policy_name_to_games.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play games between bot policies with the game engine.')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--modes', default=','.join(mode_name_to_mode_and_num_players.keys()), help='comma separated, from ' + ', '.join(mode_name_to_mode_and_num_players.keys()))
+    parser.add_argument('--policies', default=','.join(policy_name_to_policy.keys()), help='comma separated, from ' + ', '.join(policy_name_to_policy.keys()))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--output-dir', help='write first_merge_bonuses_and_final_scores_of_all_completed_games.bin here for the logs_to_games reports')
+    args = parser.parse_args()
+
+    mode_names = args.modes.split(',')
+    policy_names = args.policies.split(',')
+    for mode_name in mode_names:
+        if mode_name not in mode_name_to_mode_and_num_players:
+            parser.error('unknown mode: ' + mode_name)
+    for policy_name in policy_names:
+        if policy_name not in policy_name_to_policy:
+            parser.error('unknown policy: ' + policy_name)
+
+    begin = time.time()
+    mode_to_game_data, mode_to_policy_names = run(args.games, mode_names, policy_names, args.seed, args.processes)
+    duration = time.time() - begin
+
+    print('games: %d, seconds: %.2f, games/sec: %.1f, games/sec per process: %.1f' % (args.games, duration, args.games / duration, args.games / duration / args.processes))
+    for mode_name in mode_names:
+        if mode_name in mode_to_game_data:
+            win_rates = get_policy_name_to_win_rate(mode_name, mode_to_game_data[mode_name], mode_to_policy_names[mode_name])
+            print(mode_name, ', '.join('%s: %.1f%%' % (policy_name, win_rate * 100) for policy_name, win_rate in win_rates.items()))
+
+    if args.output_dir:
+        with open(os.path.join(args.output_dir, 'first_merge_bonuses_and_final_scores_of_all_completed_games.bin'), 'wb') as f:
+            pickle.dump(mode_to_game_data, f)
+
+
+if __name__ == '__main__':
+    main()
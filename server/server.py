@@ -1,16 +1,28 @@
 #!/usr/bin/env python3
 
+import array
 import asyncio
+import bisect
 import collections
+import enum_values
 import enums
 import heapq
+import itertools
 import json
+import loop_monitor
 import math
+import memory_usage
 import random
 import re
+import sampling_profiler
+import settings
+import signal
+import sys
 import time
 import traceback
+import tracing
 import ujson
+import util
 
 
 class ServerProtocol(asyncio.Protocol):
@@ -46,20 +58,36 @@ class ServerProtocol(asyncio.Protocol):
 
                 key, value = key_and_value.split(b' ', 1)
                 if key == b'connect':
+                    self.server.current_client_id = None
                     value = ujson.decode(value.decode())
                     Client(self.server, *value)
                 elif key == b'disconnect':
-                    client = self.server.client_id_to_client.get(int(value.decode()), None)
+                    client_id = int(value.decode())
+                    self.server.current_client_id = client_id
+                    client = self.server.client_id_to_client.get(client_id, None)
                     if client:
                         client.disconnect()
                 else:
-                    client = self.server.client_id_to_client.get(int(key.decode()), None)
+                    client_id = int(key.decode())
+                    self.server.current_client_id = client_id
+                    client = self.server.client_id_to_client.get(client_id, None)
                     if client:
                         client.on_message(value)
             else:
                 self.unprocessed_data.append(data[start_index:])
                 break
 
+        self.server.current_client_id = None
+
+
+class EncodedJson:
+    # ujson.dumps inserts the already encoded json string as is
+    def __init__(self, json_string):
+        self.json_string = json_string
+
+    def __json__(self):
+        return self.json_string
+
 
 class ReuseIdManager:
     def __init__(self, return_wait):
@@ -109,6 +137,7 @@ class Server:
         self.next_internal_game_id_manager = IncrementIdManager()
         self.game_id_to_game = {}
         self.client_ids_and_messages = []
+        self.current_client_id = None
 
         self.transport_write = None
 
@@ -168,7 +197,7 @@ class Server:
                 self.next_game_id_manager.return_id(game_id)
                 self.next_internal_game_id_manager.return_id(internal_game_id)
                 del self.game_id_to_game[game_id]
-                messages.append([enums.CommandsToClient.DestroyGame.value, game_id])
+                messages.append([enum_values.CommandsToClient.DestroyGame, game_id])
             self.add_pending_messages(messages)
             self.flush_pending_messages()
 
@@ -196,7 +225,7 @@ class Client:
                 self._server.username_to_client[self.username].disconnect()
             else:
                 output_connect_messages()
-                messages_client.append([enums.CommandsToClient.FatalError.value, enums.Errors.UsernameAlreadyInUse.value])
+                messages_client.append([enum_values.CommandsToClient.FatalError, enum_values.Errors.UsernameAlreadyInUse])
                 self._server.add_pending_messages(messages_client, {self.client_id})
                 self._server.flush_pending_messages()
                 self.disconnect()
@@ -212,31 +241,31 @@ class Client:
             self.on_message_lookup.append(getattr(self, '_on_message_' + self._server.re_camelcase.sub(r'\1_\2', command_enum.name).lower()))
         self._server.username_to_client[self.username] = self
 
-        messages_client.append([enums.CommandsToClient.SetClientId.value, self.client_id])
+        messages_client.append([enum_values.CommandsToClient.SetClientId, self.client_id])
 
         # tell client about other clients' data
         for client in self._server.client_id_to_client.values():
             if client is not self:
-                messages_client.append([enums.CommandsToClient.SetClientIdToData.value, client.client_id, client.username, client.ip_address])
+                messages_client.append([enum_values.CommandsToClient.SetClientIdToData, client.client_id, client.username, client.ip_address])
         self._server.add_pending_messages(messages_client, {self.client_id})
         messages_client = []
 
         # tell all clients about client's data
-        self._server.add_pending_messages([[enums.CommandsToClient.SetClientIdToData.value, self.client_id, self.username, self.ip_address]])
+        self._server.add_pending_messages([[enum_values.CommandsToClient.SetClientIdToData, self.client_id, self.username, self.ip_address]])
 
         # tell client about all games
         for game in sorted(self._server.game_id_to_game.values(), key=lambda x: x.internal_game_id):
             game_id = game.game_id
-            messages_client.append([enums.CommandsToClient.SetGameState.value, game_id, game.state, game.mode, game.max_players])
+            messages_client.append([enum_values.CommandsToClient.SetGameState, game_id, game.state, game.mode, game.max_players])
             for player_id, player_datum in enumerate(game.score_sheet.player_data):
-                if player_datum[enums.ScoreSheetIndexes.Client.value]:
-                    messages_client.append([enums.CommandsToClient.SetGamePlayerJoin.value, game_id, player_id, player_datum[enums.ScoreSheetIndexes.Client.value].client_id])
+                if player_datum[enum_values.ScoreSheetIndexes.Client]:
+                    messages_client.append([enum_values.CommandsToClient.SetGamePlayerJoin, game_id, player_id, player_datum[enum_values.ScoreSheetIndexes.Client].client_id])
                 else:
-                    username = player_datum[enums.ScoreSheetIndexes.Username.value]
+                    username = player_datum[enum_values.ScoreSheetIndexes.Username]
                     client = self._server.username_to_client.get(username)
-                    messages_client.append([enums.CommandsToClient.SetGamePlayerJoinMissing.value, game_id, player_id, client.client_id if client else username])
+                    messages_client.append([enum_values.CommandsToClient.SetGamePlayerJoinMissing, game_id, player_id, client.client_id if client else username])
             for client_id in game.watcher_client_ids:
-                messages_client.append([enums.CommandsToClient.SetGameWatcherClientId.value, game_id, client_id])
+                messages_client.append([enum_values.CommandsToClient.SetGameWatcherClientId, game_id, client_id])
         self._server.add_pending_messages(messages_client, {self.client_id})
 
         self._server.flush_pending_messages()
@@ -256,7 +285,7 @@ class Client:
 
         if self._logged_in:
             del self._server.username_to_client[self.username]
-            self._server.add_pending_messages([[enums.CommandsToClient.SetClientIdToData.value, self.client_id, None, None]])
+            self._server.add_pending_messages([[enum_values.CommandsToClient.SetClientIdToData, self.client_id, None, None]])
             self._server.flush_pending_messages()
         else:
             print()
@@ -282,7 +311,7 @@ class Client:
             self.disconnect()
 
     def _on_message_create_game(self, mode, max_players):
-        if not self.game_id and isinstance(mode, int) and 0 <= mode < enums.GameModes.Max.value and isinstance(max_players, int) and 1 <= max_players <= 6:
+        if not self.game_id and isinstance(mode, int) and 0 <= mode < enum_values.GameModes.Max and isinstance(max_players, int) and 1 <= max_players <= 6:
             game_id = self._server.next_game_id_manager.get_id()
             internal_game_id = self._server.next_internal_game_id_manager.get_id()
             game = Game(game_id, internal_game_id, mode, max_players, self._server.add_pending_messages)
@@ -312,72 +341,239 @@ class Client:
     def _on_message_send_global_chat_message(self, chat_message):
         chat_message = ' '.join(chat_message.split())
         if chat_message:
-            self._server.add_pending_messages([[enums.CommandsToClient.AddGlobalChatMessage.value, self.client_id, chat_message]])
+            self._server.add_pending_messages([[enum_values.CommandsToClient.AddGlobalChatMessage, self.client_id, chat_message]])
 
     def _on_message_send_game_chat_message(self, chat_message):
         if self.game_id:
             chat_message = ' '.join(chat_message.split())
             if chat_message:
-                self._server.add_pending_messages([[enums.CommandsToClient.AddGameChatMessage.value, self.client_id, chat_message]], self._server.game_id_to_game[self.game_id].client_ids)
+                self._server.add_pending_messages([[enum_values.CommandsToClient.AddGameChatMessage, self.client_id, chat_message]], self._server.game_id_to_game[self.game_id].client_ids)
+
+
+class GameBoardCoordinates:
+    def __init__(self, board_type_masks, board_type):
+        self._board_type_masks = board_type_masks
+        self._board_type = board_type
+
+    def __len__(self):
+        return bin(self._board_type_masks[self._board_type]).count('1')
+
+    def __bool__(self):
+        return self._board_type_masks[self._board_type] != 0
+
+    def __contains__(self, coordinates):
+        index = GameBoard.coordinates_to_index.get(coordinates)
+        return index is not None and (self._board_type_masks[self._board_type] >> index) & 1 == 1
+
+    def __iter__(self):
+        index_to_coordinates = GameBoard.index_to_coordinates
+        mask = self._board_type_masks[self._board_type]
+        while mask:
+            bit = mask & -mask
+            mask ^= bit
+            yield index_to_coordinates[bit.bit_length() - 1]
 
 
 class GameBoard:
+    # cell (x, y) is bit x * 9 + y of each board type's mask
+    index_to_coordinates = [(x, y) for x in range(12) for y in range(9)]
+    coordinates_to_index = {coordinates: index for index, coordinates in enumerate(index_to_coordinates)}
+    all_mask = (1 << 108) - 1
+    neighbor_masks = [sum(1 << (x2 * 9 + y2) for x2, y2 in [(x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)] if 0 <= x2 < 12 and 0 <= y2 < 9) for x, y in index_to_coordinates]
+    # the board hash is the sum of zobrist_type_keys[t] * board_type_masks[t] modulo a prime. that is the sum of a key
+    # per cell and type, like a zobrist hash, but relabeling any set of cells only takes one step per old type.
+    zobrist_prime = (1 << 127) - 1
+    zobrist_type_keys = [((util.get_zobrist_key(1, t, 0) << 64) | util.get_zobrist_key(1, t, 1)) >> 1 for t in range(enum_values.GameBoardTypes.Max)]
+
     def __init__(self, game, board=None):
         self.game = game
 
         if board is None:
-            board = [[enums.GameBoardTypes.Nothing.value for y in range(9)] for x in range(12)]
+            board = [[enum_values.GameBoardTypes.Nothing for y in range(9)] for x in range(12)]
         self.x_to_y_to_board_type = board
 
-        self.board_type_to_coordinates = [set() for t in range(enums.GameBoardTypes.Max.value)]
+        self.board_type_masks = [0] * enum_values.GameBoardTypes.Max
         for x in range(12):
             for y in range(9):
-                self.board_type_to_coordinates[board[x][y]].add((x, y))
+                self.board_type_masks[board[x][y]] |= 1 << (x * 9 + y)
+
+        self.board_type_to_coordinates = [GameBoardCoordinates(self.board_type_masks, t) for t in range(enum_values.GameBoardTypes.Max)]
+
+        # disjoint sets of connected placed cells (chains and NothingYet cells). member_masks and sizes are only
+        # meaningful for roots.
+        self.parents = list(range(108))
+        self.member_masks = [1 << index for index in range(108)]
+        self.sizes = [1] * 108
+        self.placed_mask = 0
+        for index, (x, y) in enumerate(GameBoard.index_to_coordinates):
+            if board[x][y] != enum_values.GameBoardTypes.Nothing and board[x][y] != enum_values.GameBoardTypes.CantPlayEver:
+                self._place(index)
+
+        self.zobrist_hash = self.get_zobrist_hash()
+
+        # incremented on every change, for caching encodings of the board
+        self.version = 0
+        self.set_game_board_message_version = None
+        self.set_game_board_message = None
+
+    def get_zobrist_hash(self):
+        return sum(key * mask for key, mask in zip(GameBoard.zobrist_type_keys, self.board_type_masks)) % GameBoard.zobrist_prime
+
+    def _find(self, index):
+        parents = self.parents
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    def _place(self, index):
+        self.placed_mask |= 1 << index
+        root = index
+        neighbors = GameBoard.neighbor_masks[index] & self.placed_mask
+        while neighbors:
+            bit = neighbors & -neighbors
+            neighbors ^= bit
+            root = self._union(root, bit.bit_length() - 1)
+
+    def _union(self, index1, index2):
+        root1 = self._find(index1)
+        root2 = self._find(index2)
+        if root1 == root2:
+            return root1
+        if self.sizes[root1] < self.sizes[root2]:
+            root1, root2 = root2, root1
+        self.parents[root2] = root1
+        self.sizes[root1] += self.sizes[root2]
+        self.member_masks[root1] |= self.member_masks[root2]
+        return root1
+
+    def get_component_size(self, coordinates):
+        return self.sizes[self._find(GameBoard.coordinates_to_index[coordinates])]
+
+    def get_neighboring_chain_sizes(self, coordinates):
+        # type of each chain bordering coordinates to its size
+        chain_sizes = {}
+        neighbors = GameBoard.neighbor_masks[GameBoard.coordinates_to_index[coordinates]] & self.placed_mask
+        while neighbors:
+            bit = neighbors & -neighbors
+            neighbors ^= bit
+            x, y = GameBoard.index_to_coordinates[bit.bit_length() - 1]
+            board_type = self.x_to_y_to_board_type[x][y]
+            if board_type <= enum_values.GameBoardTypes.Imperial:
+                chain_sizes[board_type] = self.get_component_size((x, y))
+        return chain_sizes
 
     def _set_cell(self, coordinates, board_type):
         x, y = coordinates
+        index = x * 9 + y
+        bit = 1 << index
         old_board_type = self.x_to_y_to_board_type[x][y]
-        self.board_type_to_coordinates[old_board_type].remove(coordinates)
+        self.board_type_masks[old_board_type] &= ~bit
         self.x_to_y_to_board_type[x][y] = board_type
-        self.board_type_to_coordinates[board_type].add(coordinates)
-        return [enums.CommandsToClient.SetGameBoardCell.value, x, y, board_type]
+        self.zobrist_hash = (self.zobrist_hash + (GameBoard.zobrist_type_keys[board_type] - GameBoard.zobrist_type_keys[old_board_type]) * bit) % GameBoard.zobrist_prime
+        self.board_type_masks[board_type] |= bit
+        self.version += 1
+        if not self.placed_mask & bit and board_type != enum_values.GameBoardTypes.Nothing and board_type != enum_values.GameBoardTypes.CantPlayEver:
+            self._place(index)
+        if self.game.tile_racks:
+            self.game.tile_racks.mark_cells_changed(bit)
 
     def set_cell(self, coordinates, board_type):
-        self.game.add_pending_messages([self._set_cell(coordinates, board_type)], self.game.client_ids)
+        self._set_cell(coordinates, board_type)
+        if self.game.messaging_enabled:
+            self.game.add_pending_messages([[enum_values.CommandsToClient.SetGameBoardCell, coordinates[0], coordinates[1], board_type]], self.game.client_ids)
 
     def fill_cells(self, coordinates, board_type):
-        pending = [coordinates]
-        found = {coordinates}
-        messages = []
-        excluded_board_types = {enums.GameBoardTypes.Nothing.value, enums.GameBoardTypes.CantPlayEver.value, board_type}
+        index = GameBoard.coordinates_to_index[coordinates]
+        if not (self.placed_mask >> index) & 1:
+            self._place(index)
+
+        # only cells that aren't already board_type change, plus the starting cell which is always sent
+        masks = self.board_type_masks
+        component = (self.member_masks[self._find(index)] & ~masks[board_type]) | (1 << index)
+        zobrist_type_keys = GameBoard.zobrist_type_keys
+        zobrist_hash = self.zobrist_hash + zobrist_type_keys[board_type] * component
+        for t, mask in enumerate(masks):
+            if mask & component:
+                masks[t] = mask & ~component
+                zobrist_hash -= zobrist_type_keys[t] * (mask & component)
+        masks[board_type] |= component
+        self.zobrist_hash = zobrist_hash % GameBoard.zobrist_prime
+        self.version += 1
+        if self.game.tile_racks:
+            self.game.tile_racks.mark_cells_changed(component)
 
-        while pending:
-            new_pending = []
-            for coords in pending:
-                messages.append(self._set_cell(coords, board_type))
-
-                x, y = coords
-                possibilities = []
-                if x:
-                    possibilities.append((x - 1, y))
-                if x < 11:
-                    possibilities.append((x + 1, y))
-                if y:
-                    possibilities.append((x, y - 1))
-                if y < 8:
-                    possibilities.append((x, y + 1))
-
-                for coords2 in possibilities:
-                    if coords2 not in found and self.x_to_y_to_board_type[coords2[0]][coords2[1]] not in excluded_board_types:
-                        new_pending.append(coords2)
-                        found.add(coords2)
-
-            pending = new_pending
+        x, y = coordinates
+        x_to_y_to_board_type = self.x_to_y_to_board_type
+        index_to_coordinates = GameBoard.index_to_coordinates
+
+        if self.game.messaging_enabled and bin(component).count('1') >= settings.server__game_board__set_game_board_cells_min_count:
+            # one message with the cells as runs of consecutive indexes
+            runs = []
+            while component:
+                start = (component & -component).bit_length() - 1
+                shifted = component >> start
+                length = (~shifted & (shifted + 1)).bit_length() - 1
+                component ^= ((1 << length) - 1) << start
+                runs.append(start)
+                runs.append(length)
+                for index in range(start, start + length):
+                    x, y = index_to_coordinates[index]
+                    x_to_y_to_board_type[x][y] = board_type
+
+            self.game.add_pending_messages([[enum_values.CommandsToClient.SetGameBoardCells, board_type, runs]], self.game.client_ids)
+            return
 
-        self.game.add_pending_messages(messages, self.game.client_ids)
+        # the starting cell first, then the rest in index order
+        x_to_y_to_board_type[x][y] = board_type
+        component &= ~(1 << index)
+
+        if self.game.messaging_enabled:
+            set_game_board_cell = enum_values.CommandsToClient.SetGameBoardCell
+            messages = [[set_game_board_cell, x, y, board_type]]
+            while component:
+                bit = component & -component
+                component ^= bit
+                x, y = index_to_coordinates[bit.bit_length() - 1]
+                x_to_y_to_board_type[x][y] = board_type
+                messages.append([set_game_board_cell, x, y, board_type])
+
+            self.game.add_pending_messages(messages, self.game.client_ids)
+        else:
+            while component:
+                bit = component & -component
+                component ^= bit
+                x, y = index_to_coordinates[bit.bit_length() - 1]
+                x_to_y_to_board_type[x][y] = board_type
+
+    def clone(self, game):
+        game_board = GameBoard.__new__(GameBoard)
+        game_board.game = game
+        game_board.x_to_y_to_board_type = [list(y_to_board_type) for y_to_board_type in self.x_to_y_to_board_type]
+        game_board.board_type_masks = list(self.board_type_masks)
+        game_board.board_type_to_coordinates = [GameBoardCoordinates(game_board.board_type_masks, t) for t in range(enum_values.GameBoardTypes.Max)]
+        game_board.parents = list(self.parents)
+        game_board.member_masks = list(self.member_masks)
+        game_board.sizes = list(self.sizes)
+        game_board.placed_mask = self.placed_mask
+        game_board.zobrist_hash = self.zobrist_hash
+        game_board.version = self.version
+        game_board.set_game_board_message_version = None
+        game_board.set_game_board_message = None
+        return game_board
+
+    def get_set_game_board_message(self):
+        # encoded once per version of the board
+        if self.set_game_board_message_version != self.version:
+            self.set_game_board_message = EncodedJson(ujson.dumps([enum_values.CommandsToClient.SetGameBoard, self.x_to_y_to_board_type]))
+            self.set_game_board_message_version = self.version
+        return self.set_game_board_message
 
 
 class ScoreSheet:
+    share_zobrist_keys = [[[util.get_zobrist_key(3, player_id, game_board_type_id, count) for count in range(26)] for game_board_type_id in range(7)] for player_id in range(6)]
+    chain_size_zobrist_keys = [[util.get_zobrist_key(4, game_board_type_id, chain_size) for chain_size in range(109)] for game_board_type_id in range(7)]
+
     def __init__(self, game):
         self.game = game
 
@@ -389,25 +585,55 @@ class ScoreSheet:
         self.creator_username = None
         self.username_to_player_id = {}
 
+        self.zobrist_hash = self.get_zobrist_hash()
+
+        # incremented on every change of the cells sent by SetScoreSheet, for caching its encoding
+        self.version = 0
+        self.set_score_sheet_message_version = None
+        self.set_score_sheet_message = None
+
+        # (row, index) to value of the cells changed during Game.do_game_action, sent together by send_changed_cells.
+        # None when changes are sent right away.
+        self.changed_cells = None
+
+        # the Net column is kept up to date as shares, cash and prices change. for each chain, the (count, player_id)
+        # of its holders in ascending order, and the bonuses included in the net worths.
+        self.chain_holders = [[] for game_board_type_id in range(7)]
+        self.chain_bonuses = [[] for game_board_type_id in range(7)]
+
+    def get_zobrist_hash(self):
+        # over the shares and cash of each player and the chain sizes
+        zobrist_hash = 0
+        for player_id, player_datum in enumerate(self.player_data):
+            for game_board_type_id in range(7):
+                zobrist_hash ^= ScoreSheet.share_zobrist_keys[player_id][game_board_type_id][player_datum[game_board_type_id]]
+            zobrist_hash ^= util.get_zobrist_key(3, player_id, enum_values.ScoreSheetIndexes.Cash, player_datum[enum_values.ScoreSheetIndexes.Cash])
+        for game_board_type_id, chain_size in enumerate(self.chain_size):
+            zobrist_hash ^= ScoreSheet.chain_size_zobrist_keys[game_board_type_id][chain_size]
+        return zobrist_hash
+
     def join_game(self, client, position_tile):
         messages_client = []
 
         if not self.player_data:
             self.creator_username = client.username
         self.player_data.append([0, 0, 0, 0, 0, 0, 0, 60, 60, client.username, position_tile, client])
-        self.player_data.sort(key=lambda t: t[enums.ScoreSheetIndexes.PositionTile.value])
+        self.player_data.sort(key=lambda t: t[enum_values.ScoreSheetIndexes.PositionTile])
+        self.zobrist_hash = self.get_zobrist_hash()
+        self.version += 1
+        self.update_net_worths()
 
         # update player_ids for all clients in game
         player_id = 0
         for player_datum in self.player_data:
-            if player_datum[enums.ScoreSheetIndexes.Client.value]:
-                player_datum[enums.ScoreSheetIndexes.Client.value].player_id = player_id
+            if player_datum[enum_values.ScoreSheetIndexes.Client]:
+                player_datum[enum_values.ScoreSheetIndexes.Client].player_id = player_id
             player_id += 1
 
         for player_id, player_datum in enumerate(self.player_data):
             # update self.username_to_player_id
             if player_id >= client.player_id:
-                username = player_datum[enums.ScoreSheetIndexes.Username.value]
+                username = player_datum[enum_values.ScoreSheetIndexes.Username]
                 self.username_to_player_id[username] = player_id
                 if self.game.logging_enabled:
                     log = collections.OrderedDict()
@@ -419,25 +645,28 @@ class ScoreSheet:
                     print(json.dumps(log, separators=(',', ':')))
 
             # tell client about other position tiles
-            if player_id != client.player_id:
-                x, y = player_datum[enums.ScoreSheetIndexes.PositionTile.value]
-                messages_client.append([enums.CommandsToClient.SetGameBoardCell.value, x, y, enums.GameBoardTypes.NothingYet.value])
+            if player_id != client.player_id and self.game.messaging_enabled:
+                x, y = player_datum[enum_values.ScoreSheetIndexes.PositionTile]
+                messages_client.append([enum_values.CommandsToClient.SetGameBoardCell, x, y, enum_values.GameBoardTypes.NothingYet])
 
-        self.game.add_pending_messages([[enums.CommandsToClient.SetGamePlayerJoin.value, self.game.game_id, client.player_id, client.client_id]])
-        if messages_client:
-            self.game.add_pending_messages(messages_client, {client.client_id})
+        if self.game.messaging_enabled:
+            self.game.add_pending_messages([[enum_values.CommandsToClient.SetGamePlayerJoin, self.game.game_id, client.player_id, client.client_id]])
+            if messages_client:
+                self.game.add_pending_messages(messages_client, {client.client_id})
 
     def rejoin_game(self, client):
         player_id = self.username_to_player_id[client.username]
         client.player_id = player_id
-        self.player_data[player_id][enums.ScoreSheetIndexes.Client.value] = client
-        self.game.add_pending_messages([[enums.CommandsToClient.SetGamePlayerRejoin.value, self.game.game_id, player_id, client.client_id]])
+        self.player_data[player_id][enum_values.ScoreSheetIndexes.Client] = client
+        if self.game.messaging_enabled:
+            self.game.add_pending_messages([[enum_values.CommandsToClient.SetGamePlayerRejoin, self.game.game_id, player_id, client.client_id]])
 
     def leave_game(self, client):
         player_id = client.player_id
         client.player_id = None
-        self.player_data[player_id][enums.ScoreSheetIndexes.Client.value] = None
-        self.game.add_pending_messages([[enums.CommandsToClient.SetGamePlayerLeave.value, self.game.game_id, player_id, client.client_id]])
+        self.player_data[player_id][enum_values.ScoreSheetIndexes.Client] = None
+        if self.game.messaging_enabled:
+            self.game.add_pending_messages([[enum_values.CommandsToClient.SetGamePlayerLeave, self.game.game_id, player_id, client.client_id]])
 
     def is_username_in_game(self, username):
         return username in self.username_to_player_id
@@ -446,15 +675,38 @@ class ScoreSheet:
         return self.username_to_player_id[self.creator_username] if self.creator_username else None
 
     def adjust_player_data(self, player_id, score_sheet_index, adjustment):
-        self.player_data[player_id][score_sheet_index] += adjustment
+        value = self.player_data[player_id][score_sheet_index]
+        self.player_data[player_id][score_sheet_index] = value + adjustment
+        self.version += 1
 
-        if score_sheet_index <= enums.ScoreSheetIndexes.Imperial.value:
+        if score_sheet_index <= enum_values.ScoreSheetIndexes.Imperial:
             self.available[score_sheet_index] -= adjustment
+            share_zobrist_keys = ScoreSheet.share_zobrist_keys[player_id][score_sheet_index]
+            self.zobrist_hash ^= share_zobrist_keys[value] ^ share_zobrist_keys[value + adjustment]
+
+            holders = self.chain_holders[score_sheet_index]
+            if value:
+                holders.remove((value, player_id))
+            if value + adjustment:
+                bisect.insort(holders, (value + adjustment, player_id))
+            price = self.price[score_sheet_index]
+            if price:
+                self.player_data[player_id][enum_values.ScoreSheetIndexes.Net] += adjustment * price
+                self._update_chain_bonuses(score_sheet_index)
+        else:
+            self.zobrist_hash ^= util.get_zobrist_key(3, player_id, score_sheet_index, value) ^ util.get_zobrist_key(3, player_id, score_sheet_index, value + adjustment)
+            self.player_data[player_id][enum_values.ScoreSheetIndexes.Net] += adjustment
 
-        self.game.add_pending_messages([[enums.CommandsToClient.SetScoreSheetCell.value, player_id, score_sheet_index, self.player_data[player_id][score_sheet_index]]], self.game.client_ids)
+        if self.changed_cells is not None:
+            self.changed_cells[(player_id, score_sheet_index)] = value + adjustment
+        elif self.game.messaging_enabled:
+            self.game.add_pending_messages([[enum_values.CommandsToClient.SetScoreSheetCell, player_id, score_sheet_index, self.player_data[player_id][score_sheet_index]]], self.game.client_ids)
 
     def set_chain_size(self, game_board_type_id, chain_size):
+        chain_size_zobrist_keys = ScoreSheet.chain_size_zobrist_keys[game_board_type_id]
+        self.zobrist_hash ^= chain_size_zobrist_keys[self.chain_size[game_board_type_id]] ^ chain_size_zobrist_keys[chain_size]
         self.chain_size[game_board_type_id] = chain_size
+        self.version += 1
 
         old_price = self.price[game_board_type_id]
         if chain_size:
@@ -462,28 +714,82 @@ class ScoreSheet:
                 new_price = min(chain_size, 6)
             else:
                 new_price = min((chain_size - 1) // 10 + 6, 10)
-            if game_board_type_id >= enums.GameBoardTypes.American.value:
+            if game_board_type_id >= enum_values.GameBoardTypes.American:
                 new_price += 1
-            if game_board_type_id >= enums.GameBoardTypes.Continental.value:
+            if game_board_type_id >= enum_values.GameBoardTypes.Continental:
                 new_price += 1
         else:
             new_price = 0
         if new_price != old_price:
             self.price[game_board_type_id] = new_price
-
-        self.game.add_pending_messages([[enums.CommandsToClient.SetScoreSheetCell.value, enums.ScoreSheetRows.ChainSize.value, game_board_type_id, chain_size]], self.game.client_ids)
+            player_data = self.player_data
+            for count, player_id in self.chain_holders[game_board_type_id]:
+                player_data[player_id][enum_values.ScoreSheetIndexes.Net] += count * (new_price - old_price)
+            self._update_chain_bonuses(game_board_type_id)
+
+        if self.changed_cells is not None:
+            self.changed_cells[(enum_values.ScoreSheetRows.ChainSize, game_board_type_id)] = chain_size
+        elif self.game.messaging_enabled:
+            self.game.add_pending_messages([[enum_values.CommandsToClient.SetScoreSheetCell, enum_values.ScoreSheetRows.ChainSize, game_board_type_id, chain_size]], self.game.client_ids)
+
+    def send_changed_cells(self):
+        # one SetScoreSheetCells command with row, index and value of each changed cell
+        changed_cells = self.changed_cells
+        self.changed_cells = None
+        if changed_cells:
+            cells = []
+            for (row, index), value in changed_cells.items():
+                cells.append(row)
+                cells.append(index)
+                cells.append(value)
+            self.game.add_pending_messages([[enum_values.CommandsToClient.SetScoreSheetCells, cells]], self.game.client_ids)
+
+    def clone(self, game):
+        # clients aren't copied, a clone has no connected players
+        client_index = enum_values.ScoreSheetIndexes.Client
+        score_sheet = ScoreSheet.__new__(ScoreSheet)
+        score_sheet.game = game
+        score_sheet.player_data = [player_datum[:client_index] + [None] for player_datum in self.player_data]
+        score_sheet.available = list(self.available)
+        score_sheet.chain_size = list(self.chain_size)
+        score_sheet.price = list(self.price)
+        score_sheet.creator_username = self.creator_username
+        score_sheet.username_to_player_id = dict(self.username_to_player_id)
+        score_sheet.zobrist_hash = self.zobrist_hash
+        score_sheet.version = self.version
+        score_sheet.set_score_sheet_message_version = None
+        score_sheet.set_score_sheet_message = None
+        score_sheet.changed_cells = None
+        score_sheet.chain_holders = [list(holders) for holders in self.chain_holders]
+        score_sheet.chain_bonuses = list(self.chain_bonuses)
+        return score_sheet
+
+    def get_set_score_sheet_message(self):
+        # encoded once per version of the score sheet
+        if self.set_score_sheet_message_version != self.version:
+            score_sheet_data = [
+                [x[:enum_values.ScoreSheetIndexes.Cash + 1] for x in self.player_data],
+                self.chain_size,
+            ]
+            self.set_score_sheet_message = EncodedJson(ujson.dumps([enum_values.CommandsToClient.SetScoreSheet, score_sheet_data]))
+            self.set_score_sheet_message_version = self.version
+        return self.set_score_sheet_message
 
     def get_bonuses(self, game_board_type_id):
         price = self.price[game_board_type_id]
         bonus_first = price * 10
         bonus_second = price * 5
 
-        share_count_to_player_ids = collections.defaultdict(set)
-        for player_id, player_datum in enumerate(self.player_data):
-            share_count = player_datum[game_board_type_id]
-            if share_count:
-                share_count_to_player_ids[share_count].add(player_id)
-        player_id_sets = [x[1] for x in sorted(share_count_to_player_ids.items(), reverse=True)]
+        # holders grouped by share count, largest first
+        player_id_sets = []
+        previous_share_count = None
+        for share_count, player_id in reversed(self.chain_holders[game_board_type_id]):
+            if share_count != previous_share_count:
+                if len(player_id_sets) == 2:
+                    break
+                player_id_sets.append(set())
+                previous_share_count = share_count
+            player_id_sets[-1].add(player_id)
 
         bonus_data = []
 
@@ -506,31 +812,80 @@ class ScoreSheet:
 
         return bonus_data
 
+    def _update_chain_bonuses(self, game_board_type_id):
+        net_index = enum_values.ScoreSheetIndexes.Net
+        player_data = self.player_data
+        for player_ids, bonus in self.chain_bonuses[game_board_type_id]:
+            for player_id in player_ids:
+                player_data[player_id][net_index] -= bonus
+
+        if self.price[game_board_type_id] and self.chain_holders[game_board_type_id]:
+            bonus_data = self.get_bonuses(game_board_type_id)
+            for player_ids, bonus in bonus_data:
+                for player_id in player_ids:
+                    player_data[player_id][net_index] += bonus
+        else:
+            bonus_data = []
+        self.chain_bonuses[game_board_type_id] = bonus_data
+
     def update_net_worths(self):
-        net_worths = []
-        for player_datum in self.player_data:
-            net_worths.append(player_datum[enums.ScoreSheetIndexes.Cash.value])
-        for game_board_type_id, price in enumerate(self.price):
-            if price:
-                for player_id, player_datum in enumerate(self.player_data):
-                    net_worths[player_id] += player_datum[game_board_type_id] * price
-                for player_ids, bonus in self.get_bonuses(game_board_type_id):
-                    for player_id in player_ids:
-                        net_worths[player_id] += bonus
+        # recomputes the Net column and what's kept to update it from scratch
+        net_index = enum_values.ScoreSheetIndexes.Net
+        self.chain_holders = [sorted((player_datum[game_board_type_id], player_id) for player_id, player_datum in enumerate(self.player_data) if player_datum[game_board_type_id]) for game_board_type_id in range(7)]
+        self.chain_bonuses = [[] for game_board_type_id in range(7)]
 
-        for player_id, net_worth in enumerate(net_worths):
-            self.player_data[player_id][enums.ScoreSheetIndexes.Net.value] = net_worth
+        for player_datum in self.player_data:
+            player_datum[net_index] = player_datum[enum_values.ScoreSheetIndexes.Cash] + sum(player_datum[game_board_type_id] * price for game_board_type_id, price in enumerate(self.price))
+        for game_board_type_id in range(7):
+            self._update_chain_bonuses(game_board_type_id)
 
 
 class TileRacks:
+    _border_board_types = [t.value for t in enums.GameBoardTypes if t.value <= enum_values.GameBoardTypes.Imperial] + [enum_values.GameBoardTypes.NothingYet]
+    zobrist_keys = [[[util.get_zobrist_key(2, player_id, tile_index, index) for index in range(108)] for tile_index in range(6)] for player_id in range(6)]
+
     def __init__(self, game):
         self.game = game
         self.racks = []
+        self.zobrist_hash = 0
         for player_id in range(self.game.num_players):
             self.racks.append([None, None, None, None, None, None])
             self.draw_tile(player_id)
+        self.reset_classification()
+
+    def reset_classification(self):
+        # per player: cells changed since the rack was last classified, each tile's type before the neighboring
+        # lonely tile check, and the (can start new chain, safe chains) state it was classified under
+        self.dirty_masks = [GameBoard.all_mask for rack in self.racks]
+        self.base_types = [[None, None, None, None, None, None] for rack in self.racks]
+        self.classification_states = [None for rack in self.racks]
+
+    def clone(self, game):
+        # tile data lists are modified in place, but the tiles and merge border sets inside them are shared
+        tile_racks = TileRacks.__new__(TileRacks)
+        tile_racks.game = game
+        tile_racks.racks = [[list(tile_data) if tile_data else None for tile_data in rack] for rack in self.racks]
+        tile_racks.dirty_masks = list(self.dirty_masks)
+        tile_racks.base_types = [list(base_types) for base_types in self.base_types]
+        tile_racks.classification_states = list(self.classification_states)
+        tile_racks.zobrist_hash = self.zobrist_hash
+        return tile_racks
+
+    def get_zobrist_hash(self):
+        zobrist_hash = 0
+        for player_id, rack in enumerate(self.racks):
+            for tile_index, tile_data in enumerate(rack):
+                if tile_data:
+                    zobrist_hash ^= TileRacks.zobrist_keys[player_id][tile_index][GameBoard.coordinates_to_index[tile_data[0]]]
+        return zobrist_hash
+
+    def mark_cells_changed(self, mask):
+        dirty_masks = self.dirty_masks
+        for player_id, dirty_mask in enumerate(dirty_masks):
+            dirty_masks[player_id] = dirty_mask | mask
 
     def remove_tile(self, player_id, tile_index):
+        self.zobrist_hash ^= TileRacks.zobrist_keys[player_id][tile_index][GameBoard.coordinates_to_index[self.racks[player_id][tile_index][0]]]
         self.racks[player_id][tile_index] = None
 
     def draw_tile(self, player_id):
@@ -540,70 +895,78 @@ class TileRacks:
             if not tile_data:
                 len_tile_bag = len(self.game.tile_bag)
                 if len_tile_bag:
-                    rack[tile_index] = [self.game.tile_bag.pop(), None, len_tile_bag == 1]
+                    tile = self.game.tile_bag.pop()
+                    rack[tile_index] = [tile, None, len_tile_bag == 1]
+                    self.zobrist_hash ^= TileRacks.zobrist_keys[player_id][tile_index][GameBoard.coordinates_to_index[tile]]
 
     def determine_tile_game_board_types(self, player_ids=None):
-        chain_sizes = [len(self.game.game_board.board_type_to_coordinates[t]) for t in range(7)]
+        board_type_masks = self.game.game_board.board_type_masks
+        chain_sizes = [bin(board_type_masks[t]).count('1') for t in range(7)]
         can_start_new_chain = 0 in chain_sizes
-        x_to_y_to_board_type = self.game.game_board.x_to_y_to_board_type
+        classification_state = (can_start_new_chain, tuple(t for t in range(7) if chain_sizes[t] >= 11))
+        coordinates_to_index = GameBoard.coordinates_to_index
+        neighbor_masks = GameBoard.neighbor_masks
+        border_board_types = TileRacks._border_board_types
+        nothing_yet = enum_values.GameBoardTypes.NothingYet
 
         if player_ids is None:
             player_ids = range(len(self.racks))
 
         for player_id in player_ids:
             rack = self.racks[player_id]
+            base_types = self.base_types[player_id]
+
+            if self.classification_states[player_id] == classification_state:
+                dirty_mask = self.dirty_masks[player_id]
+            else:
+                dirty_mask = GameBoard.all_mask
+                self.classification_states[player_id] = classification_state
+            self.dirty_masks[player_id] = 0
 
             old_types = [t[1] if t else None for t in rack]
             new_types = []
             lonely_tile_indexes = []
-            lonely_tile_border_tiles = set()
+            lonely_tile_border_mask = 0
             drew_last_tile = False
             for tile_index, tile_data in enumerate(rack):
                 if tile_data:
-                    x, y = tile_data[0]
                     if tile_data[2] is True:
                         drew_last_tile = True
                         tile_data[2] = False
 
-                    border_tiles = set()
-                    if x:
-                        border_tiles.add((x - 1, y))
-                    if x < 11:
-                        border_tiles.add((x + 1, y))
-                    if y:
-                        border_tiles.add((x, y - 1))
-                    if y < 8:
-                        border_tiles.add((x, y + 1))
-
-                    border_types = {x_to_y_to_board_type[x][y] for x, y in border_tiles}
-                    border_types.discard(enums.GameBoardTypes.Nothing.value)
-                    border_types.discard(enums.GameBoardTypes.CantPlayEver.value)
-                    if len(border_types) > 1:
-                        border_types.discard(enums.GameBoardTypes.NothingYet.value)
-
-                    len_border_types = len(border_types)
-                    new_type = enums.GameBoardTypes.WillPutLonelyTileDown.value
-                    if len_border_types == 0:
-                        lonely_tile_indexes.append(tile_index)
-                        lonely_tile_border_tiles |= border_tiles
-                    elif len_border_types == 1:
-                        if enums.GameBoardTypes.NothingYet.value in border_types:
-                            if can_start_new_chain:
-                                new_type = enums.GameBoardTypes.WillFormNewChain.value
+                    border_mask = neighbor_masks[coordinates_to_index[tile_data[0]]]
+                    if tile_data[1] is None or border_mask & dirty_mask:
+                        border_types = {t for t in border_board_types if board_type_masks[t] & border_mask}
+                        if len(border_types) > 1:
+                            border_types.discard(nothing_yet)
+
+                        len_border_types = len(border_types)
+                        new_type = enum_values.GameBoardTypes.WillPutLonelyTileDown
+                        if len_border_types == 1:
+                            if nothing_yet in border_types:
+                                if can_start_new_chain:
+                                    new_type = enum_values.GameBoardTypes.WillFormNewChain
+                                else:
+                                    new_type = enum_values.GameBoardTypes.CantPlayNow
+                            else:
+                                new_type = border_types.pop()
+                        elif len_border_types > 1:
+                            safe_count = 0
+                            for border_type in border_types:
+                                if chain_sizes[border_type] >= 11:
+                                    safe_count += 1
+                            if safe_count < 2:
+                                new_type = enum_values.GameBoardTypes.WillMergeChains
+                                tile_data[2] = border_types
                             else:
-                                new_type = enums.GameBoardTypes.CantPlayNow.value
-                        else:
-                            new_type = border_types.pop()
-                    elif len_border_types > 1:
-                        safe_count = 0
-                        for border_type in border_types:
-                            if chain_sizes[border_type] >= 11:
-                                safe_count += 1
-                        if safe_count < 2:
-                            new_type = enums.GameBoardTypes.WillMergeChains.value
-                            tile_data[2] = border_types
-                        else:
-                            new_type = enums.GameBoardTypes.CantPlayEver.value
+                                new_type = enum_values.GameBoardTypes.CantPlayEver
+                        base_types[tile_index] = new_type
+                    else:
+                        new_type = base_types[tile_index]
+
+                    if new_type == enum_values.GameBoardTypes.WillPutLonelyTileDown:
+                        lonely_tile_indexes.append(tile_index)
+                        lonely_tile_border_mask |= border_mask
                 else:
                     new_type = None
 
@@ -611,30 +974,33 @@ class TileRacks:
 
             if can_start_new_chain:
                 for tile_index in lonely_tile_indexes:
-                    if rack[tile_index][0] in lonely_tile_border_tiles:
-                        new_types[tile_index] = enums.GameBoardTypes.HaveNeighboringTileToo.value
+                    if (lonely_tile_border_mask >> coordinates_to_index[rack[tile_index][0]]) & 1:
+                        new_types[tile_index] = enum_values.GameBoardTypes.HaveNeighboringTileToo
 
             for tile_index, tile_data in enumerate(rack):
                 if tile_data:
                     tile_data[1] = new_types[tile_index]
 
-            client = self.game.score_sheet.player_data[player_id][enums.ScoreSheetIndexes.Client.value]
-            client_ids = {client.client_id} if client else None
+            if self.game.messaging_enabled:
+                client = self.game.score_sheet.player_data[player_id][enum_values.ScoreSheetIndexes.Client]
+                client_ids = {client.client_id} if client else None
+            else:
+                client_ids = None
 
             for tile_index, old_type in enumerate(old_types):
                 new_type = new_types[tile_index]
                 if new_type != old_type:
                     if old_type is None:
                         x, y = rack[tile_index][0]
-                        self.game.add_history_message(enums.GameHistoryMessages.DrewTile.value, player_id, x, y, player_id=player_id)
+                        self.game.add_history_message(enum_values.GameHistoryMessages.DrewTile, player_id, x, y, player_id=player_id)
                         if client_ids:
-                            self.game.add_pending_messages([[enums.CommandsToClient.SetTile.value, tile_index, x, y, new_type]], client_ids)
+                            self.game.add_pending_messages([[enum_values.CommandsToClient.SetTile, tile_index, x, y, new_type]], client_ids)
                     else:
                         if client_ids:
-                            self.game.add_pending_messages([[enums.CommandsToClient.SetTileGameBoardType.value, tile_index, new_type]], client_ids)
+                            self.game.add_pending_messages([[enum_values.CommandsToClient.SetTileGameBoardType, tile_index, new_type]], client_ids)
 
             if drew_last_tile:
-                self.game.add_history_message(enums.GameHistoryMessages.DrewLastTile.value, player_id)
+                self.game.add_history_message(enum_values.GameHistoryMessages.DrewLastTile, player_id)
 
     def replace_dead_tiles(self, player_id):
         rack = self.racks[player_id]
@@ -642,19 +1008,20 @@ class TileRacks:
         while replaced_a_dead_tile:
             replaced_a_dead_tile = False
             for tile_index, tile_data in enumerate(rack):
-                if tile_data and tile_data[1] == enums.GameBoardTypes.CantPlayEver.value:
+                if tile_data and tile_data[1] == enum_values.GameBoardTypes.CantPlayEver:
                     # remove tile from player's tile rack
-                    rack[tile_index] = None
-                    client = self.game.score_sheet.player_data[player_id][enums.ScoreSheetIndexes.Client.value]
-                    if client:
-                        self.game.add_pending_messages([[enums.CommandsToClient.RemoveTile.value, tile_index]], {client.client_id})
+                    self.remove_tile(player_id, tile_index)
+                    if self.game.messaging_enabled:
+                        client = self.game.score_sheet.player_data[player_id][enum_values.ScoreSheetIndexes.Client]
+                        if client:
+                            self.game.add_pending_messages([[enum_values.CommandsToClient.RemoveTile, tile_index]], {client.client_id})
 
                     # mark cell on game board as can't play ever
                     tile = tile_data[0]
-                    self.game.game_board.set_cell(tile, enums.GameBoardTypes.CantPlayEver.value)
+                    self.game.game_board.set_cell(tile, enum_values.GameBoardTypes.CantPlayEver)
 
                     # tell everybody that a dead tile was replaced
-                    self.game.add_history_message(enums.GameHistoryMessages.ReplacedDeadTile.value, player_id, tile[0], tile[1])
+                    self.game.add_history_message(enum_values.GameHistoryMessages.ReplacedDeadTile, player_id, tile[0], tile[1])
 
                     # draw new tile
                     self.draw_tile(player_id)
@@ -684,21 +1051,54 @@ class Action:
     def prepare(self):
         pass
 
+    def get_legal_data(self):
+        return []
+
+    def clone(self, game, memo):
+        # actions share sets (chains still to dispose of) with each other, so copies go through memo to keep that
+        action = self.__class__.__new__(self.__class__)
+        action.__dict__ = dict(self.__dict__)
+        action.game = game
+        for key, value in action.__dict__.items():
+            if type(value) is list or type(value) is set:
+                action.__dict__[key] = Action._clone_value(value, memo)
+        return action
+
+    @staticmethod
+    def _clone_value(value, memo):
+        value_type = type(value)
+        if value_type is not list and value_type is not set:
+            return value
+
+        value_id = id(value)
+        cloned_value = memo.get(value_id)
+        if cloned_value is None:
+            if value_type is list:
+                cloned_value = [Action._clone_value(x, memo) for x in value]
+            else:
+                cloned_value = set(value)
+            memo[value_id] = cloned_value
+        return cloned_value
+
     def send_message(self, client_ids):
-        self.game.add_pending_messages([[enums.CommandsToClient.SetGameAction.value, self.game_action_id, self.player_id] + self.additional_params], client_ids)
+        if self.game.messaging_enabled:
+            self.game.add_pending_messages([[enum_values.CommandsToClient.SetGameAction, self.game_action_id, self.player_id] + self.additional_params], client_ids)
 
 
 class ActionStartGame(Action):
     def __init__(self, game, player_id):
-        super().__init__(game, player_id, enums.GameActions.StartGame.value)
+        super().__init__(game, player_id, enum_values.GameActions.StartGame)
+
+    def get_legal_data(self):
+        return [[]]
 
     def execute(self):
-        self.game.add_history_message(enums.GameHistoryMessages.StartedGame.value, self.player_id)
+        self.game.add_history_message(enum_values.GameHistoryMessages.StartedGame, self.player_id)
 
-        if self.game.mode == enums.GameModes.Teams.value and self.game.num_players < 4:
-            self.game.set_state(enums.GameStates.InProgress.value, enums.GameModes.Singles.value)
+        if self.game.mode == enum_values.GameModes.Teams and self.game.num_players < 4:
+            self.game.set_state(enum_values.GameStates.InProgress, enum_values.GameModes.Singles)
         else:
-            self.game.set_state(enums.GameStates.InProgress.value)
+            self.game.set_state(enum_values.GameStates.InProgress)
 
         self.game.tile_racks = TileRacks(self.game)
         self.game.tile_racks.determine_tile_game_board_types()
@@ -708,17 +1108,18 @@ class ActionStartGame(Action):
 
 class ActionPlayTile(Action):
     def __init__(self, game, player_id):
-        super().__init__(game, player_id, enums.GameActions.PlayTile.value)
+        super().__init__(game, player_id, enum_values.GameActions.PlayTile)
 
     def prepare(self):
         self.game.turn_player_id = self.player_id
 
-        self.game.add_pending_messages([[enums.CommandsToClient.SetTurn.value, self.player_id]], self.game.client_ids)
-        self.game.add_history_message(enums.GameHistoryMessages.TurnBegan.value, self.player_id)
+        if self.game.messaging_enabled:
+            self.game.add_pending_messages([[enum_values.CommandsToClient.SetTurn, self.player_id]], self.game.client_ids)
+        self.game.add_history_message(enum_values.GameHistoryMessages.TurnBegan, self.player_id)
 
         has_a_playable_tile = False
         for tile_data in self.game.tile_racks.racks[self.player_id]:
-            if tile_data and tile_data[1] != enums.GameBoardTypes.CantPlayNow.value and tile_data[1] != enums.GameBoardTypes.CantPlayEver.value:
+            if ActionPlayTile._is_playable(tile_data):
                 has_a_playable_tile = True
                 break
 
@@ -726,9 +1127,16 @@ class ActionPlayTile(Action):
             self.game.turns_without_played_tiles_count = 0
         else:
             self.game.turns_without_played_tiles_count += 1
-            self.game.add_history_message(enums.GameHistoryMessages.HasNoPlayableTile.value, self.player_id)
+            self.game.add_history_message(enum_values.GameHistoryMessages.HasNoPlayableTile, self.player_id)
             return True
 
+    @staticmethod
+    def _is_playable(tile_data):
+        return tile_data and tile_data[1] != enum_values.GameBoardTypes.CantPlayNow and tile_data[1] != enum_values.GameBoardTypes.CantPlayEver
+
+    def get_legal_data(self):
+        return [[tile_index] for tile_index, tile_data in enumerate(self.game.tile_racks.racks[self.player_id]) if ActionPlayTile._is_playable(tile_data)]
+
     def execute(self, tile_index):
         if not isinstance(tile_index, int):
             return
@@ -736,34 +1144,34 @@ class ActionPlayTile(Action):
         if tile_index < 0 or tile_index >= len(rack):
             return
         tile_data = rack[tile_index]
-        if not tile_data:
+        if not ActionPlayTile._is_playable(tile_data):
             return
 
         tile, game_board_type_id, borders = tile_data
         retval = True
 
-        if game_board_type_id <= enums.GameBoardTypes.Imperial.value:
+        if game_board_type_id <= enum_values.GameBoardTypes.Imperial:
             self.game.game_board.fill_cells(tile, game_board_type_id)
-            self.game.score_sheet.set_chain_size(game_board_type_id, len(self.game.game_board.board_type_to_coordinates[game_board_type_id]))
-        elif game_board_type_id == enums.GameBoardTypes.WillPutLonelyTileDown.value or game_board_type_id == enums.GameBoardTypes.HaveNeighboringTileToo.value:
-            self.game.game_board.set_cell(tile, enums.GameBoardTypes.NothingYet.value)
-        elif game_board_type_id == enums.GameBoardTypes.WillFormNewChain.value:
+            self.game.score_sheet.set_chain_size(game_board_type_id, self.game.game_board.get_component_size(tile))
+        elif game_board_type_id == enum_values.GameBoardTypes.WillPutLonelyTileDown or game_board_type_id == enum_values.GameBoardTypes.HaveNeighboringTileToo:
+            self.game.game_board.set_cell(tile, enum_values.GameBoardTypes.NothingYet)
+        elif game_board_type_id == enum_values.GameBoardTypes.WillFormNewChain:
             retval = [ActionSelectNewChain(self.game, self.player_id, [index for index, size in enumerate(self.game.score_sheet.chain_size) if size == 0], tile)]
-        elif game_board_type_id == enums.GameBoardTypes.WillMergeChains.value:
+        elif game_board_type_id == enum_values.GameBoardTypes.WillMergeChains:
             retval = [ActionSelectMergerSurvivor(self.game, self.player_id, borders, tile)]
         else:
             return
 
         self.game.tile_racks.remove_tile(self.player_id, tile_index)
 
-        self.game.add_history_message(enums.GameHistoryMessages.PlayedTile.value, self.player_id, tile[0], tile[1])
+        self.game.add_history_message(enum_values.GameHistoryMessages.PlayedTile, self.player_id, tile[0], tile[1])
 
         return retval
 
 
 class ActionSelectNewChain(Action):
     def __init__(self, game, player_id, game_board_type_ids, tile):
-        super().__init__(game, player_id, enums.GameActions.SelectNewChain.value)
+        super().__init__(game, player_id, enum_values.GameActions.SelectNewChain)
         self.game_board_type_ids = game_board_type_ids
         self.additional_params.append(game_board_type_ids)
         self.tile = tile
@@ -772,49 +1180,56 @@ class ActionSelectNewChain(Action):
         if len(self.game_board_type_ids) == 1:
             return self._create_new_chain(self.game_board_type_ids[0])
         else:
-            self.game.game_board.set_cell(self.tile, enums.GameBoardTypes.NothingYet.value)
+            self.game.game_board.set_cell(self.tile, enum_values.GameBoardTypes.NothingYet)
             self.game.tile_racks.determine_tile_game_board_types()
 
+    def get_legal_data(self):
+        return [[game_board_type_id] for game_board_type_id in self.game_board_type_ids]
+
     def execute(self, game_board_type_id):
         if game_board_type_id in self.game_board_type_ids:
             return self._create_new_chain(game_board_type_id)
 
     def _create_new_chain(self, game_board_type_id):
         self.game.game_board.fill_cells(self.tile, game_board_type_id)
-        self.game.score_sheet.set_chain_size(game_board_type_id, len(self.game.game_board.board_type_to_coordinates[game_board_type_id]))
+        self.game.score_sheet.set_chain_size(game_board_type_id, self.game.game_board.get_component_size(self.tile))
         if self.game.score_sheet.available[game_board_type_id]:
             self.game.score_sheet.adjust_player_data(self.player_id, game_board_type_id, 1)
 
-        self.game.add_history_message(enums.GameHistoryMessages.FormedChain.value, self.player_id, game_board_type_id)
+        self.game.add_history_message(enum_values.GameHistoryMessages.FormedChain, self.player_id, game_board_type_id)
 
         return True
 
 
 class ActionSelectMergerSurvivor(Action):
     def __init__(self, game, player_id, type_ids, tile):
-        super().__init__(game, player_id, enums.GameActions.SelectMergerSurvivor.value)
+        super().__init__(game, player_id, enum_values.GameActions.SelectMergerSurvivor)
         self.type_ids = type_ids
         self.tile = tile
 
+        chain_sizes = self.game.game_board.get_neighboring_chain_sizes(tile)
         chain_size_to_type_ids = collections.defaultdict(set)
         for type_id in type_ids:
-            chain_size_to_type_ids[self.game.score_sheet.chain_size[type_id]].add(type_id)
+            chain_size_to_type_ids[chain_sizes[type_id]].add(type_id)
         self.type_id_sets = [x[1] for x in sorted(chain_size_to_type_ids.items(), reverse=True)]
 
     def prepare(self):
-        self.game.add_history_message(enums.GameHistoryMessages.MergedChains.value, self.player_id, sorted(self.type_ids))
+        self.game.add_history_message(enum_values.GameHistoryMessages.MergedChains, self.player_id, sorted(self.type_ids))
 
         largest_type_ids = self.type_id_sets[0]
         if len(largest_type_ids) == 1:
             return self._prepare_next_actions(largest_type_ids.pop())
         else:
-            self.game.game_board.set_cell(self.tile, enums.GameBoardTypes.NothingYet.value)
+            self.game.game_board.set_cell(self.tile, enum_values.GameBoardTypes.NothingYet)
             self.game.tile_racks.determine_tile_game_board_types()
             self.additional_params.append(sorted(largest_type_ids))
 
+    def get_legal_data(self):
+        return [[type_id] for type_id in sorted(self.type_id_sets[0])]
+
     def execute(self, type_id):
         if type_id in self.type_id_sets[0]:
-            self.game.add_history_message(enums.GameHistoryMessages.SelectedMergerSurvivor.value, self.player_id, type_id)
+            self.game.add_history_message(enum_values.GameHistoryMessages.SelectedMergerSurvivor, self.player_id, type_id)
 
             return self._prepare_next_actions(type_id)
 
@@ -822,7 +1237,7 @@ class ActionSelectMergerSurvivor(Action):
         self.type_id_sets[0].discard(controlling_type_id)
 
         self.game.game_board.fill_cells(self.tile, controlling_type_id)
-        self.game.score_sheet.set_chain_size(controlling_type_id, len(self.game.game_board.board_type_to_coordinates[controlling_type_id]))
+        self.game.score_sheet.set_chain_size(controlling_type_id, self.game.game_board.get_component_size(self.tile))
         self.game.tile_racks.determine_tile_game_board_types()
 
         # pay bonuses
@@ -834,10 +1249,10 @@ class ActionSelectMergerSurvivor(Action):
             for player_ids, bonus in self.game.score_sheet.get_bonuses(type_id):
                 for player_id in sorted(player_ids):
                     bonuses[player_id] += bonus
-                    self.game.add_history_message(enums.GameHistoryMessages.ReceivedBonus.value, player_id, type_id, bonus)
+                    self.game.add_history_message(enum_values.GameHistoryMessages.ReceivedBonus, player_id, type_id, bonus)
         for player_id, bonus in enumerate(bonuses):
             if bonus:
-                self.game.score_sheet.adjust_player_data(player_id, enums.ScoreSheetIndexes.Cash.value, bonus)
+                self.game.score_sheet.adjust_player_data(player_id, enum_values.ScoreSheetIndexes.Cash, bonus)
 
         actions = []
         for type_id_set in self.type_id_sets:
@@ -849,7 +1264,7 @@ class ActionSelectMergerSurvivor(Action):
 
 class ActionSelectChainToDisposeOfNext(Action):
     def __init__(self, game, player_id, defunct_type_ids, controlling_type_id):
-        super().__init__(game, player_id, enums.GameActions.SelectChainToDisposeOfNext.value)
+        super().__init__(game, player_id, enum_values.GameActions.SelectChainToDisposeOfNext)
         self.defunct_type_ids = defunct_type_ids
         self.controlling_type_id = controlling_type_id
 
@@ -859,9 +1274,12 @@ class ActionSelectChainToDisposeOfNext(Action):
         else:
             self.additional_params.append(sorted(self.defunct_type_ids))
 
+    def get_legal_data(self):
+        return [[type_id] for type_id in sorted(self.defunct_type_ids)]
+
     def execute(self, type_id):
         if type_id in self.defunct_type_ids:
-            self.game.add_history_message(enums.GameHistoryMessages.SelectedChainToDisposeOfNext.value, self.player_id, type_id)
+            self.game.add_history_message(enum_values.GameHistoryMessages.SelectedChainToDisposeOfNext, self.player_id, type_id)
 
             return self._prepare_next_actions(type_id)
 
@@ -882,7 +1300,7 @@ class ActionSelectChainToDisposeOfNext(Action):
 
 class ActionDisposeOfShares(Action):
     def __init__(self, game, player_id, defunct_type_id, controlling_type_id):
-        super().__init__(game, player_id, enums.GameActions.DisposeOfShares.value)
+        super().__init__(game, player_id, enum_values.GameActions.DisposeOfShares)
         self.defunct_type_id = defunct_type_id
         self.controlling_type_id = controlling_type_id
         self.defunct_type_count = self.game.score_sheet.player_data[self.player_id][self.defunct_type_id]
@@ -893,8 +1311,18 @@ class ActionDisposeOfShares(Action):
     def prepare(self):
         self.controlling_type_available = self.game.score_sheet.available[self.controlling_type_id]
 
+    def _get_max_trade_amount(self):
+        return min(self.defunct_type_count, self.controlling_type_available * 2) // 2 * 2
+
+    def get_legal_data(self):
+        data = []
+        for trade_amount in range(0, self._get_max_trade_amount() + 1, 2):
+            for sell_amount in range(self.defunct_type_count - trade_amount + 1):
+                data.append([trade_amount, sell_amount])
+        return data
+
     def execute(self, trade_amount, sell_amount):
-        if not isinstance(trade_amount, int) or trade_amount < 0 or trade_amount % 2 != 0 or trade_amount // 2 > self.controlling_type_available:
+        if not isinstance(trade_amount, int) or trade_amount < 0 or trade_amount % 2 != 0 or trade_amount > self._get_max_trade_amount():
             return
         if not isinstance(sell_amount, int) or sell_amount < 0:
             return
@@ -907,16 +1335,16 @@ class ActionDisposeOfShares(Action):
                 self.game.score_sheet.adjust_player_data(self.player_id, self.controlling_type_id, trade_amount // 2)
             if sell_amount:
                 sale_price = self.game.score_sheet.price[self.defunct_type_id] * sell_amount
-                self.game.score_sheet.adjust_player_data(self.player_id, enums.ScoreSheetIndexes.Cash.value, sale_price)
+                self.game.score_sheet.adjust_player_data(self.player_id, enum_values.ScoreSheetIndexes.Cash, sale_price)
 
-        self.game.add_history_message(enums.GameHistoryMessages.DisposedOfShares.value, self.player_id, self.defunct_type_id, trade_amount, sell_amount)
+        self.game.add_history_message(enum_values.GameHistoryMessages.DisposedOfShares, self.player_id, self.defunct_type_id, trade_amount, sell_amount)
 
         return True
 
 
 class ActionPurchaseShares(Action):
     def __init__(self, game, player_id):
-        super().__init__(game, player_id, enums.GameActions.PurchaseShares.value)
+        super().__init__(game, player_id, enum_values.GameActions.PurchaseShares)
         self.can_not_afford_any_shares = False
         self.can_end_game = False
         self.end_game = False
@@ -931,7 +1359,7 @@ class ActionPurchaseShares(Action):
         existing_chain_sizes = []
         shares_available = False
         can_purchase_shares = False
-        cash = self.game.score_sheet.player_data[self.player_id][enums.ScoreSheetIndexes.Cash.value]
+        cash = self.game.score_sheet.player_data[self.player_id][enum_values.ScoreSheetIndexes.Cash]
         for chain_size, available, price in zip(self.game.score_sheet.chain_size, self.game.score_sheet.available, self.game.score_sheet.price):
             if chain_size:
                 existing_chain_sizes.append(chain_size)
@@ -944,9 +1372,34 @@ class ActionPurchaseShares(Action):
 
         if not can_purchase_shares and not self.can_end_game:
             if self.can_not_afford_any_shares:
-                self.game.add_history_message(enums.GameHistoryMessages.CouldNotAffordAnyShares.value, self.player_id)
+                self.game.add_history_message(enum_values.GameHistoryMessages.CouldNotAffordAnyShares, self.player_id)
             return self._complete_action()
 
+    def _get_cost(self, game_board_type_id_to_count):
+        cost = 0
+        for game_board_type_id, count in game_board_type_id_to_count.items():
+            if self.game.score_sheet.chain_size[game_board_type_id] and count <= self.game.score_sheet.available[game_board_type_id]:
+                cost += self.game.score_sheet.price[game_board_type_id] * count
+            else:
+                return None
+        if cost > self.game.score_sheet.player_data[self.player_id][enum_values.ScoreSheetIndexes.Cash]:
+            return None
+        return cost
+
+    def get_legal_data(self):
+        score_sheet = self.game.score_sheet
+        cash = score_sheet.player_data[self.player_id][enum_values.ScoreSheetIndexes.Cash]
+        type_ids = [type_id for type_id in range(7) if score_sheet.chain_size[type_id] and score_sheet.available[type_id] and score_sheet.price[type_id] <= cash]
+
+        end_games = [0, 1] if self.can_end_game else [0]
+        data = []
+        for count in range(4):
+            for game_board_type_ids in itertools.combinations_with_replacement(type_ids, count):
+                if self._get_cost(collections.Counter(game_board_type_ids)) is not None:
+                    for end_game in end_games:
+                        data.append([list(game_board_type_ids), end_game])
+        return data
+
     def execute(self, game_board_type_ids, end_game):
         if end_game != 0 and end_game != 1:
             return
@@ -959,24 +1412,19 @@ class ActionPurchaseShares(Action):
             else:
                 return
 
-        cost = 0
-        for game_board_type_id, count in game_board_type_id_to_count.items():
-            if self.game.score_sheet.chain_size[game_board_type_id] and count <= self.game.score_sheet.available[game_board_type_id]:
-                cost += self.game.score_sheet.price[game_board_type_id] * count
-            else:
-                return
-        if cost > self.game.score_sheet.player_data[self.player_id][enums.ScoreSheetIndexes.Cash.value]:
+        cost = self._get_cost(game_board_type_id_to_count)
+        if cost is None:
             return
 
         if cost:
             for game_board_type_id, count in game_board_type_id_to_count.items():
                 self.game.score_sheet.adjust_player_data(self.player_id, game_board_type_id, count)
-            self.game.score_sheet.adjust_player_data(self.player_id, enums.ScoreSheetIndexes.Cash.value, -cost)
+            self.game.score_sheet.adjust_player_data(self.player_id, enum_values.ScoreSheetIndexes.Cash, -cost)
 
         if self.can_not_afford_any_shares:
-            self.game.add_history_message(enums.GameHistoryMessages.CouldNotAffordAnyShares.value, self.player_id)
+            self.game.add_history_message(enum_values.GameHistoryMessages.CouldNotAffordAnyShares, self.player_id)
         else:
-            self.game.add_history_message(enums.GameHistoryMessages.PurchasedShares.value, self.player_id, sorted(list(x) for x in game_board_type_id_to_count.items()))
+            self.game.add_history_message(enum_values.GameHistoryMessages.PurchasedShares, self.player_id, sorted(list(x) for x in game_board_type_id_to_count.items()))
 
         if end_game and self.can_end_game:
             self.end_game = True
@@ -989,11 +1437,11 @@ class ActionPurchaseShares(Action):
 
         if self.end_game or all_tiles_played or no_tiles_played_for_entire_round:
             if self.end_game:
-                self.game.add_history_message(enums.GameHistoryMessages.EndedGame.value, self.player_id)
+                self.game.add_history_message(enum_values.GameHistoryMessages.EndedGame, self.player_id)
             elif all_tiles_played:
-                self.game.add_history_message(enums.GameHistoryMessages.AllTilesPlayed.value, None)
+                self.game.add_history_message(enum_values.GameHistoryMessages.AllTilesPlayed, None)
             elif no_tiles_played_for_entire_round:
-                self.game.add_history_message(enums.GameHistoryMessages.NoTilesPlayedForEntireRound.value, None)
+                self.game.add_history_message(enum_values.GameHistoryMessages.NoTilesPlayedForEntireRound, None)
 
             return [ActionGameOver(self.game)]
         else:
@@ -1003,7 +1451,7 @@ class ActionPurchaseShares(Action):
 
             all_tiles_played = self.game.tile_racks.are_racks_empty()
             if all_tiles_played:
-                self.game.add_history_message(enums.GameHistoryMessages.AllTilesPlayed.value, None)
+                self.game.add_history_message(enum_values.GameHistoryMessages.AllTilesPlayed, None)
                 return [ActionGameOver(self.game)]
 
             next_player_id = (self.player_id + 1) % self.game.num_players
@@ -1012,20 +1460,108 @@ class ActionPurchaseShares(Action):
 
 class ActionGameOver(Action):
     def __init__(self, game):
-        super().__init__(game, None, enums.GameActions.GameOver.value)
+        super().__init__(game, None, enum_values.GameActions.GameOver)
         game.turn_player_id = None
-        game.add_pending_messages([[enums.CommandsToClient.SetTurn.value, None]], game.client_ids)
-        game.set_state(enums.GameStates.Completed.value)
+        if game.messaging_enabled:
+            game.add_pending_messages([[enum_values.CommandsToClient.SetTurn, None]], game.client_ids)
+        game.set_state(enum_values.GameStates.Completed)
+
+
+class GameHistory:
+    # list-like store of [target player_id, data] history messages. data of only small ints is kept in fixed width
+    # records, anything else (usernames, None, lists) as json in the overflow table.
+    record_width = 5
+    # indexed by data length
+    _paddings = [array.array('h', [0] * padding_length) for padding_length in range(record_width, -1, -1)]
+    _no_target = 255
+
+    def __init__(self, entries=()):
+        self.records = array.array('h')
+        self.lengths = bytearray()
+        self.targets = bytearray()
+        self.index_to_overflow_json = {}
+        self.target_to_indexes = {}
+
+        for player_id, data in entries:
+            self.append(player_id, data)
+
+    def append(self, player_id, data):
+        index = len(self.targets)
+        records = self.records
+        length = len(data)
+        try:
+            if length > GameHistory.record_width:
+                raise TypeError
+            records.extend(data)
+            records.extend(GameHistory._paddings[length])
+            self.lengths.append(length)
+        except (TypeError, OverflowError):
+            del records[index * GameHistory.record_width:]
+            records.extend(GameHistory._paddings[0])
+            self.lengths.append(0)
+            self.index_to_overflow_json[index] = ujson.dumps(data)
+
+        self.targets.append(GameHistory._no_target if player_id is None else player_id)
+        indexes = self.target_to_indexes.get(player_id)
+        if indexes is None:
+            indexes = array.array('H')
+            self.target_to_indexes[player_id] = indexes
+        indexes.append(index)
+
+    def _get_data(self, index):
+        data_json = self.index_to_overflow_json.get(index)
+        if data_json is not None:
+            return ujson.loads(data_json)
+        start = index * GameHistory.record_width
+        return self.records[start:start + self.lengths[index]].tolist()
+
+    def _get_entry(self, index):
+        target = self.targets[index]
+        return [None if target == GameHistory._no_target else target, self._get_data(index)]
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __iter__(self):
+        for index in range(len(self.targets)):
+            yield self._get_entry(index)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self._get_entry(index) for index in range(len(self.targets))[key]]
+        return self._get_entry(range(len(self.targets))[key])
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def get_view(self, player_id):
+        # data of the messages player_id sees, in order. watchers see only the ones without a target.
+        indexes = self.target_to_indexes.get(None, ())
+        if player_id is not None:
+            indexes = heapq.merge(indexes, self.target_to_indexes.get(player_id, ()))
+        for index in indexes:
+            yield self._get_data(index)
+
+    def clone(self):
+        game_history = GameHistory.__new__(GameHistory)
+        game_history.records = array.array('h', self.records)
+        game_history.lengths = bytearray(self.lengths)
+        game_history.targets = bytearray(self.targets)
+        game_history.index_to_overflow_json = dict(self.index_to_overflow_json)
+        game_history.target_to_indexes = {target: array.array('H', indexes) for target, indexes in self.target_to_indexes.items()}
+        return game_history
 
 
 class Game:
     def __init__(self, game_id, internal_game_id, mode, max_players, add_pending_messages, logging_enabled=True, tile_bag=None):
         self.game_id = game_id
         self.internal_game_id = internal_game_id
-        self.state = enums.GameStates.Starting.value
+        self.state = enum_values.GameStates.Starting
         self.mode = mode
-        self.max_players = max_players if mode == enums.GameModes.Singles.value else 4
+        self.max_players = max_players if mode == enum_values.GameModes.Singles else 4
         self.add_pending_messages = add_pending_messages
+        # without add_pending_messages, the game only applies the rules and builds no client messages
+        self.messaging_enabled = add_pending_messages is not None
         self.logging_enabled = logging_enabled
         self.num_players = 0
         self.client_ids = set()
@@ -1044,7 +1580,11 @@ class Game:
         self.actions = []
         self.turn_player_id = None
         self.turns_without_played_tiles_count = 0
-        self.history_messages = []
+        self.history_messages = GameHistory()
+        # player_id (None for watchers) to [encoded history messages, their encoded list or None]. a view is built on
+        # its first request and then kept up to date by add_history_message. cleared when players join, since that
+        # changes player ids.
+        self.player_id_to_history_messages_json = {}
         self.expiration_time = None
 
         self.log_data_overrides = {}
@@ -1052,16 +1592,17 @@ class Game:
         self.set_state(self.state, self.mode, self.max_players)
 
     def join_game(self, client):
-        if self.state == enums.GameStates.Starting.value and not self.score_sheet.is_username_in_game(client.username):
+        if self.state == enum_values.GameStates.Starting and not self.score_sheet.is_username_in_game(client.username):
             self.num_players += 1
             client.game_id = self.game_id
             self.client_ids.add(client.client_id)
             position_tile = self.tile_bag.pop()
             previous_creator_player_id = self.score_sheet.get_creator_player_id()
             self.score_sheet.join_game(client, position_tile)
+            self.player_id_to_history_messages_json.clear()
             self._send_past_history_messages(client)
-            self.game_board.set_cell(position_tile, enums.GameBoardTypes.NothingYet.value)
-            self.add_history_message(enums.GameHistoryMessages.DrewPositionTile.value, client.username, position_tile[0], position_tile[1])
+            self.game_board.set_cell(position_tile, enum_values.GameBoardTypes.NothingYet)
+            self.add_history_message(enum_values.GameHistoryMessages.DrewPositionTile, client.username, position_tile[0], position_tile[1])
             creator_player_id = self.score_sheet.get_creator_player_id()
             if creator_player_id != previous_creator_player_id:
                 del self.actions[:]
@@ -1070,7 +1611,7 @@ class Game:
             else:
                 self.actions[-1].send_message({client.client_id})
             if self.num_players == self.max_players:
-                self.set_state(enums.GameStates.StartingFull.value)
+                self.set_state(enum_values.GameStates.StartingFull)
             self.expiration_time = None
 
     def rejoin_game(self, client):
@@ -1087,7 +1628,8 @@ class Game:
             client.game_id = self.game_id
             self.client_ids.add(client.client_id)
             self.watcher_client_ids.add(client.client_id)
-            self.add_pending_messages([[enums.CommandsToClient.SetGameWatcherClientId.value, self.game_id, client.client_id]])
+            if self.messaging_enabled:
+                self.add_pending_messages([[enum_values.CommandsToClient.SetGameWatcherClientId, self.game_id, client.client_id]])
             self._send_initialization_messages(client)
             self._send_past_history_messages(client)
             self.expiration_time = None
@@ -1098,7 +1640,8 @@ class Game:
             self.client_ids.discard(client.client_id)
             if client.client_id in self.watcher_client_ids:
                 self.watcher_client_ids.discard(client.client_id)
-                self.add_pending_messages([[enums.CommandsToClient.ReturnWatcherToLobby.value, self.game_id, client.client_id]])
+                if self.messaging_enabled:
+                    self.add_pending_messages([[enum_values.CommandsToClient.ReturnWatcherToLobby, self.game_id, client.client_id]])
             else:
                 self.score_sheet.leave_game(client)
             if not self.client_ids:
@@ -1107,117 +1650,207 @@ class Game:
     def do_game_action(self, client, game_action_id, data):
         action = self.actions[-1]
         if client.player_id is not None and client.player_id == action.player_id and game_action_id == action.game_action_id:
-            new_actions = action.execute(*data)
-            while new_actions:
-                self.actions.pop()
-                if isinstance(new_actions, list):
-                    new_actions.reverse()
-                    self.actions.extend(new_actions)
-                action = self.actions[-1]
-                new_actions = action.prepare()
+            len_history_messages = len(self.history_messages)
+            if self.messaging_enabled:
+                self.score_sheet.changed_cells = {}
+            try:
+                new_actions = action.execute(*data)
+                while new_actions:
+                    self.actions.pop()
+                    if isinstance(new_actions, list):
+                        new_actions.reverse()
+                        self.actions.extend(new_actions)
+                    action = self.actions[-1]
+                    new_actions = action.prepare()
+            finally:
+                # also when an action raises, so cells changed before that still reach clients and later changes
+                # aren't collected here
+                if self.messaging_enabled:
+                    self.score_sheet.send_changed_cells()
             action.send_message(self.client_ids)
 
-    def set_state(self, state, mode=None, max_players=None):
+            if self.logging_enabled and settings.server__game__log_state_hashes:
+                turn_began_id = enum_values.GameHistoryMessages.TurnBegan
+                for player_id, message in self.history_messages[len_history_messages:]:
+                    if message[0] == turn_began_id:
+                        self._log_state_hash()
+                        break
+
+    def get_state_hash(self):
+        # 64-bit hash over the board cells, rack tiles, score sheet cells and top action. the parts for the board,
+        # racks and score sheet are updated as they change.
+        board_hash = self.game_board.zobrist_hash
+        state_hash = (((board_hash >> 64) ^ board_hash) & 0xffffffffffffffff) ^ self.score_sheet.zobrist_hash
+        if self.tile_racks:
+            state_hash ^= self.tile_racks.zobrist_hash
+        if self.actions:
+            action = self.actions[-1]
+            state_hash ^= util.get_zobrist_key(5, action.game_action_id, 0 if action.player_id is None else action.player_id + 1)
+        return state_hash
+
+    def _log_state_hash(self):
+        # keyed by the number of history messages, which identifies the same point when replaying the game
         log = collections.OrderedDict()
-        log['_'] = 'game'
+        log['_'] = 'game-state-hash'
         log['game-id'] = self.internal_game_id
         log['external-game-id'] = self.game_id
-        log['state'] = enums.GameStates(state).name
+        log['history-messages-count'] = len(self.history_messages)
+        log['state-hash'] = self.get_state_hash()
+        print(json.dumps(log, separators=(',', ':')))
+
+    def get_legal_game_action_data(self):
+        return self.actions[-1].get_legal_data()
+
+    def clone(self):
+        # the clone is headless and has no clients. clients of the original game can still act in it, since only
+        # their player_id is used.
+        game = Game.__new__(Game)
+        game.__dict__.update(self.__dict__)
+        game.add_pending_messages = None
+        game.messaging_enabled = False
+        game.logging_enabled = False
+        game.client_ids = set()
+        game.watcher_client_ids = set()
+        game.expiration_time = None
+        game.log_data_overrides = {}
+
+        game.game_board = self.game_board.clone(game)
+        game.score_sheet = self.score_sheet.clone(game)
+        game.tile_bag = list(self.tile_bag)
+        game.tile_racks = self.tile_racks.clone(game) if self.tile_racks else None
+        memo = {}
+        game.actions = [action.clone(game, memo) for action in self.actions]
+        game.history_messages = self.history_messages.clone()
+        game.player_id_to_history_messages_json = {}
+
+        return game
 
+    def set_state(self, state, mode=None, max_players=None):
         self.state = state
         if mode is not None:
             self.mode = mode
-            log['mode'] = enums.GameModes(mode).name
         if max_players is not None:
             self.max_players = max_players
-            log['max-players'] = max_players
-
-        if state == enums.GameStates.Starting.value:
-            log['tile-bag'] = self.tile_bag
-        if state == enums.GameStates.InProgress.value:
-            log['begin'] = int(time.time())
-        if state == enums.GameStates.Completed.value:
-            log['end'] = int(time.time())
-            self.score_sheet.update_net_worths()
-            score = [player_datum[enums.ScoreSheetIndexes.Net.value] for player_datum in self.score_sheet.player_data]
-            log['score'] = score
+
+        if state == enum_values.GameStates.Completed:
+            score = [player_datum[enum_values.ScoreSheetIndexes.Net] for player_datum in self.score_sheet.player_data]
         else:
             score = None
 
-        if self.log_data_overrides:
-            if 'log-time' in self.log_data_overrides:
-                log['log-time'] = self.log_data_overrides['log-time']
-            for key, value in self.log_data_overrides.items():
-                if key in log:
-                    log[key] = value
-            log['used-log-data-overrides'] = True
-
-        message = [enums.CommandsToClient.SetGameState.value, self.game_id, self.state]
-        if mode is not None or max_players or score:
-            message.append(self.mode)
-        if max_players or score:
-            message.append(self.max_players)
-        if score:
-            message.append(score)
-        self.add_pending_messages([message])
+        if self.messaging_enabled:
+            message = [enum_values.CommandsToClient.SetGameState, self.game_id, self.state]
+            if mode is not None or max_players or score:
+                message.append(self.mode)
+            if max_players or score:
+                message.append(self.max_players)
+            if score:
+                message.append(score)
+            self.add_pending_messages([message])
 
         if self.logging_enabled:
+            log = collections.OrderedDict()
+            log['_'] = 'game'
+            log['game-id'] = self.internal_game_id
+            log['external-game-id'] = self.game_id
+            log['state'] = enums.GameStates(state).name
+            if mode is not None:
+                log['mode'] = enums.GameModes(mode).name
+            if max_players is not None:
+                log['max-players'] = max_players
+
+            if state == enum_values.GameStates.Starting:
+                log['tile-bag'] = self.tile_bag
+            if state == enum_values.GameStates.InProgress:
+                log['begin'] = int(time.time())
+            if state == enum_values.GameStates.Completed:
+                log['end'] = int(time.time())
+                log['score'] = score
+
+            if self.log_data_overrides:
+                if 'log-time' in self.log_data_overrides:
+                    log['log-time'] = self.log_data_overrides['log-time']
+                for key, value in self.log_data_overrides.items():
+                    if key in log:
+                        log[key] = value
+                log['used-log-data-overrides'] = True
+
             print(json.dumps(log, separators=(',', ':')))
 
     def add_history_message(self, *data, player_id=None):
         data = list(data)
 
-        self.history_messages.append([player_id, data])
+        self.history_messages.append(player_id, data)
+
+        if not self.messaging_enabled:
+            return
+
+        if self.player_id_to_history_messages_json:
+            message_json = ujson.dumps(self._get_history_message_for_client(data))
+            if player_id is None:
+                for view in self.player_id_to_history_messages_json.values():
+                    view[0].append(message_json)
+                    view[1] = None
+            elif player_id in self.player_id_to_history_messages_json:
+                view = self.player_id_to_history_messages_json[player_id]
+                view[0].append(message_json)
+                view[1] = None
 
         if player_id is None:
             client_ids = self.client_ids
         else:
-            client = self.score_sheet.player_data[player_id][enums.ScoreSheetIndexes.Client.value]
+            client = self.score_sheet.player_data[player_id][enum_values.ScoreSheetIndexes.Client]
             if client:
                 client_ids = {client.client_id}
             else:
                 client_ids = None
 
         if client_ids:
-            message = [enums.CommandsToClient.AddGameHistoryMessage.value]
+            message = [enum_values.CommandsToClient.AddGameHistoryMessage]
             message.extend(data)
             if isinstance(message[2], str):
                 message[2] = self.score_sheet.username_to_player_id[message[2]]
             self.add_pending_messages([message], client_ids)
 
+    def _get_history_message_for_client(self, message):
+        if isinstance(message[1], str):
+            message = list(message)
+            message[1] = self.score_sheet.username_to_player_id[message[1]]
+        return message
+
     def _send_past_history_messages(self, client):
+        if not self.messaging_enabled:
+            return
+
         player_id = client.player_id
-        messages = []
-        for target_player_id, message in self.history_messages:
-            if target_player_id is None or target_player_id == player_id:
-                if isinstance(message[1], str):
-                    message = list(message)
-                    message[1] = self.score_sheet.username_to_player_id[message[1]]
-                messages.append(message)
+        view = self.player_id_to_history_messages_json.get(player_id)
+        if view is None:
+            view = [[ujson.dumps(self._get_history_message_for_client(message)) for message in self.history_messages.get_view(player_id)], None]
+            self.player_id_to_history_messages_json[player_id] = view
 
-        if messages:
-            self.add_pending_messages([[enums.CommandsToClient.AddGameHistoryMessages.value, messages]], {client.client_id})
+        if view[0]:
+            if view[1] is None:
+                view[1] = EncodedJson('[' + ','.join(view[0]) + ']')
+            self.add_pending_messages([[enum_values.CommandsToClient.AddGameHistoryMessages, view[1]]], {client.client_id})
 
     def _send_initialization_messages(self, client):
+        if not self.messaging_enabled:
+            return
+
         # game board
-        messages = [[enums.CommandsToClient.SetGameBoard.value, self.game_board.x_to_y_to_board_type]]
+        messages = [self.game_board.get_set_game_board_message()]
 
         # score sheet
-        score_sheet_data = [
-            [x[:enums.ScoreSheetIndexes.Cash.value + 1] for x in self.score_sheet.player_data],
-            self.score_sheet.chain_size,
-        ]
-        messages.append([enums.CommandsToClient.SetScoreSheet.value, score_sheet_data])
+        messages.append(self.score_sheet.get_set_score_sheet_message())
 
         # player's tiles
         if client.player_id is not None and self.tile_racks:
             for tile_index, tile_data in enumerate(self.tile_racks.racks[client.player_id]):
                 if tile_data:
                     x, y = tile_data[0]
-                    messages.append([enums.CommandsToClient.SetTile.value, tile_index, x, y, tile_data[1]])
+                    messages.append([enum_values.CommandsToClient.SetTile, tile_index, x, y, tile_data[1]])
 
         # turn
-        messages.append([enums.CommandsToClient.SetTurn.value, self.turn_player_id])
+        messages.append([enum_values.CommandsToClient.SetTurn, self.turn_player_id])
 
         self.add_pending_messages(messages, {client.client_id})
 
@@ -1226,6 +1859,9 @@ class Game:
 
 
 def main():
+    if settings.server__main__tracing_sample_rate:
+        tracing.Tracer(settings.server__main__tracing_sample_rate, settings.server__main__tracing_slow_threshold, settings.server__main__tracing_output_dir).install(sys.modules[__name__])
+
     server = Server()
     server_protocol = ServerProtocol(server)
 
@@ -1242,6 +1878,10 @@ def main():
 
     loop.call_later(15, destroy_expired_games_loop)
 
+    loop_monitor.LoopLagMonitor(loop, server).start()
+    sampling_profiler.install()
+    loop.add_signal_handler(signal.SIGUSR1, memory_usage.MemoryReporter(server).report)
+
     try:
         loop.run_forever()
     except KeyboardInterrupt:
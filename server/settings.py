@@ -3,3 +3,13 @@ util__get_log_file_filenames__path_prefixes = [
     # '/home/tim/server_mirror-archive/acquire.tlstyer.com/live/logs_',
     # '/home/tim/server_mirror/acquire.tlstyer.com/live/logs_',
 ]
+util__log_catalog__filename = '.log_catalog.json'
+util__log_catalog__refresh_interval = 10
+
+server__main__tracing_sample_rate = 0
+server__main__tracing_slow_threshold = 0.05
+server__main__tracing_output_dir = 'traces'
+
+server__game__log_state_hashes = False
+
+server__game_board__set_game_board_cells_min_count = 5
@@ -1,8 +1,46 @@
 #!/usr/bin/env python3
 
+import asyncio
+import batch_simulator
+import benchmark
+import compress_logs
+import contextlib
+import copy
+import enum_values
+import enums
+import enumsgen
+import glob
+import gzip
+import io
+import itertools
+import json
+import load_generator
+import logs_to_games
+import loop_monitor
+import math
+import memory_usage
+import os
+import os.path
+import sampling_profiler
+import self_play
 import server
+import settings
+import tempfile
 import time
+import tracemalloc
+import tracing
+import ujson
 import unittest
+import util
+
+
+class TestEnumValues(unittest.TestCase):
+    def test_1(self):
+        js_pathnames = glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'client', 'main', 'js', '*.js'))
+        self.assertTrue(js_pathnames)
+        self.assertEqual(enumsgen.check_enums(js_pathnames), [])
+        self.assertEqual(enum_values.GameBoardTypes.Imperial, enums.GameBoardTypes.Imperial.value)
+        self.assertEqual(enum_values.CommandsToClient.SetScoreSheetCells, enums.CommandsToClient.SetScoreSheetCells.value)
 
 
 class TestReuseIdManager(unittest.TestCase):
@@ -74,5 +112,987 @@ class TestIncrementIdManager(unittest.TestCase):
         self.assertEqual(self.id_manager.get_id(), 3)
 
 
+class TestGameBoard(unittest.TestCase):
+    class Game:
+        def __init__(self):
+            self.client_ids = set()
+            self.tile_racks = None
+            self.messaging_enabled = True
+            self.messages = []
+
+        def add_pending_messages(self, messages, client_ids=None):
+            self.messages.extend(messages)
+
+    def test_1(self):
+        game = self.Game()
+        game_board = server.GameBoard(game)
+        luxor = enum_values.GameBoardTypes.Luxor
+        tower = enum_values.GameBoardTypes.Tower
+        nothing_yet = enum_values.GameBoardTypes.NothingYet
+
+        for coordinates in [(0, 0), (1, 0), (1, 1), (3, 1), (11, 8)]:
+            game_board.set_cell(coordinates, nothing_yet)
+        game_board.set_cell((0, 1), luxor)
+        del game.messages[:]
+
+        game_board.fill_cells((2, 1), tower)
+
+        self.assertEqual(game.messages, [[enum_values.CommandsToClient.SetGameBoardCells, tower, [0, 2, 9, 2, 19, 1, 28, 1]]])
+        self.assertEqual(len(game_board.board_type_to_coordinates[tower]), 6)
+        self.assertEqual(list(game_board.board_type_to_coordinates[tower]), [(0, 0), (0, 1), (1, 0), (1, 1), (2, 1), (3, 1)])
+        self.assertFalse(game_board.board_type_to_coordinates[luxor])
+        self.assertIn((11, 8), game_board.board_type_to_coordinates[nothing_yet])
+        self.assertNotIn((11, 8), game_board.board_type_to_coordinates[tower])
+        self.assertEqual(game_board.x_to_y_to_board_type[0][1], tower)
+        self.assertEqual(len(game_board.board_type_to_coordinates[enum_values.GameBoardTypes.Nothing]), 108 - 7)
+
+        game_board2 = server.GameBoard(game, [list(x) for x in game_board.x_to_y_to_board_type])
+        self.assertEqual(game_board2.board_type_masks, game_board.board_type_masks)
+
+    def test_2(self):
+        game = self.Game()
+        game_board = server.GameBoard(game)
+        luxor = enum_values.GameBoardTypes.Luxor
+        tower = enum_values.GameBoardTypes.Tower
+        nothing_yet = enum_values.GameBoardTypes.NothingYet
+
+        game_board.set_cell((0, 0), nothing_yet)
+        game_board.fill_cells((0, 1), luxor)
+        game_board.set_cell((0, 3), nothing_yet)
+        game_board.set_cell((0, 4), nothing_yet)
+        game_board.fill_cells((0, 5), tower)
+        game_board.set_cell((5, 5), enum_values.GameBoardTypes.CantPlayEver)
+        self.assertEqual(game_board.get_component_size((0, 0)), 2)
+        self.assertEqual(game_board.get_component_size((0, 3)), 3)
+        self.assertEqual(game_board.get_neighboring_chain_sizes((0, 2)), {luxor: 2, tower: 3})
+        del game.messages[:]
+
+        game_board.fill_cells((0, 2), tower)
+
+        self.assertEqual(sorted(tuple(x[1:3]) for x in game.messages), [(0, 0), (0, 1), (0, 2)])
+        self.assertEqual(game_board.get_component_size((0, 0)), 6)
+        self.assertEqual(len(game_board.board_type_to_coordinates[tower]), 6)
+        self.assertEqual(game_board.get_neighboring_chain_sizes((1, 2)), {tower: 6})
+        self.assertEqual(game_board.get_neighboring_chain_sizes((5, 4)), {})
+
+
+class TestGameHistory(unittest.TestCase):
+    def test_1(self):
+        entries = [
+            [None, [enum_values.GameHistoryMessages.DrewPositionTile, 'user\u00e9/1', 3, 4]],
+            [None, [enum_values.GameHistoryMessages.TurnBegan, 0]],
+            [1, [enum_values.GameHistoryMessages.DrewTile, 1, 11, 8]],
+            [None, [enum_values.GameHistoryMessages.MergedChains, 0, [1, 4, 6]]],
+            [None, [enum_values.GameHistoryMessages.ReceivedBonus, 2, 6, 15000]],
+            [0, [enum_values.GameHistoryMessages.DrewTile, 0, 0, 0]],
+            [None, [enum_values.GameHistoryMessages.DisposedOfShares, 0, 4, 2, 3]],
+            [None, [enum_values.GameHistoryMessages.PurchasedShares, 0, [[2, 1], [5, 2]]]],
+            [None, [enum_values.GameHistoryMessages.AllTilesPlayed, None]],
+        ]
+        game_history = server.GameHistory(entries)
+
+        self.assertEqual(len(game_history), len(entries))
+        self.assertEqual(list(game_history), entries)
+        self.assertEqual(game_history, entries)
+        self.assertEqual(game_history[2], entries[2])
+        self.assertEqual(game_history[-1], entries[-1])
+        self.assertEqual(game_history[5:], entries[5:])
+        for player_id in [None, 0, 1, 2]:
+            self.assertEqual(list(game_history.get_view(player_id)), [data for target, data in entries if target is None or target == player_id])
+
+        clone = game_history.clone()
+        clone.append(1, [enum_values.GameHistoryMessages.DrewTile, 1, 5, 5])
+        self.assertEqual(game_history, entries)
+        self.assertEqual(clone, entries + [[1, [enum_values.GameHistoryMessages.DrewTile, 1, 5, 5]]])
+
+
+class TestTileRacks(unittest.TestCase):
+    def test_1(self):
+        # after every action, a full reclassification must agree with the incremental one
+        for recorded_game in benchmark.get_synthetic_games(4, 2):
+            game, player_id_to_client = benchmark.replay_game_start(recorded_game, 1, lambda messages, client_ids=None: None)
+
+            for action in recorded_game['actions'][1:]:
+                game.do_game_action(player_id_to_client[action[0]], action[1], action[2:])
+
+                types = [[tile_data[1] if tile_data else None for tile_data in rack] for rack in game.tile_racks.racks]
+                len_history_messages = len(game.history_messages)
+                game.tile_racks.reset_classification()
+                game.tile_racks.determine_tile_game_board_types()
+                self.assertEqual(types, [[tile_data[1] if tile_data else None for tile_data in rack] for rack in game.tile_racks.racks])
+                self.assertEqual(len(game.history_messages), len_history_messages)
+
+    def test_2(self):
+        # clients are sent the same tile messages as when every rack is reclassified from scratch
+        def get_tile_messages(recorded_game):
+            tile_messages = []
+
+            def add_pending_messages(messages, client_ids=None):
+                for message in messages:
+                    if message[0] in {enum_values.CommandsToClient.SetTile, enum_values.CommandsToClient.SetTileGameBoardType}:
+                        tile_messages.append((list(message), sorted(client_ids) if client_ids else None))
+
+            benchmark.replay_game(recorded_game, add_pending_messages, False)
+            return tile_messages
+
+        determine_tile_game_board_types = server.TileRacks.determine_tile_game_board_types
+
+        def determine_tile_game_board_types_from_scratch(self_, player_ids=None):
+            self_.reset_classification()
+            determine_tile_game_board_types(self_, player_ids)
+
+        for recorded_game in benchmark.get_synthetic_games(4, 3):
+            tile_messages = get_tile_messages(recorded_game)
+            server.TileRacks.determine_tile_game_board_types = determine_tile_game_board_types_from_scratch
+            try:
+                tile_messages_from_scratch = get_tile_messages(recorded_game)
+            finally:
+                server.TileRacks.determine_tile_game_board_types = determine_tile_game_board_types
+            self.assertGreater(len(tile_messages), len(recorded_game['actions']))
+            self.assertEqual(tile_messages, tile_messages_from_scratch)
+
+
+class TestNetWorths(unittest.TestCase):
+    def _get_net_worths(self, score_sheet):
+        net_worths = [player_datum[enum_values.ScoreSheetIndexes.Cash] for player_datum in score_sheet.player_data]
+        for game_board_type_id, price in enumerate(score_sheet.price):
+            share_counts = [player_datum[game_board_type_id] for player_datum in score_sheet.player_data]
+            if price and any(share_counts):
+                for player_id, share_count in enumerate(share_counts):
+                    net_worths[player_id] += share_count * price
+                first_count = max(share_counts)
+                first_player_ids = [player_id for player_id, share_count in enumerate(share_counts) if share_count == first_count]
+                second_count = max([share_count for share_count in share_counts if share_count < first_count], default=0)
+                second_player_ids = [player_id for player_id, share_count in enumerate(share_counts) if second_count and share_count == second_count]
+                if len(first_player_ids) > 1 or not second_player_ids:
+                    for player_id in first_player_ids:
+                        net_worths[player_id] += math.ceil(price * 15 / len(first_player_ids))
+                else:
+                    net_worths[first_player_ids[0]] += price * 10
+                    for player_id in second_player_ids:
+                        net_worths[player_id] += math.ceil(price * 5 / len(second_player_ids))
+        return net_worths
+
+    def test_1(self):
+        # the Net column is right after every action
+        for recorded_game in benchmark.get_synthetic_games(4, 8):
+            game, player_id_to_client = benchmark.replay_game_start(recorded_game, 0, None)
+
+            for action in recorded_game['actions']:
+                game.do_game_action(player_id_to_client[action[0]], action[1], action[2:])
+                self.assertEqual([player_datum[enum_values.ScoreSheetIndexes.Net] for player_datum in game.score_sheet.player_data], self._get_net_worths(game.score_sheet))
+
+            clone = game.clone()
+            clone.score_sheet.update_net_worths()
+            self.assertEqual([x[:enum_values.ScoreSheetIndexes.Client] for x in clone.score_sheet.player_data], [x[:enum_values.ScoreSheetIndexes.Client] for x in game.score_sheet.player_data])
+
+
+class TestHeadlessGame(unittest.TestCase):
+    def test_1(self):
+        for recorded_game in benchmark.get_synthetic_games(4, 3):
+            messages = []
+            game = benchmark.replay_game(recorded_game, lambda messages_, client_ids=None: messages.extend(messages_), False)
+            headless_game = benchmark.replay_game(recorded_game, None, False)
+
+            self.assertTrue(messages)
+            self.assertFalse(headless_game.messaging_enabled)
+            self.assertEqual(headless_game.history_messages, game.history_messages)
+            self.assertEqual(headless_game.game_board.x_to_y_to_board_type, game.game_board.x_to_y_to_board_type)
+            self.assertEqual([x[:9] for x in headless_game.score_sheet.player_data], [x[:9] for x in game.score_sheet.player_data])
+            self.assertEqual(headless_game.state, enum_values.GameStates.Completed)
+
+
+class TestGameClone(unittest.TestCase):
+    def _get_state(self, game):
+        racks = [[tile_data[:2] if tile_data else None for tile_data in rack] for rack in game.tile_racks.racks] if game.tile_racks else None
+        actions = [[action.__class__.__name__, action.player_id, action.additional_params] for action in game.actions]
+        return [game.state, game.game_board.x_to_y_to_board_type, [x[:9] for x in game.score_sheet.player_data], game.score_sheet.chain_size, game.score_sheet.available, racks, actions, game.history_messages, game.tile_bag]
+
+    def test_1(self):
+        for recorded_game in benchmark.get_synthetic_games(3, 4):
+            final_game = benchmark.replay_game(recorded_game, None, False)
+            final_state = copy.deepcopy(self._get_state(final_game))
+
+            for fraction in [0, 0.3, 0.6, 0.9]:
+                game = benchmark.replay_game_until(recorded_game, fraction)
+                state = copy.deepcopy(self._get_state(game))
+                player_id_to_client = benchmark.get_player_id_to_client(game)
+
+                clone = game.clone()
+                self.assertEqual(self._get_state(clone), state)
+                self.assertIsNone(clone.score_sheet.player_data[0][enum_values.ScoreSheetIndexes.Client])
+
+                for action in recorded_game['actions'][int(len(recorded_game['actions']) * fraction):]:
+                    clone.do_game_action(player_id_to_client[action[0]], action[1], action[2:])
+
+                self.assertEqual(self._get_state(clone), final_state)
+                self.assertEqual(self._get_state(game), state)
+
+
+class TestStateHash(unittest.TestCase):
+    def test_1(self):
+        # the incrementally updated hashes must match ones computed from scratch
+        for recorded_game in benchmark.get_synthetic_games(4, 6):
+            game, player_id_to_client = benchmark.replay_game_start(recorded_game, 0, None)
+            state_hashes = set()
+
+            for action in recorded_game['actions']:
+                game.do_game_action(player_id_to_client[action[0]], action[1], action[2:])
+
+                self.assertEqual(game.game_board.zobrist_hash, game.game_board.get_zobrist_hash())
+                self.assertEqual(game.score_sheet.zobrist_hash, game.score_sheet.get_zobrist_hash())
+                self.assertEqual(game.tile_racks.zobrist_hash, game.tile_racks.get_zobrist_hash())
+                self.assertEqual(game.clone().get_state_hash(), game.get_state_hash())
+                state_hashes.add(game.get_state_hash())
+
+            self.assertGreater(len(state_hashes), len(recorded_game['actions']) * 0.9)
+
+    def test_2(self):
+        # hashes logged at turn boundaries match a replay at the same number of history messages
+        recorded_game = benchmark.get_synthetic_games(1, 7)[0]
+        output = io.StringIO()
+        log_state_hashes = settings.server__game__log_state_hashes
+        settings.server__game__log_state_hashes = True
+        try:
+            with contextlib.redirect_stdout(output):
+                benchmark.replay_game(recorded_game, None, True)
+        finally:
+            settings.server__game__log_state_hashes = log_state_hashes
+
+        history_messages_count_to_state_hash = {}
+        for line in output.getvalue().splitlines():
+            entry = json.loads(line)
+            if entry['_'] == 'game-state-hash':
+                history_messages_count_to_state_hash[entry['history-messages-count']] = entry['state-hash']
+        self.assertGreater(len(history_messages_count_to_state_hash), 10)
+
+        game, player_id_to_client = benchmark.replay_game_start(recorded_game, 0, None)
+        compared_count = 0
+        for action in recorded_game['actions']:
+            game.do_game_action(player_id_to_client[action[0]], action[1], action[2:])
+            state_hash = history_messages_count_to_state_hash.get(len(game.history_messages))
+            if state_hash is not None:
+                self.assertEqual(game.get_state_hash(), state_hash)
+                compared_count += 1
+        self.assertEqual(compared_count, len(history_messages_count_to_state_hash))
+
+
+class TestPastHistoryMessages(unittest.TestCase):
+    def _get_expected_json(self, game, player_id):
+        messages = []
+        for target_player_id, message in game.history_messages:
+            if target_player_id is None or target_player_id == player_id:
+                if isinstance(message[1], str):
+                    message = list(message)
+                    message[1] = game.score_sheet.username_to_player_id[message[1]]
+                messages.append(message)
+        return ujson.dumps([[enum_values.CommandsToClient.AddGameHistoryMessages, messages]])
+
+    def test_1(self):
+        # the cached views, built at different points and extended as the game goes on, match a walk of the history
+        recorded_game = benchmark.get_synthetic_games(1, 3)[0]
+        pending_messages = []
+        game, player_id_to_client = benchmark.replay_game_start(recorded_game, 0, lambda messages, client_ids=None: pending_messages.append([messages, client_ids]))
+        watcher_clients = [logs_to_games.Client(100 + index, 'watcher%d' % index) for index in range(3)]
+
+        for action_index, action in enumerate(recorded_game['actions']):
+            game.do_game_action(player_id_to_client[action[0]], action[1], action[2:])
+            if action_index % 20 == 0:
+                clients = [watcher_clients[action_index // 20 % 3], player_id_to_client[action_index // 20 % len(player_id_to_client)]]
+                for client in clients:
+                    game.leave_game(client)
+                    del pending_messages[:]
+                    if client in watcher_clients:
+                        game.watch_game(client)
+                    else:
+                        game.rejoin_game(client)
+
+                    messages, client_ids = pending_messages[-1]
+                    self.assertEqual(client_ids, {client.client_id})
+                    self.assertEqual(ujson.dumps(messages), self._get_expected_json(game, client.player_id))
+
+
+class TestInitializationMessages(unittest.TestCase):
+    def test_1(self):
+        # the encodings are reused until the board or score sheet changes, and always match a fresh encoding
+        recorded_game = benchmark.get_synthetic_games(1, 4)[0]
+        game, player_id_to_client = benchmark.replay_game_start(recorded_game, 0, lambda messages, client_ids=None: None)
+
+        for action in recorded_game['actions']:
+            set_game_board_message = game.game_board.get_set_game_board_message()
+            set_score_sheet_message = game.score_sheet.get_set_score_sheet_message()
+            self.assertIs(game.game_board.get_set_game_board_message(), set_game_board_message)
+            self.assertIs(game.score_sheet.get_set_score_sheet_message(), set_score_sheet_message)
+
+            game.do_game_action(player_id_to_client[action[0]], action[1], action[2:])
+
+            score_sheet_data = [[x[:enum_values.ScoreSheetIndexes.Cash + 1] for x in game.score_sheet.player_data], game.score_sheet.chain_size]
+            self.assertEqual(ujson.dumps(game.game_board.get_set_game_board_message()), ujson.dumps([enum_values.CommandsToClient.SetGameBoard, game.game_board.x_to_y_to_board_type]))
+            self.assertEqual(ujson.dumps(game.score_sheet.get_set_score_sheet_message()), ujson.dumps([enum_values.CommandsToClient.SetScoreSheet, score_sheet_data]))
+
+
+class TestScoreSheetCells(unittest.TestCase):
+    def test_1(self):
+        # each game action sends at most one SetScoreSheetCells, and applying them reproduces the score sheet
+        recorded_game = benchmark.get_synthetic_games(1, 6)[0]
+        messages = []
+        game, player_id_to_client = benchmark.replay_game_start(recorded_game, 0, lambda messages_, client_ids=None: messages.extend(messages_))
+        player_data = [x[:enum_values.ScoreSheetIndexes.Cash + 1] for x in game.score_sheet.player_data]
+        chain_size = list(game.score_sheet.chain_size)
+
+        for action in recorded_game['actions']:
+            del messages[:]
+            game.do_game_action(player_id_to_client[action[0]], action[1], action[2:])
+
+            score_sheet_messages = [message for message in messages if message[0] in {enum_values.CommandsToClient.SetScoreSheetCell, enum_values.CommandsToClient.SetScoreSheetCells}]
+            self.assertLessEqual(len(score_sheet_messages), 1)
+            for message in score_sheet_messages:
+                self.assertEqual(message[0], enum_values.CommandsToClient.SetScoreSheetCells)
+                cells = message[1]
+                for cell_index in range(0, len(cells), 3):
+                    row, index, value = cells[cell_index:cell_index + 3]
+                    if row == enum_values.ScoreSheetRows.ChainSize:
+                        chain_size[index] = value
+                    else:
+                        player_data[row][index] = value
+
+            self.assertEqual(player_data, [x[:enum_values.ScoreSheetIndexes.Cash + 1] for x in game.score_sheet.player_data])
+            self.assertEqual(chain_size, game.score_sheet.chain_size)
+            self.assertIsNone(game.score_sheet.changed_cells)
+
+    def test_2(self):
+        # cells changed by an action that raises are still sent, and the next action starts over
+        recorded_game = benchmark.get_synthetic_games(1, 6)[0]
+        messages = []
+        game, player_id_to_client = benchmark.replay_game_start(recorded_game, 1, lambda messages_, client_ids=None: messages.extend(messages_))
+        action = game.actions[-1]
+
+        def execute(*data):
+            game.score_sheet.adjust_player_data(action.player_id, enum_values.ScoreSheetIndexes.Cash, -1)
+            raise ValueError()
+
+        action.execute = execute
+        del messages[:]
+        self.assertRaises(ValueError, game.do_game_action, player_id_to_client[action.player_id], action.game_action_id, [])
+        self.assertIsNone(game.score_sheet.changed_cells)
+        self.assertEqual(messages, [[enum_values.CommandsToClient.SetScoreSheetCells, [action.player_id, enum_values.ScoreSheetIndexes.Cash, game.score_sheet.player_data[action.player_id][enum_values.ScoreSheetIndexes.Cash]]]])
+
+
+class TestLegalGameActionData(unittest.TestCase):
+    def _get_candidate_data(self, action):
+        game_action_id = action.game_action_id
+        if game_action_id == enum_values.GameActions.PlayTile:
+            return [[tile_index] for tile_index in range(-1, 7)]
+        elif game_action_id == enum_values.GameActions.DisposeOfShares:
+            return [[trade_amount, sell_amount] for trade_amount in range(-1, action.defunct_type_count + 3) for sell_amount in range(-1, action.defunct_type_count + 3)]
+        elif game_action_id == enum_values.GameActions.PurchaseShares:
+            end_games = [0, 1] if action.can_end_game else [0]
+            return [[list(type_ids), end_game] for count in range(4) for type_ids in itertools.combinations_with_replacement(range(7), count) for end_game in end_games]
+        else:
+            return [[type_id] for type_id in range(-1, 8)]
+
+    def test_1(self):
+        # every legal data must be accepted, and nothing else
+        for recorded_game in benchmark.get_synthetic_games(1, 5):
+            game, player_id_to_client = benchmark.replay_game_start(recorded_game, 1, None)
+
+            for action in recorded_game['actions'][1:]:
+                top_action = game.actions[-1]
+                legal_data = game.get_legal_game_action_data()
+                self.assertIn(action[2:], legal_data)
+
+                accepted_data = []
+                for data in self._get_candidate_data(top_action):
+                    clone = game.clone()
+                    clone.do_game_action(player_id_to_client[top_action.player_id], top_action.game_action_id, data)
+                    if len(clone.history_messages) != len(game.history_messages):
+                        accepted_data.append(data)
+                self.assertEqual(sorted(accepted_data), sorted(legal_data))
+
+                game.do_game_action(player_id_to_client[action[0]], action[1], action[2:])
+
+            self.assertEqual(game.get_legal_game_action_data(), [])
+
+
+class TestBatchSimulator(unittest.TestCase):
+    def test_1(self):
+        for num_players in [2, 4, 6]:
+            simulator = batch_simulator.BatchSimulator(100, num_players, num_players)
+            simulator.run()
+
+            self.assertTrue(simulator.game_over.all())
+            self.assertEqual(batch_simulator.verify(simulator, range(0, 100, 10)), [])
+
+
+class TestSelfPlay(unittest.TestCase):
+    def test_1(self):
+        mode_names = list(self_play.mode_name_to_mode_and_num_players.keys())
+        policy_names = list(self_play.policy_name_to_policy.keys())
+        mode_to_game_data, mode_to_policy_names = self_play.run(8, mode_names, policy_names, 1, 2)
+
+        self.assertEqual(sorted(mode_to_game_data.keys()), sorted(mode_names))
+        for mode_name, policy_names_, seed in self_play.get_tasks(8, mode_names, policy_names, 1):
+            game_data, player_id_to_policy_name = self_play.play_game(mode_name, policy_names_, seed)
+            self.assertIn(game_data, mode_to_game_data[mode_name])
+            self.assertEqual(sorted(player_id_to_policy_name), sorted(policy_names_))
+            self.assertEqual(len(game_data[1]), self_play.mode_name_to_mode_and_num_players[mode_name][1])
+
+        win_rates = self_play.get_policy_name_to_win_rate('Teams', mode_to_game_data['Teams'], mode_to_policy_names['Teams'])
+        self.assertGreater(sum(win_rates.values()), 0)
+
+
+class TestLoopLagMonitor(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.server = server.Server()
+        self.output = io.StringIO()
+        self.monitor = loop_monitor.LoopLagMonitor(self.loop, self.server, interval=0.02, threshold=0.1, output=self.output)
+
+    def tearDown(self):
+        self.monitor.stop()
+        self.loop.close()
+
+    def _block(self):
+        self.server.current_client_id = 5
+        time.sleep(0.4)
+        self.server.current_client_id = None
+
+    def _run(self, callbacks):
+        self.monitor.start()
+        for delay, callback in callbacks:
+            self.loop.call_later(delay, callback)
+        self.loop.call_later(1, self.loop.stop)
+        self.loop.run_forever()
+        return [json.loads(line) for line in self.output.getvalue().splitlines()]
+
+    def test_1(self):
+        self.assertEqual(self._run([]), [])
+
+    def test_2(self):
+        records = self._run([(0.1, self._block)])
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['_'], 'loop-lag')
+        self.assertGreaterEqual(records[0]['lag'], 0.1)
+        self.assertEqual(records[0]['client-id'], 5)
+        self.assertTrue(records[0]['stack'][-1].endswith(':_block'))
+
+    def test_3(self):
+        records = self._run([(0.1, self._block), (0.6, self._block)])
+        self.assertEqual(len(records), 1)
+
+
+class TestSamplingProfiler(unittest.TestCase):
+    def _spin(self):
+        end_time = time.time() + 0.3
+        while time.time() < end_time:
+            pass
+
+    def test_1(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            profiler = sampling_profiler.SamplingProfiler(0.001, output_dir)
+            profiler.start()
+            self.assertTrue(profiler.is_running())
+            self._spin()
+            filename = profiler.stop()
+            self.assertFalse(profiler.is_running())
+            self.assertEqual(os.path.dirname(filename), output_dir)
+
+            with open(filename, 'r') as f:
+                lines = f.read().splitlines()
+
+        spin_count = 0
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            frames = stack.split(';')
+            if frames[-1].startswith('_spin (test.py:'):
+                spin_count += int(count)
+        self.assertGreater(spin_count, 10)
+
+
+class TestMemoryUsage(unittest.TestCase):
+    class Client:
+        def __init__(self, client_id, username):
+            self.client_id = client_id
+            self.username = username
+            self.game_id = None
+            self.player_id = None
+
+    def setUp(self):
+        self.server = server.Server()
+        self.server.transport_write = lambda data: None
+
+    def _add_game(self, game_id, num_players, started):
+        game = server.Game(game_id, game_id, 0, num_players, lambda messages, client_ids=None: None, False)
+        clients = []
+        for index in range(num_players):
+            client = self.Client(game_id * 10 + index, 'user%d_%d' % (game_id, index))
+            self.server.client_id_to_client[client.client_id] = client
+            game.join_game(client)
+            clients.append(client)
+        if started:
+            creator = [client for client in clients if client.player_id == game.actions[-1].player_id][0]
+            game.do_game_action(creator, 0, [])
+        self.server.game_id_to_game[game_id] = game
+        return game
+
+    def test_1(self):
+        self._add_game(1, 2, False)
+        self._add_game(2, 4, True)
+        self._add_game(3, 3, True)
+
+        report = memory_usage.get_report(self.server, 2)
+
+        self.assertEqual(report['games-count'], 3)
+        self.assertEqual(report['top-games'][0]['game-id'], 2)
+        self.assertEqual(len(report['top-games']), 2)
+        self.assertGreaterEqual(report['top-games'][0]['size'], report['top-games'][1]['size'])
+        self.assertGreater(report['top-games'][0]['sizes']['racks'], 0)
+        self.assertEqual(report['games-by-state']['Starting']['count'], 0)
+        self.assertEqual(report['games-by-state']['StartingFull']['count'], 1)
+        self.assertEqual(report['games-by-state']['InProgress']['count'], 2)
+        self.assertEqual(report['games-size'], sum(x['size'] for x in report['games-by-state'].values()))
+        self.assertEqual(report['clients-count'], 9)
+        self.assertEqual(len(report['top-clients']), 2)
+
+    def test_2(self):
+        output = io.StringIO()
+        reporter = memory_usage.MemoryReporter(self.server, trace_allocations=True, output=output)
+        self._add_game(1, 2, True)
+        reporter.report()
+        tracemalloc.stop()
+
+        log = json.loads(output.getvalue())
+        self.assertEqual(log['_'], 'memory-usage')
+        self.assertEqual(log['games-count'], 1)
+        self.assertIsInstance(log['tracemalloc-diff'], list)
+
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        self.tracer = tracing.Tracer(1)
+        self.tracer.install(server)
+
+        self.server = server.Server()
+        self.server.transport_write = lambda data: None
+
+    def tearDown(self):
+        self.tracer.uninstall()
+
+    def test_1(self):
+        client1 = server.Client(self.server, 'user1', '127.0.0.1', 'socket1', False)
+        client2 = server.Client(self.server, 'user2', '127.0.0.1', 'socket2', False)
+        client1.on_message(b'[0,0,2]')
+        client2.on_message(b'[1,1]')
+        game = self.server.game_id_to_game[1]
+        creator = client1 if client1.player_id == game.actions[-1].player_id else client2
+        creator.on_message(b'[5,0]')
+
+        self.assertEqual(len(self.tracer.traces), 3)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            filename = os.path.join(output_dir, 'trace.json')
+            self.tracer.export(filename)
+            with open(filename, 'r') as f:
+                trace_events = json.load(f)['traceEvents']
+
+        names = {event['name'] for event in trace_events if event['tid'] == 3}
+        for name in ['Client.on_message', 'Game.do_game_action', 'ActionStartGame.execute', 'ActionPlayTile.prepare', 'TileRacks.determine_tile_game_board_types', 'Server.add_pending_messages', 'Server.flush_pending_messages']:
+            self.assertIn(name, names)
+
+        root = [event for event in trace_events if event['tid'] == 3 and event['name'] == 'Client.on_message'][0]
+        self.assertEqual(root['args']['client-id'], creator.client_id)
+        for event in trace_events:
+            if event['tid'] == 3:
+                self.assertGreaterEqual(event['ts'], root['ts'])
+                self.assertLessEqual(event['ts'] + event['dur'], root['ts'] + root['dur'] + 0.001)
+
+    def test_2(self):
+        self.tracer.uninstall()
+        self.assertNotIn('__wrapped__', server.Game.do_game_action.__dict__)
+
+    def test_3(self):
+        # slow traces are written to a directory that's made if needed, and a failed write doesn't break the request
+        self.tracer.uninstall()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_dir = os.path.join(temp_dir, 'traces')
+            self.tracer = tracing.Tracer(1, 0, output_dir)
+            self.tracer.install(server)
+
+            client = server.Client(self.server, 'user1', '127.0.0.1', 'socket1', False)
+            client.on_message(b'[0,0,2]')
+            self.assertEqual(len(os.listdir(output_dir)), 1)
+
+            for filename in os.listdir(output_dir):
+                os.remove(os.path.join(output_dir, filename))
+            os.rmdir(output_dir)
+            with contextlib.redirect_stderr(io.StringIO()) as stderr:
+                client.on_message(b'[4]')
+            self.assertIn('tracing export failed', stderr.getvalue())
+
+
+class TestLoadGenerator(unittest.TestCase):
+    class Pipe:
+        def __init__(self, write):
+            self.write = write
+
+    def test_1(self):
+        # virtual clients play against an in-process server, and their model of each game's score sheet keeps up
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            server_ = server.Server()
+            protocol = server.ServerProtocol(server_)
+            generator = load_generator.LoadGenerator(None, 12, 0, 0, 0.01, 0, 0, None, 1)
+            generator.writer = TestLoadGenerator.Pipe(protocol.data_received)
+            generator.running = True
+
+            def transport_write(data):
+                for line in data.splitlines(True):
+                    generator._handle_line(line)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                protocol.connection_made(TestLoadGenerator.Pipe(transport_write))
+                for number in range(generator.num_clients):
+                    generator.add_client(number)
+                deadline = time.time() + 20
+                while time.time() < deadline and not any(game.state == enum_values.GameStates.Completed for game in server_.game_id_to_game.values()):
+                    loop.run_until_complete(asyncio.sleep(0.1))
+                generator.running = False
+        finally:
+            loop.close()
+            asyncio.set_event_loop(None)
+
+        self.assertGreater(generator.completed_games_count, 0)
+        for game_id, game in server_.game_id_to_game.items():
+            if game.state in (enum_values.GameStates.InProgress, enum_values.GameStates.Completed):
+                model = generator.game_id_to_game[game_id]
+                self.assertEqual(model.chain_size, game.score_sheet.chain_size)
+                for player_id, player_datum in enumerate(game.score_sheet.player_data):
+                    self.assertEqual(model.score_sheet_players[player_id], player_datum[:enum_values.ScoreSheetIndexes.Cash + 1])
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_1(self):
+        games = benchmark.get_synthetic_games(3, 1)
+        self.assertEqual(games, benchmark.get_synthetic_games(3, 1))
+
+        for recorded_game in games:
+            game = benchmark.replay_game(recorded_game, lambda messages, client_ids=None: None, False)
+            self.assertEqual(game.actions[-1].game_action_id, enum_values.GameActions.GameOver)
+
+    def test_2(self):
+        games = benchmark.get_synthetic_games(2, 1)
+        results = benchmark.run_benchmarks(games, ['get_bonuses', 'replay_engine'], 1, 1)
+        self.assertEqual(list(results.keys()), ['get_bonuses', 'replay_engine'])
+        self.assertEqual(results['replay_engine']['ops'], sum(len(x['actions']) for x in games))
+
+        baseline = benchmark.get_results_document(results, games, 'test')
+        current = json.loads(json.dumps(baseline))
+        current['results']['get_bonuses']['usec-per-op'] = baseline['results']['get_bonuses']['usec-per-op'] * 1.5
+        comparisons = benchmark.compare_results(baseline, current, 0.1)
+        self.assertEqual([x[4] for x in comparisons], [True, False])
+
+
+class TestBlockCompressedFile(unittest.TestCase):
+    lines = ['line %d %s\n' % (i, 'é' * (i % 7)) for i in range(1000)] + ['no newline']
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.temp_dir.name, '1408905413.gz')
+        with util.BlockCompressedFileWriter(self.filename, 1000) as writer:
+            for line in self.lines:
+                writer.write(line)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def check_file(self, filename):
+        offsets = []
+        with util.open_possibly_gzipped_file(filename) as f:
+            self.assertIsInstance(f, util.BlockCompressedFile)
+            lines = []
+            for line in f:
+                lines.append(line)
+                offsets.append((f.tell(), f.tell_virtual()))
+            self.assertEqual(lines, self.lines)
+
+            for i in [999, 0, 500, 17, 998]:
+                offset, virtual_offset = offsets[i]
+                f.seek(offset)
+                self.assertEqual(f.readline(), self.lines[i + 1])
+                self.assertEqual(f.tell(), offsets[i + 1][0])
+                f.seek_virtual(virtual_offset)
+                self.assertEqual(f.readline(), self.lines[i + 1])
+
+        with gzip.open(filename, 'rt') as f:
+            self.assertEqual(f.read(), ''.join(self.lines))
+
+    def test_1(self):
+        self.check_file(self.filename)
+        os.remove(self.filename + util.block_compressed_file_index_suffix)
+        self.check_file(self.filename)
+
+    def test_2(self):
+        # a block still being written is skipped until it's complete
+        with open(self.filename, 'rb') as f:
+            data = f.read()
+        with open(self.filename, 'wb') as f:
+            f.write(data[:-100])
+        with util.BlockCompressedFile(self.filename) as f:
+            lines = list(f)
+        self.assertEqual(lines, self.lines[:len(lines)])
+        self.assertGreater(len(lines), 900)
+
+    def test_4(self):
+        # an index left from other contents of the file is ignored, and a writer removes it when it opens the file
+        index_filename = self.filename + util.block_compressed_file_index_suffix
+        with open(index_filename, 'rb') as f:
+            index = f.read()
+
+        writer = util.BlockCompressedFileWriter(self.filename, 1500)
+        self.assertFalse(os.path.exists(index_filename))
+        for line in self.lines:
+            writer.write(line)
+        writer.close()
+
+        with open(index_filename, 'wb') as f:
+            f.write(index)
+        self.check_file(self.filename)
+        with open(index_filename, 'wb') as f:
+            f.write(index[:20])
+        self.check_file(self.filename)
+
+    def test_5(self):
+        # seek_virtual only goes to offsets within blocks, including ones written after the file was opened
+        writer = util.BlockCompressedFileWriter(self.filename, 1000)
+        writer.write(''.join(self.lines[:500]))
+        writer.flush()
+        with util.BlockCompressedFile(self.filename) as f:
+            f.readline()
+            virtual_offset = f.tell_virtual()
+            for bad_virtual_offset in [virtual_offset + (1 << 16), 1 << 40, virtual_offset | 0xffff]:
+                with self.assertRaises(ValueError):
+                    f.seek_virtual(bad_virtual_offset)
+
+            writer.write(''.join(self.lines[500:]))
+            writer.close()
+            with util.BlockCompressedFile(self.filename) as f_2:
+                for line in f_2:
+                    if line == self.lines[900]:
+                        break
+                virtual_offset = f_2.tell_virtual()
+            f.seek_virtual(virtual_offset)
+            self.assertEqual(f.readline(), self.lines[901])
+
+    def test_3(self):
+        plain_filename = os.path.join(self.temp_dir.name, '1408905414')
+        with open(plain_filename, 'w') as f:
+            f.write(''.join(self.lines))
+        gzip_filename = os.path.join(self.temp_dir.name, '1408905415.gz')
+        with gzip.open(gzip_filename, 'wt') as f:
+            f.write(''.join(self.lines))
+
+        with util.open_possibly_gzipped_file(gzip_filename) as f:
+            self.assertNotIsInstance(f, util.BlockCompressedFile)
+
+        # while converting, the only files without a leading dot are finished ones
+        log_filenames_while_writing = []
+        writer_class = util.BlockCompressedFileWriter
+
+        class Writer(writer_class):
+            def close(self_):
+                log_filenames_while_writing.append(sorted(filename for filename in os.listdir(self.temp_dir.name) if not filename.startswith('.')))
+                super().close()
+
+        util.BlockCompressedFileWriter = Writer
+        try:
+            compress_logs.compress_log_file(plain_filename)
+            compress_logs.compress_log_file(gzip_filename)
+        finally:
+            util.BlockCompressedFileWriter = writer_class
+        self.assertEqual(log_filenames_while_writing, [['1408905413.gz', '1408905413.gz.gzi', '1408905414', '1408905415.gz'], ['1408905413.gz', '1408905413.gz.gzi', '1408905414.gz', '1408905414.gz.gzi', '1408905415.gz']])
+        self.check_file(plain_filename + '.gz')
+        self.check_file(gzip_filename)
+
+        self.assertEqual(sorted(os.listdir(self.temp_dir.name)), ['1408905413.gz', '1408905413.gz.gzi', '1408905414.gz', '1408905414.gz.gzi', '1408905415.gz', '1408905415.gz.gzi'])
+
+
+class TestGameLogIndex(unittest.TestCase):
+    log_lines = [
+        'connection_made',
+        '1 connect alice 1.2.3.4 x',
+        '',
+        '2 connect zoé 1.2.3.4 x',
+        '',
+        '{"_":"game","game-id":1,"state":"Starting","mode":"Singles","max-players":2}',
+        '{"_":"game-player","game-id":1,"player-id":0,"username":"alice"}',
+        '1 <- [[%d,1,0,1]]' % enum_values.CommandsToClient.SetGamePlayerJoin,
+        '',
+        '3 connect carol 1.2.3.4 x',
+        '',
+        '2 disconnect',
+        '',
+        '{"_":"game","game-id":2,"state":"Starting","mode":"Singles","max-players":2}',
+        '{"_":"game-player","game-id":2,"player-id":0,"username":"carol"}',
+        '3 <- [[%d,2,0,3]]' % enum_values.CommandsToClient.SetGamePlayerJoin,
+        '',
+        '1 <- [[%d,0,1,2,3]]' % enum_values.CommandsToClient.SetTile,
+        '',
+        'game #1 expired',
+        '',
+        '3 disconnect',
+        'game #2 expired',
+    ]
+
+    def test_1(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, '1500000000')
+            with open(filename, 'w') as f:
+                f.write('\n'.join(self.log_lines) + '\n')
+            compress_logs.compress_log_file(filename)
+            filenames = [filename + '.gz']
+            filenames.append(os.path.join(temp_dir, '1500000001.gz'))
+            with gzip.open(filenames[-1], 'wt') as f:
+                f.write('\n'.join(self.log_lines) + '\n')
+            filenames.append(os.path.join(temp_dir, '1500000002'))
+            with open(filenames[-1], 'w') as f:
+                f.write('\n'.join(self.log_lines))
+
+            for filename in filenames:
+                with util.open_possibly_gzipped_file(filename) as file:
+                    expected_game_logs = {game_log.internal_game_id: game_log for game_log in logs_to_games.IndividualGameLogMaker(1500000000, file).go()}
+                self.assertEqual(sorted(expected_game_logs.keys()), [1, 2])
+
+                for i in range(2):
+                    internal_game_id_to_batch_ranges = logs_to_games.get_game_log_index(1500000000, filename)
+                    self.assertTrue(os.path.exists(filename + util.game_log_index_suffix))
+                    self.assertEqual(sorted(internal_game_id_to_batch_ranges.keys()), [1, 2])
+
+                    with util.open_possibly_gzipped_file(filename) as file:
+                        game_logs = logs_to_games.get_individual_game_logs(1500000000, file, internal_game_id_to_batch_ranges)
+                    self.assertEqual([game_log.line_number_to_batch for game_log in game_logs], [expected_game_logs[1].line_number_to_batch, expected_game_logs[2].line_number_to_batch])
+
+                    with util.open_possibly_gzipped_file(filename) as file:
+                        game_logs = logs_to_games.get_individual_game_logs(1500000000, file, {2: internal_game_id_to_batch_ranges[2]})
+                    self.assertEqual([game_log.line_number_to_batch for game_log in game_logs], [expected_game_logs[2].line_number_to_batch])
+
+    def test_2(self):
+        # the index is still made when it can't be saved next to the log file
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, '1500000000')
+            with open(filename, 'w') as f:
+                f.write('\n'.join(self.log_lines) + '\n')
+            os.mkdir(filename + util.game_log_index_suffix)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                internal_game_id_to_batch_ranges = logs_to_games.get_game_log_index(1500000000, filename)
+            self.assertEqual(sorted(internal_game_id_to_batch_ranges.keys()), [1, 2])
+
+
+class TestLogCatalog(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path_prefix = os.path.join(self.temp_dir.name, 'logs_')
+        self.catalog_filename = os.path.join(self.temp_dir.name, 'log_catalog.json')
+        os.mkdir(self.path_prefix + 'py')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_log(self, filename, text, mode='w'):
+        with open(os.path.join(self.path_prefix + 'py', filename), mode) as f:
+            f.write(text)
+
+    def get_log_catalog(self):
+        log_catalog = util.LogCatalog('py', [self.path_prefix], self.catalog_filename)
+        log_catalog.refresh()
+        return log_catalog
+
+    def test_1(self):
+        self.write_log('1500000000', 'connection_made\n{"_":"game","game-id":3}\n{"_":"game-player","game-id":2}\n')
+        self.write_log('1500000100', 'connection_made\n{"_":"game","game-id":1}\npartial')
+        compress_logs.compress_log_file(os.path.join(self.path_prefix + 'py', '1500000000'))
+
+        log_catalog = self.get_log_catalog()
+        entries = log_catalog.get_entries()
+        self.assertEqual([(entry['timestamp'], entry['compression'], entry['lines'], entry['first_game_id'], entry['last_game_id']) for entry in entries], [(1500000000, 'block', 3, 2, 3), (1500000100, None, 2, 1, 1)])
+        self.assertEqual([entry['timestamp'] for entry in log_catalog.get_entries(1500000001)], [1500000100])
+        self.assertEqual([entry['timestamp'] for entry in log_catalog.get_entries(end=1500000099)], [1500000000])
+        self.assertEqual([entry['timestamp'] for entry in log_catalog.get_entries(1500000100, 1500000100)], [1500000100])
+
+        # a file that grew is scanned from the end of its last whole line
+        self.write_log('1500000100', ' line\n{"_":"game","game-id":7}\n', 'a')
+        self.write_log('1500000200', '')
+        os.remove(os.path.join(self.path_prefix + 'py', '1500000000.gz'))
+        log_catalog.refresh()
+        entries = log_catalog.get_entries()
+        self.assertEqual([(entry['timestamp'], entry['lines'], entry['first_game_id'], entry['last_game_id']) for entry in entries], [(1500000100, 4, 1, 7), (1500000200, 0, None, None)])
+
+        log_catalog = util.LogCatalog('py', [self.path_prefix], self.catalog_filename)
+        log_catalog._scan = None
+        log_catalog.refresh()
+        self.assertEqual(log_catalog.get_entries(), entries)
+
+    def test_2(self):
+        # a block compressed file that's empty when first seen is scanned as one once blocks are written
+        writer = util.BlockCompressedFileWriter(os.path.join(self.path_prefix + 'py', '1500000300.gz'))
+        log_catalog = self.get_log_catalog()
+        self.assertEqual(log_catalog.get_entries()[0]['compression'], 'gzip')
+
+        writer.write('connection_made\n{"_":"game","game-id":4}\n')
+        writer.flush()
+        log_catalog.refresh()
+        entry = log_catalog.get_entries()[0]
+        self.assertEqual((entry['compression'], entry['lines'], entry['first_game_id']), ('block', 2, 4))
+        writer.close()
+
+    def test_3(self):
+        # get_log_catalog doesn't refresh again within util__log_catalog__refresh_interval seconds
+        log_catalog = util.LogCatalog('py', [self.path_prefix], self.catalog_filename)
+        util._log_type_to_log_catalog['test'] = log_catalog
+        try:
+            self.assertEqual(util.get_log_catalog('test').get_entries(), [])
+            self.write_log('1500000000', 'connection_made\n')
+            self.assertEqual(util.get_log_catalog('test').get_entries(), [])
+            log_catalog.refresh_time -= settings.util__log_catalog__refresh_interval
+            self.assertEqual(len(util.get_log_catalog('test').get_entries()), 1)
+        finally:
+            del util._log_type_to_log_catalog['test']
+
+    def test_4(self):
+        # only <timestamp> and <timestamp>.gz files are log files
+        self.write_log('1500000100', 'connection_made\n')
+        for filename in ['1500000100.gz.tmp', '1500000100.gz.tmp.gzi', '1500000100.games', 'notes.txt', '.1500000200.gz']:
+            self.write_log(filename, 'connection_made\n')
+        self.assertEqual([entry['path'] for entry in self.get_log_catalog().get_entries()], [os.path.join(self.path_prefix + 'py', '1500000100')])
+
+    def test_5(self):
+        # by default the catalog is kept in the log directory, and one that can't be read or written is made again
+        self.write_log('1500000100', 'connection_made\n')
+        log_catalog = util.LogCatalog('py', [self.path_prefix])
+        log_catalog.refresh()
+        catalog_filename = os.path.join(self.path_prefix + 'py', settings.util__log_catalog__filename)
+        self.assertTrue(os.path.isabs(log_catalog._filename))
+        self.assertEqual(log_catalog._filename, catalog_filename)
+        entries = log_catalog.get_entries()
+        self.assertEqual(len(entries), 1)
+
+        with open(catalog_filename, 'w') as f:
+            f.write('[{"path"')
+        with contextlib.redirect_stderr(io.StringIO()):
+            log_catalog = util.LogCatalog('py', [self.path_prefix])
+        log_catalog.refresh()
+        self.assertEqual(log_catalog.get_entries(), entries)
+
+        os.remove(catalog_filename)
+        os.mkdir(catalog_filename)
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            log_catalog = util.LogCatalog('py', [self.path_prefix])
+            log_catalog.refresh()
+        self.assertIn('could not write', stderr.getvalue())
+        self.assertEqual(log_catalog.get_entries(), entries)
+        self.assertEqual(sorted(os.listdir(self.path_prefix + 'py')), ['.log_catalog.json', '1500000100'])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,121 @@
+import collections
+import functools
+import json
+import os
+import os.path
+import random
+import sys
+import time
+
+
+class Tracer:
+    def __init__(self, sample_rate=0.01, slow_threshold=None, output_dir=None, max_traces=100):
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.output_dir = output_dir
+        self.traces = collections.deque(maxlen=max_traces)
+
+        self._events = None
+        self._trace_count = 0
+        self._originals = []
+
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+    def install(self, server_module):
+        self._wrap_root(server_module.Client, 'on_message')
+        self._wrap(server_module.Server, 'add_pending_messages')
+        self._wrap(server_module.Server, 'flush_pending_messages')
+        self._wrap(server_module.Game, 'do_game_action')
+        self._wrap(server_module.TileRacks, 'determine_tile_game_board_types')
+        self._wrap(server_module.GameBoard, 'fill_cells')
+        for cls in [server_module.Action] + server_module.Action.__subclasses__():
+            for name in ['prepare', 'execute']:
+                if name in cls.__dict__:
+                    self._wrap(cls, name)
+
+    def uninstall(self):
+        for cls, name, original in reversed(self._originals):
+            setattr(cls, name, original)
+        del self._originals[:]
+
+    def _wrap(self, cls, name):
+        original = cls.__dict__[name]
+        span_name = cls.__name__ + '.' + name
+        perf_counter = time.perf_counter
+
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            events = self._events
+            if events is None:
+                return original(*args, **kwargs)
+
+            start = perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                events.append([span_name, start, perf_counter(), None])
+
+        self._originals.append((cls, name, original))
+        setattr(cls, name, wrapper)
+
+    def _wrap_root(self, cls, name):
+        original = cls.__dict__[name]
+        span_name = cls.__name__ + '.' + name
+        perf_counter = time.perf_counter
+
+        @functools.wraps(original)
+        def wrapper(client, payload):
+            if self._events is not None or random.random() >= self.sample_rate:
+                return original(client, payload)
+
+            self._events = events = []
+            start = perf_counter()
+            try:
+                return original(client, payload)
+            finally:
+                end = perf_counter()
+                self._events = None
+                args = collections.OrderedDict()
+                args['client-id'] = client.client_id
+                args['game-id'] = client.game_id
+                args['command'] = payload[:200].decode(errors='replace')
+                events.append([span_name, start, end, args])
+                self._add_trace(events, end - start)
+
+        self._originals.append((cls, name, original))
+        setattr(cls, name, wrapper)
+
+    def _add_trace(self, events, duration):
+        self._trace_count += 1
+        trace = [self._trace_count, events]
+        self.traces.append(trace)
+
+        if self.slow_threshold is not None and duration >= self.slow_threshold and self.output_dir:
+            # runs on the request path, so it must never raise
+            try:
+                self.export(os.path.join(self.output_dir, 'trace_%d_%d.json' % (time.time(), self._trace_count)), [trace])
+            except Exception as e:
+                print('tracing export failed:', e, file=sys.stderr, flush=True)
+
+    def get_chrome_trace_events(self, traces=None):
+        pid = os.getpid()
+        trace_events = []
+        for trace_number, events in (self.traces if traces is None else traces):
+            for name, start, end, args in events:
+                event = collections.OrderedDict()
+                event['name'] = name
+                event['cat'] = 'acquire'
+                event['ph'] = 'X'
+                event['ts'] = round(start * 1000000, 3)
+                event['dur'] = round((end - start) * 1000000, 3)
+                event['pid'] = pid
+                event['tid'] = trace_number
+                if args:
+                    event['args'] = args
+                trace_events.append(event)
+        return trace_events
+
+    def export(self, filename, traces=None):
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': self.get_chrome_trace_events(traces), 'displayTimeUnit': 'ms'}, f, separators=(',', ':'))
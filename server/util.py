@@ -1,44 +1,440 @@
+import bisect
 import gzip
 import os
 import os.path
 import re
 import settings
+import struct
+import sys
+import tempfile
+import time
+import ujson
+import zlib
 
-_log_type_to_log_file_filenames = {}
+_log_type_to_log_catalog = {}
 re_timestamp_in_path = re.compile(r'([^/]*?)(\.gz)?$')
+# anything else in a log directory, like indexes and temporary files, isn't a log file
+re_log_filename = re.compile(r'^\d+(\.gz)?$')
 
 
-def get_log_file_filenames(log_type, begin=None, end=None):
-    global _log_type_to_log_file_filenames
-
-    if log_type in _log_type_to_log_file_filenames:
-        timestamps_and_filenames = _log_type_to_log_file_filenames[log_type]
-    else:
-        filenames = []
-        for path_prefix in settings.util__get_log_file_filenames__path_prefixes:
-            path = path_prefix + log_type
-            for filename in os.listdir(path):
-                filenames.append(os.path.join(path, filename))
-
-        timestamps_and_filenames = [(int(re_timestamp_in_path.search(filename).group(1)), filename) for filename in filenames]
-
-        _log_type_to_log_file_filenames[log_type] = timestamps_and_filenames
+def get_log_catalog(log_type):
+    # refreshed at most every util__log_catalog__refresh_interval seconds, so lookups in a loop stay cheap
+    log_catalog = _log_type_to_log_catalog.get(log_type)
+    if not log_catalog:
+        log_catalog = LogCatalog(log_type)
+        _log_type_to_log_catalog[log_type] = log_catalog
+    if log_catalog.refresh_time is None or time.time() - log_catalog.refresh_time >= settings.util__log_catalog__refresh_interval:
+        log_catalog.refresh()
+    return log_catalog
 
-    if begin:
-        timestamps_and_filenames = filter(lambda x: x[0] >= begin, timestamps_and_filenames)
 
-    if end:
-        timestamps_and_filenames = filter(lambda x: x[0] <= end, timestamps_and_filenames)
-
-    return sorted(timestamps_and_filenames)
+def get_log_file_filenames(log_type, begin=None, end=None):
+    return [(entry['timestamp'], entry['path']) for entry in get_log_catalog(log_type).get_entries(begin, end)]
 
 
 re_gzip_filename = re.compile(r'.*\.gz$')
+game_log_index_suffix = '.games'
 
 
 def open_possibly_gzipped_file(filename):
     if re_gzip_filename.match(filename):
-        f = gzip.open(filename, 'rt')
+        if is_block_compressed_file(filename):
+            f = BlockCompressedFile(filename)
+        else:
+            f = gzip.open(filename, 'rt')
     else:
         f = open(filename)
     return f
+
+
+# block compressed files are BGZF: a concatenation of gzip members of at most 64 KiB each, with the size of each member
+# in its header. they are regular gzip files to other tools. the .gzi index next to one lists the compressed and
+# uncompressed offsets of its blocks after the first, in the format of bgzip.
+block_compressed_file_index_suffix = '.gzi'
+_block_header = struct.Struct('<4BI2BH2BHH')
+_block_header_prefix = b'\x1f\x8b\x08\x04'
+_block_max_data_size = 0xff00
+_block_eof = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+
+
+def is_block_compressed_file(filename):
+    with open(filename, 'rb') as f:
+        return _is_block_header(f.read(_block_header.size))
+
+
+def _is_block_header(header):
+    return len(header) == _block_header.size and header.startswith(_block_header_prefix) and header[12:14] == b'BC'
+
+
+def _make_block(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    compressed_data = compressor.compress(data) + compressor.flush()
+    block_size = _block_header.size + len(compressed_data) + 8
+    header = _block_header.pack(0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, ord('B'), ord('C'), 2, block_size - 1)
+    return header + compressed_data + struct.pack('<II', zlib.crc32(data), len(data))
+
+
+class BlockCompressedFileWriter:
+    # text is cut into blocks as it's written. flush writes out a partial block, so readers can follow a file that's
+    # still being written.
+    def __init__(self, filename, block_data_size=_block_max_data_size):
+        self._filename = filename
+        self._file = open(filename, 'wb')
+        # an index left from before would be followed by readers until close writes the new one
+        if os.path.exists(filename + block_compressed_file_index_suffix):
+            os.remove(filename + block_compressed_file_index_suffix)
+        self._block_data_size = block_data_size
+        self._buffer = bytearray()
+        self._compressed_offset = 0
+        self._uncompressed_offset = 0
+        self._index = []
+
+    def write(self, s):
+        self._buffer += s.encode()
+        while len(self._buffer) >= self._block_data_size:
+            # blocks end after a line, or else after a character, so a reader never sees part of a character
+            size = self._buffer.rfind(b'\n', 0, self._block_data_size) + 1
+            if not size:
+                size = self._block_data_size
+                while self._buffer[size] & 0xc0 == 0x80:
+                    size -= 1
+            self._write_block(bytes(self._buffer[:size]))
+            del self._buffer[:size]
+
+    def _write_block(self, data):
+        if self._compressed_offset:
+            self._index.append((self._compressed_offset, self._uncompressed_offset))
+        block = _make_block(data)
+        self._file.write(block)
+        self._compressed_offset += len(block)
+        self._uncompressed_offset += len(data)
+
+    def flush(self):
+        if self._buffer:
+            self._write_block(bytes(self._buffer))
+            del self._buffer[:]
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.write(_block_eof)
+        self._file.close()
+
+        with open(self._filename + block_compressed_file_index_suffix, 'wb') as f:
+            f.write(struct.pack('<Q', len(self._index)))
+            for offsets in self._index:
+                f.write(struct.pack('<QQ', *offsets))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class BlockCompressedFile:
+    # reads lines of text like a file opened with open(). tell and seek use uncompressed offsets like for gzip files,
+    # but seek only decompresses the block containing the offset. tell_virtual and seek_virtual use BGZF virtual
+    # offsets, the compressed offset of a block shifted left 16 bits plus the offset within it.
+    def __init__(self, filename):
+        self._file = open(filename, 'rb')
+        self._compressed_offsets = [0]
+        self._uncompressed_offsets = [0]
+        self._scanned_compressed_offset = 0
+
+        index_filename = filename + block_compressed_file_index_suffix
+        if os.path.exists(index_filename):
+            with open(index_filename, 'rb') as f:
+                index = f.read()
+            try:
+                count = struct.unpack_from('<Q', index)[0]
+                offsets = struct.unpack_from('<%dQ' % (count * 2), index, 8)
+            except struct.error:
+                offsets = ()
+            compressed_offsets = [0] + list(offsets[0::2])
+            uncompressed_offsets = [0] + list(offsets[1::2])
+            if self._is_index_valid(compressed_offsets, uncompressed_offsets):
+                self._compressed_offsets = compressed_offsets
+                self._uncompressed_offsets = uncompressed_offsets
+                self._scanned_compressed_offset = compressed_offsets[-1]
+
+        self._scan_blocks()
+
+        self._block_number = -1
+        self._data = b''
+        self._position = 0
+
+    def _is_index_valid(self, compressed_offsets, uncompressed_offsets):
+        # an index written for other contents of the file is ignored. reading every block header would cost as much as
+        # scanning, so only the last indexed block is checked to be a whole block inside the file.
+        f = self._file
+        file_size = os.fstat(f.fileno()).st_size
+        if any(offset >= next_offset for offset, next_offset in zip(compressed_offsets, compressed_offsets[1:])):
+            return False
+        if any(offset > next_offset for offset, next_offset in zip(uncompressed_offsets, uncompressed_offsets[1:])):
+            return False
+        f.seek(compressed_offsets[-1])
+        header = f.read(_block_header.size)
+        if not _is_block_header(header):
+            return False
+        return compressed_offsets[-1] + _block_header.unpack(header)[-1] + 1 <= file_size
+
+    def _scan_blocks(self):
+        # adds blocks after the last known one. a block that's still being written is left for later.
+        f = self._file
+        compressed_offset = self._scanned_compressed_offset
+        uncompressed_offset = self._uncompressed_offsets[-1]
+        file_size = os.fstat(f.fileno()).st_size
+
+        while compressed_offset + _block_header.size <= file_size:
+            f.seek(compressed_offset)
+            header = f.read(_block_header.size)
+            if not _is_block_header(header):
+                break
+            block_size = _block_header.unpack(header)[-1] + 1
+            if compressed_offset + block_size > file_size:
+                break
+            f.seek(compressed_offset + block_size - 4)
+            data_size = struct.unpack('<I', f.read(4))[0]
+
+            if compressed_offset != self._compressed_offsets[-1]:
+                self._compressed_offsets.append(compressed_offset)
+                self._uncompressed_offsets.append(uncompressed_offset)
+            compressed_offset += block_size
+            uncompressed_offset += data_size
+            self._scanned_compressed_offset = compressed_offset
+
+        self._end_compressed_offset = compressed_offset
+        self._end_uncompressed_offset = uncompressed_offset
+
+    def _load_block(self, block_number):
+        # returns False past the last block, leaving the current one loaded
+        if block_number + 1 >= len(self._compressed_offsets):
+            self._scan_blocks()
+        if block_number >= len(self._compressed_offsets):
+            return False
+        compressed_offset = self._compressed_offsets[block_number]
+        end_compressed_offset = self._compressed_offsets[block_number + 1] if block_number + 1 < len(self._compressed_offsets) else self._end_compressed_offset
+        if end_compressed_offset <= compressed_offset and block_number > 0:
+            return False
+        self._file.seek(compressed_offset)
+        block = self._file.read(end_compressed_offset - compressed_offset)
+        self._data = zlib.decompress(block[_block_header.size:-8], -15) if block else b''
+        self._block_number = block_number
+        self._position = 0
+        return True
+
+    def readline(self):
+        parts = []
+        while True:
+            while self._position >= len(self._data):
+                if not self._load_block(self._block_number + 1):
+                    break
+            if self._position >= len(self._data):
+                break
+            end = self._data.find(b'\n', self._position)
+            if end >= 0:
+                parts.append(self._data[self._position:end + 1])
+                self._position = end + 1
+                break
+            parts.append(self._data[self._position:])
+            self._position = len(self._data)
+        return b''.join(parts).decode()
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+            # the whole lines left in the block are decoded at once
+            data = self._data
+            position = self._position
+            end = data.rfind(b'\n', position) + 1
+            if end:
+                chunk = data[position:end]
+                text = chunk.decode()
+                is_ascii = len(text) == len(chunk)
+                for line in text[:-1].split('\n'):
+                    position += len(line) + 1 if is_ascii else len(line.encode()) + 1
+                    self._position = position
+                    yield line + '\n'
+                    if self._data is not data or self._position != position:
+                        break
+
+    def tell(self):
+        if self._block_number < 0:
+            return 0
+        return self._uncompressed_offsets[self._block_number] + self._position
+
+    def seek(self, offset):
+        block_number = max(bisect.bisect_right(self._uncompressed_offsets, offset) - 1, 0)
+        self._load_block(block_number)
+        self._position = offset - self._uncompressed_offsets[block_number]
+
+    def tell_virtual(self):
+        if self._block_number < 0:
+            return 0
+        return self._compressed_offsets[self._block_number] << 16 | self._position
+
+    def seek_virtual(self, virtual_offset):
+        compressed_offset = virtual_offset >> 16
+        position = virtual_offset & 0xffff
+        if compressed_offset > self._compressed_offsets[-1]:
+            self._scan_blocks()
+        block_number = bisect.bisect_left(self._compressed_offsets, compressed_offset)
+        if block_number == len(self._compressed_offsets) or self._compressed_offsets[block_number] != compressed_offset:
+            raise ValueError('no block starts at compressed offset %d' % compressed_offset)
+        self._load_block(block_number)
+        if position > len(self._data):
+            raise ValueError('offset %d is past the end of the block at compressed offset %d' % (position, compressed_offset))
+        self._position = position
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class LogCatalog:
+    # what's known about each log file of a log type, kept in a file between runs. refresh only looks at the files
+    # whose size or mtime changed, and only at the added part of one that grew. the file is in the first log directory,
+    # so every process using the same logs shares it.
+    _re_game_id = re.compile(r'^{.*?"game-id":(\d+)')
+
+    def __init__(self, log_type, path_prefixes=None, filename=None):
+        self._log_type = log_type
+        self._path_prefixes = settings.util__get_log_file_filenames__path_prefixes if path_prefixes is None else path_prefixes
+        if filename is None:
+            filename = os.path.abspath(os.path.join(self._path_prefixes[0] + log_type, settings.util__log_catalog__filename))
+        self._filename = filename
+
+        # a catalog that can't be read is made again
+        self._path_to_entry = {}
+        if os.path.exists(filename):
+            try:
+                with open(filename, 'r') as f:
+                    self._path_to_entry = {entry['path']: entry for entry in ujson.load(f)}
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print('LogCatalog: could not read', filename, e, file=sys.stderr, flush=True)
+
+        self._timestamps_and_paths = sorted((entry['timestamp'], path) for path, entry in self._path_to_entry.items())
+        self.refresh_time = None
+
+    def refresh(self):
+        self.refresh_time = time.time()
+        path_to_stat = {}
+        for path_prefix in self._path_prefixes:
+            directory = path_prefix + self._log_type
+            for filename in os.listdir(directory):
+                if re_log_filename.match(filename):
+                    path = os.path.join(directory, filename)
+                    path_to_stat[path] = os.stat(path)
+
+        changed = False
+
+        for path in list(self._path_to_entry.keys()):
+            if path not in path_to_stat:
+                del self._path_to_entry[path]
+                changed = True
+
+        for path, stat in path_to_stat.items():
+            entry = self._path_to_entry.get(path)
+            if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+                continue
+
+            # a .gz file can be empty before its first block is written, so the compression is checked again
+            if re_gzip_filename.match(path):
+                compression = 'block' if is_block_compressed_file(path) else 'gzip'
+            else:
+                compression = None
+
+            if not entry or stat.st_size < entry['size'] or compression != entry['compression']:
+                entry = {
+                    'timestamp': int(re_timestamp_in_path.search(path).group(1)),
+                    'path': path,
+                    'compression': compression,
+                    'size': 0,
+                    'mtime': 0,
+                    'lines': 0,
+                    'first_game_id': None,
+                    'last_game_id': None,
+                    'offset': 0,
+                }
+                self._path_to_entry[path] = entry
+
+            entry['size'] = stat.st_size
+            entry['mtime'] = stat.st_mtime_ns
+            self._scan(entry)
+            changed = True
+
+        if changed:
+            self._timestamps_and_paths = sorted((entry['timestamp'], path) for path, entry in self._path_to_entry.items())
+            self._save()
+
+    def _save(self):
+        # written under a name of its own, so processes refreshing at the same time each replace the file whole. the
+        # logs can be on a read-only mirror, and then the catalog is only kept in memory.
+        directory, basename = os.path.split(self._filename)
+        temp_filename = None
+        try:
+            with tempfile.NamedTemporaryFile('w', dir=directory, prefix='.' + basename + '.', suffix='.tmp', delete=False) as f:
+                temp_filename = f.name
+                ujson.dump(sorted(self._path_to_entry.values(), key=lambda entry: entry['path']), f)
+            os.replace(temp_filename, self._filename)
+        except OSError as e:
+            if temp_filename and os.path.exists(temp_filename):
+                os.remove(temp_filename)
+            print('LogCatalog: could not write', self._filename, e, file=sys.stderr, flush=True)
+
+    def _scan(self, entry):
+        # picks up after the last whole line scanned before
+        offset = entry['offset']
+        lines = entry['lines']
+        first_game_id = entry['first_game_id']
+        last_game_id = entry['last_game_id']
+        re_game_id = self._re_game_id
+
+        with open_possibly_gzipped_file(entry['path']) as f:
+            if offset:
+                f.seek(offset)
+            for line in f:
+                if line[-1] != '\n':
+                    break
+                offset += len(line) if line.isascii() else len(line.encode())
+                lines += 1
+                if line[0] == '{':
+                    match = re_game_id.match(line)
+                    if match:
+                        game_id = int(match.group(1))
+                        if first_game_id is None or game_id < first_game_id:
+                            first_game_id = game_id
+                        if last_game_id is None or game_id > last_game_id:
+                            last_game_id = game_id
+
+        entry['offset'] = offset
+        entry['lines'] = lines
+        entry['first_game_id'] = first_game_id
+        entry['last_game_id'] = last_game_id
+
+    def get_entries(self, begin=None, end=None):
+        timestamps_and_paths = self._timestamps_and_paths
+        begin_index = bisect.bisect_left(timestamps_and_paths, (begin,)) if begin else 0
+        end_index = bisect.bisect_right(timestamps_and_paths, (end, chr(0x10ffff))) if end else len(timestamps_and_paths)
+        return [self._path_to_entry[path] for timestamp, path in timestamps_and_paths[begin_index:end_index]]
+
+
+def get_zobrist_key(*values):
+    # splitmix64 over the values, so keys are the same on every machine and python version
+    key = 0
+    for value in values:
+        key = ((key ^ value) + 0x9e3779b97f4a7c15) & 0xffffffffffffffff
+        key = ((key ^ (key >> 30)) * 0xbf58476d1ce4e5b9) & 0xffffffffffffffff
+        key = ((key ^ (key >> 27)) * 0x94d049bb133111eb) & 0xffffffffffffffff
+        key ^= key >> 31
+    return key